@@ -8,22 +8,31 @@
 # =============================================================================
 
 import ast
+import re
 
 from ax.api.configs import ChoiceParameterConfig, RangeParameterConfig
 from ax.service.ax_client import ObjectiveProperties
 
-def ConvertParamConfig(config):
+def ConvertParamConfig(config, stages = None):
     """ConvertParamConfig
 
     Helper method to convert a dictionary of
     AID2E parameter options into a list of
     Ax-compliant definitions.
 
+    If a list of stages is provided, only the
+    parameters of those stages are converted
+    (e.g. only the "sim" parameters when the
+    "rec" ones are optimized separately), along
+    with only the constraints which involve no
+    other parameters.
+
     This is relevant for when interacting with
     the ax.service.ax_client.AxClient API.
 
     Args:
       config: dictionary to convert
+      stages: optional list of stages whose parameters to convert
     Returns:
       a tuple containing:
         a list of ax-compliant parameter definitions
@@ -34,6 +43,16 @@ def ConvertParamConfig(config):
     inPars = config["parameters"]
     inCons = config["constraints"]
 
+    # if needed, keep only parameters (and
+    # constraints on them) of given stages
+    if stages is not None:
+        dropped = [key for key, val in inPars.items() if val["stage"] not in stages]
+        inPars  = {key : val for key, val in inPars.items() if key not in dropped}
+        inCons  = [
+            con for con in (inCons or list())
+            if not any(re.search(r"\b" + re.escape(key) + r"\b", con) for key in dropped)
+        ]
+
     # iterate through parameters
     outPars = list()
     for inParKey, inParVal in inPars.items():
@@ -79,6 +98,42 @@ def ConvertParamConfig(config):
     # return list of parameters
     return (outPars, outCons)
 
+def ConvertFidelityConfig(config):
+    """ConvertFidelityConfig
+
+    Helper method to convert the fidelity options
+    of a problem config into an Ax-compliant
+    fidelity parameter, where the fidelity is the
+    no. of events to simulate.
+
+    This is relevant for when interacting with
+    the ax.service.ax_client.AxClient API.
+
+    Args:
+      config: dictionary to convert
+    Returns:
+      an ax-compliant parameter definition, or None
+      if not running multi-fidelity
+    """
+
+    # extract fidelity options
+    inFid = config.get("fidelity", dict())
+    if not inFid.get("enabled", False):
+        return None
+
+    # create output ax parameter, where the
+    # target is the full no. of events
+    outFid = dict()
+    outFid["name"]         = inFid["name"]
+    outFid["type"]         = "range"
+    outFid["value_type"]   = "int"
+    outFid["bounds"]       = [inFid["lower"], inFid["upper"]]
+    outFid["is_fidelity"]  = True
+    outFid["target_value"] = inFid["upper"]
+
+    # return fidelity parameter
+    return outFid
+
 def CreateParamList(config):
     """CreateParamList
 
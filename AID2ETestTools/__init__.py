@@ -10,5 +10,6 @@ __version__="0.0.0"
 from .AxHelper import *
 
 __all__ = [
+    "ConvertFidelityConfig",
     "ConvertParamConfig"
 ]
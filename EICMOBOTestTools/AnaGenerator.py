@@ -28,8 +28,9 @@ class AnaGenerator:
           run: runtime configuration file
           ana: objectives configuration file
         """
-        self.cfgRun = ConfigParser.ReadJsonFile(run)
-        self.cfgAna = ConfigParser.ReadJsonFile(ana)
+        self.cfgRun  = ConfigParser.ReadJsonFile(run)
+        self.cfgAna  = ConfigParser.ReadJsonFile(ana)
+        self.pathAna = os.path.realpath(ana)
 
     def GetDummyValue(self, objective):
         """GetDummyObjective
@@ -124,6 +125,202 @@ class AnaGenerator:
         command = command.replace("<RECO>", recfile)
         return command, outPath
 
+    def UsesDriver(self, analysis):
+        """UsesDriver
+
+        Checks if an analysis should be run through
+        the analysis driver (i.e. it names a registered
+        analysis and a driver is configured) rather than
+        via its own rule.
+
+        Args:
+          analysis: the tag associated with the analysis
+        Returns:
+          whether or not analysis is run by the driver
+        """
+        hasDriver   = "driver" in self.cfgAna
+        hasAnalysis = "analysis" in self.cfgAna["objectives"][analysis]
+        return hasDriver and hasAnalysis
+
+    def RunsInProcess(self):
+        """RunsInProcess
+
+        Checks if the driver is configured to
+        run analyses in the calling process
+        rather than in the trial script.
+
+        Returns:
+          whether or not driven analyses run in-process
+        """
+        if "driver" not in self.cfgAna:
+            return False
+        return self.cfgAna["driver"].get("in_process", False)
+
+    def UsesMapReduce(self):
+        """UsesMapReduce
+
+        Checks if the driver is configured to map
+        each shard of input to partial results and
+        reduce those, rather than run over merged
+        input.
+
+        Returns:
+          whether or not driven analyses are run map-reduce style
+        """
+        if "driver" not in self.cfgAna:
+            return False
+        return self.cfgAna["driver"].get("map_reduce", False)
+
+    def MakeDriverCommand(self, tag, label, analyses, simfile, recfile):
+        """MakeDriverCommand
+
+        Generates command to run several analyses in
+        a single pass over the provided input via the
+        analysis driver.
+
+        Args:
+          tag:      the tag associated with the current trial
+          label:    the label associated with the input
+          analyses: list of tags associated with the analyses being run
+          simfile:  the path to the sim-level input
+          recfile:  the path to the rec-level input
+        Returns:
+          tuple of the command to be run and a dictionary of
+          output files associated with each analysis
+        """
+
+        # make sure output directory
+        # exists for trial
+        outDir = self.cfgRun["out_path"] + "/" + tag
+        FileManager.MakeDir(outDir)
+
+        # construct output names and arguments
+        # for each analysis
+        outPaths = dict()
+        outArgs  = list()
+        for analysis in analyses:
+            outFile = FileManager.MakeOutName("ana", tag, label, "", analysis)
+            outPaths[analysis] = outDir + "/" + outFile
+            outArgs.append("-a " + analysis + "=" + outPaths[analysis])
+
+        # construct executable path
+        exeName = self.cfgAna["driver"]["exec"]
+        exeDir  = self.cfgAna["driver"]["path"]
+        exePath = exeDir + "/" + exeName
+
+        # construct and return command
+        command = self.cfgAna["driver"]["rule"]
+        command = command.replace("<EXEC>", exePath)
+        command = command.replace("<CONFIG>", self.pathAna)
+        command = command.replace("<OUTPUTS>", " ".join(outArgs))
+        command = command.replace("<SIM>", simfile)
+        command = command.replace("<RECO>", recfile)
+        return command, outPaths
+
+    def MakeMapCommand(self, tag, label, analyses, steer, shard = None):
+        """MakeMapCommand
+
+        Generates command to map the sim and rec
+        output of a steering file (or one of its
+        shards) to partial results of several
+        analyses via the analysis driver.
+
+        Args:
+          tag:      the tag associated with the current trial
+          label:    the label associated with the input
+          analyses: list of tags associated with the analyses being run
+          steer:    the input steering file
+          shard:    optional index of the shard to map
+        Returns:
+          tuple of the command to be run and a dictionary of
+          partial files associated with each analysis
+        """
+
+        # make sure output directory
+        # exists for trial
+        outDir = self.cfgRun["out_path"] + "/" + tag
+        FileManager.MakeDir(outDir)
+
+        # construct paths to input
+        steeTag = FileManager.ConvertSteeringToTag(steer)
+        shaTag  = FileManager.MakeShardTag(steeTag, shard)
+        simPath = outDir + "/" + FileManager.MakeOutName("sim", tag, label, shaTag)
+        recPath = outDir + "/" + FileManager.MakeOutName("rec", tag, label, shaTag)
+
+        # construct partial names and arguments
+        # for each analysis
+        partPaths = dict()
+        partArgs  = list()
+        for analysis in analyses:
+            partFile = FileManager.MakeOutName("part", tag, label, shaTag, analysis)
+            partPaths[analysis] = outDir + "/" + partFile
+            partArgs.append("-a " + analysis + "=" + partPaths[analysis])
+
+        # construct executable path
+        exeName = self.cfgAna["driver"]["exec"]
+        exeDir  = self.cfgAna["driver"]["path"]
+        exePath = exeDir + "/" + exeName
+
+        # construct and return command
+        command = self.cfgAna["driver"]["rule"]
+        command = command.replace("<EXEC>", exePath)
+        command = command.replace("<CONFIG>", self.pathAna)
+        command = command.replace("<OUTPUTS>", " ".join(partArgs))
+        command = command.replace("<SIM>", simPath)
+        command = command.replace("<RECO>", recPath)
+        return command + " -m", partPaths
+
+    def MakeReduceCommand(self, tag, label, analyses):
+        """MakeReduceCommand
+
+        Generates command to reduce the partial
+        results of several analyses for an input
+        to their final values via the analysis
+        driver.
+
+        Args:
+          tag:      the tag associated with the current trial
+          label:    the label associated with the input
+          analyses: list of tags associated with the analyses being run
+        Returns:
+          tuple of the command to be run, a dictionary of output
+          files associated with each analysis, and a dictionary
+          of glob patterns matching the partial files of each
+          analysis
+        """
+
+        # make sure output directory
+        # exists for trial
+        outDir = self.cfgRun["out_path"] + "/" + tag
+        FileManager.MakeDir(outDir)
+
+        # construct output names, partial patterns,
+        # and arguments for each analysis
+        outPaths  = dict()
+        partGlobs = dict()
+        outArgs   = list()
+        partArgs  = list()
+        for analysis in analyses:
+            outFile  = FileManager.MakeOutName("ana", tag, label, "", analysis)
+            partFile = FileManager.MakeOutName("part", tag, label, "*", analysis)
+            outPaths[analysis]  = outDir + "/" + outFile
+            partGlobs[analysis] = outDir + "/" + partFile
+            outArgs.append("-a " + analysis + "=" + outPaths[analysis])
+            partArgs.append("-p '" + analysis + "=" + partGlobs[analysis] + "'")
+
+        # construct executable path
+        exeName = self.cfgAna["driver"]["exec"]
+        exeDir  = self.cfgAna["driver"]["path"]
+        exePath = exeDir + "/" + exeName
+
+        # construct and return command
+        command = self.cfgAna["driver"]["reduce_rule"]
+        command = command.replace("<EXEC>", exePath)
+        command = command.replace("<CONFIG>", self.pathAna)
+        command = command.replace("<OUTPUTS>", " ".join(outArgs))
+        command = command.replace("<PARTIALS>", " ".join(partArgs))
+        return command, outPaths, partGlobs
+
     def MakeScript(self, tag, label, analysis, command):
         """MakeScript
 
@@ -0,0 +1,134 @@
+# =============================================================================
+## @file   CorePool.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Class to share the cores of a host between
+#    the stages of every trial running on it.
+# =============================================================================
+
+import fcntl
+import os
+import tempfile
+import time
+
+from EICMOBOTestTools import ConfigParser
+from EICMOBOTestTools import FileManager
+
+class CorePool:
+    """CorePool
+
+    A class to hand out the cores of a host to stages,
+    so that trials running side by side (e.g. in
+    separate joblib workers) don't oversubscribe it.
+    Each core is a lock file, so cores are shared
+    across processes and released even if a process
+    dies. A stage takes all the cores it needs at
+    once or none of them, so stages never deadlock.
+    """
+
+    def __init__(self, run):
+        """constructor accepting arguments
+
+        By default, the pool has the cores this process
+        may run on, with each lock file named after its
+        core, so that jobs sharing a host with disjoint
+        sets of cores (e.g. Slurm jobs) don't wait on
+        each other. If "host_cores" is set in the run
+        config, the pool has that many cores instead,
+        and if it's 0, cores aren't shared at all. Lock
+        files are placed in "core_pool" if it's set,
+        and otherwise in a temporary directory local to
+        the host.
+
+        Args:
+          run: runtime configuration file
+        """
+        self.cfgRun  = ConfigParser.ReadJsonFile(run)
+        self.cores   = sorted(os.sched_getaffinity(0))
+        if "host_cores" in self.cfgRun:
+            self.cores = list(range(self.cfgRun["host_cores"]))
+        self.nCores  = len(self.cores)
+        self.poolDir = self.cfgRun.get(
+            "core_pool",
+            tempfile.gettempdir() + "/aid2e_core_pool"
+        )
+
+    def IsEnabled(self):
+        """IsEnabled
+
+        Checks if stages take their cores
+        from the pool.
+
+        Returns:
+          whether or not cores are shared
+        """
+        return self.nCores > 0
+
+    def Acquire(self, cores, wait = 1.0):
+        """Acquire
+
+        Takes a no. of cores from the pool, waiting
+        until that many are free.
+
+        Args:
+          cores: no. of cores to take (capped at the size of the pool)
+          wait:  no. of seconds to wait between tries
+        Returns:
+          list of the lock files held
+        """
+        FileManager.MakeDir(self.poolDir)
+        cores = max(1, min(cores, self.nCores))
+        while True:
+            held = list()
+            for core in self.cores:
+                lock = open(self.poolDir + "/core" + str(core) + ".lock", 'a')
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock.close()
+                    continue
+                held.append(lock)
+                if len(held) == cores:
+                    return held
+
+            # give back partial set of cores
+            # before trying again
+            self.Release(held)
+            time.sleep(wait)
+
+    def Release(self, held):
+        """Release
+
+        Returns cores to the pool.
+
+        Args:
+          held: list of the lock files held (see Acquire)
+        """
+        for lock in held:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    def Run(self, cores, stage):
+        """Run
+
+        Runs a stage once the cores it needs
+        are free, holding them while it runs
+        (or right away if cores aren't shared).
+
+        Args:
+          cores: no. of cores the stage uses
+          stage: callable running the stage
+        Returns:
+          whatever the stage returns
+        """
+        if not self.IsEnabled():
+            return stage()
+
+        held = self.Acquire(cores)
+        try:
+            return stage()
+        finally:
+            self.Release(held)
+
+# end =========================================================================
@@ -0,0 +1,211 @@
+# =============================================================================
+## @file   EarlyStopper.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Class to decide when a trial can stop early
+#    based on the intermediate values of its objectives.
+# =============================================================================
+
+import datetime
+import json
+
+from EICMOBOTestTools import ConfigParser
+from EICMOBOTestTools import FileManager
+
+class EarlyStopper:
+    """EarlyStopper
+
+    A class to decide whether a trial can stop early
+    from the intermediate values of its objectives
+    (e.g. after each shard is analyzed): either once
+    the statistical error on every objective is below
+    its "target_error", or once even optimistic values
+    of the objectives are dominated by the Pareto front
+    of earlier trials. Intermediate values are recorded
+    alongside the trial's output.
+
+    Stopping is configured by the "early_stopping"
+    block of the objectives config.
+    """
+
+    def __init__(self, run, ana):
+        """constructor accepting arguments
+
+        Args:
+          run: runtime configuration file
+          ana: objectives configuration file
+        """
+        self.cfgRun  = ConfigParser.ReadJsonFile(run)
+        self.cfgAna  = ConfigParser.ReadJsonFile(ana)
+        self.cfgStop = self.cfgAna.get("early_stopping", dict())
+        self.front   = list()
+
+    def __GetObjectives(self):
+        """GetObjectives
+
+        Lists the objectives which are
+        extracted from analyses.
+
+        Returns:
+          list of objectives
+        """
+        return [
+            anaKey for anaKey, anaCfg in self.cfgAna["objectives"].items()
+            if anaCfg["stage"] == "ana"
+        ]
+
+    def __GetSign(self, objective):
+        """GetSign
+
+        Gets the sign which turns an objective
+        into one to be minimized.
+
+        Args:
+          objective: the objective
+        Returns:
+          +1 if objective is minimized, -1 if maximized
+        """
+        goal = self.cfgAna["objectives"][objective].get("goal", "minimize")
+        return -1.0 if goal == "maximize" else 1.0
+
+    def __Dominates(self, point, other):
+        """Dominates
+
+        Checks if one point (of objectives to be
+        minimized) dominates another.
+
+        Args:
+          point: list of objective values
+          other: list of objective values to compare against
+        Returns:
+          whether or not point dominates other
+        """
+        pairs = list(zip(point, other))
+        return all(p <= o for p, o in pairs) and any(p < o for p, o in pairs)
+
+    def __MakeFront(self, trials):
+        """MakeFront
+
+        Finds the Pareto front (the points no other
+        point dominates) of a set of trials.
+
+        Args:
+          trials: list of dictionaries of objectives and their values
+        Returns:
+          list of points on the front, as lists of objective
+          values to be minimized
+        """
+        objectives = self.__GetObjectives()
+        points     = list()
+        for trial in trials:
+            if all(isinstance(trial.get(obj), (int, float)) for obj in objectives):
+                points.append([self.__GetSign(obj) * trial[obj] for obj in objectives])
+        return [
+            point for point in points
+            if not any(self.__Dominates(other, point) for other in points)
+        ]
+
+    def SetFront(self, trials):
+        """SetFront
+
+        Sets the Pareto front trials are compared
+        against from a set of earlier trials (e.g.
+        the compatible trials in the trial store).
+        Nothing is set if comparing against the
+        front is turned off ("pareto").
+
+        Args:
+          trials: list of dictionaries of objectives and their values
+        """
+        if self.cfgStop.get("pareto", True):
+            self.front = self.__MakeFront(trials)
+
+    def IsEnabled(self):
+        """IsEnabled
+
+        Checks if trials may stop early.
+
+        Returns:
+          whether or not early stopping is enabled
+        """
+        return self.cfgStop.get("enabled", False)
+
+    def Check(self, results, nDone):
+        """Check
+
+        Decides whether a trial can stop early given
+        the intermediate results of its objectives.
+        Nothing is decided before "min_shards" shards
+        have been analyzed. When comparing against the
+        Pareto front, each objective is given the benefit
+        of the doubt by moving it "n_sigma" errors in
+        its favor.
+
+        Args:
+          results: dictionary of objectives and their results (with "value", "error")
+          nDone:   no. of shards the results are from
+        Returns:
+          reason to stop ("precise" or "dominated"), or
+          None if trial should continue
+        """
+        objectives = self.__GetObjectives()
+        if not self.IsEnabled() or nDone < self.cfgStop.get("min_shards", 1):
+            return None
+        if any(obj not in results for obj in objectives):
+            return None
+
+        # stop if every objective is known precisely enough
+        targets = {
+            obj : self.cfgAna["objectives"][obj]["target_error"]
+            for obj in objectives
+            if "target_error" in self.cfgAna["objectives"][obj]
+        }
+        if len(targets) == len(objectives):
+            if all(abs(results[obj]["error"]) <= targets[obj] for obj in objectives):
+                return "precise"
+
+        # or if trial can't reach the front even
+        # if all objectives turn out better
+        nSigma = self.cfgStop.get("n_sigma", 2.0)
+        best   = [
+            self.__GetSign(obj) * results[obj]["value"] - nSigma * abs(results[obj].get("error", 0.0))
+            for obj in objectives
+        ]
+        if any(self.__Dominates(point, best) for point in self.front):
+            return "dominated"
+        return None
+
+    def Report(self, tag, results, nDone, reason = None):
+        """Report
+
+        Appends the intermediate results of a trial
+        to its progress file, one JSON record per
+        line.
+
+        Args:
+          tag:     the tag associated with the trial
+          results: dictionary of objectives and their results
+          nDone:   no. of shards the results are from
+          reason:  reason the trial is stopping, if it is
+        Returns:
+          path to the progress file
+        """
+        outDir = self.cfgRun["out_path"] + "/" + tag
+        FileManager.MakeDir(outDir)
+
+        progPath = outDir + "/" + FileManager.MakeOutName("prog", tag)
+        record   = {
+            "time"       : datetime.datetime.now().isoformat(),
+            "shards"     : nDone,
+            "objectives" : {
+                obj : {"value" : result["value"], "error" : result.get("error")}
+                for obj, result in results.items()
+            },
+            "stop"       : reason
+        }
+        with open(progPath, 'a') as prog:
+            prog.write(json.dumps(record) + "\n")
+        return progPath
+
+# end =========================================================================
@@ -55,6 +55,20 @@ def ConvertSteeringToTag(steer):
     tag = tag.replace(".", "_")
     return tag 
 
+def MakeShardTag(steer, shard = None):
+    """MakeShardTag
+
+    Appends the index of a shard to the
+    tag of a steering file.
+
+    Args:
+      steer: the tag associated with the input steering file
+      shard: optional index of the shard
+    Returns:
+      tag of the shard
+    """
+    return steer if shard is None else steer + "_shard" + str(shard)
+
 def GetBody(stage, label = "", steer = ""):
     """GetBody
 
@@ -94,19 +108,25 @@ def GetSuffix(stage, analysis = ""):
         suffix = ".edm4eic.root"
     elif stage == "ana":
         suffix = "_" + analysis + ".root"
+    elif stage == "part":
+        suffix = "_" + analysis + ".npz"
+    elif stage == "prog":
+        suffix = ".progress.jsonl"
+    elif stage == "time":
+        suffix = ".timing.json"
     return suffix
 
 def MakeDir(path):
     """MakeDir
 
     Creates a directory if it
-    doesn't exist.
+    doesn't exist. Safe to call from
+    several trials at once.
 
     Args:
       path: the path to the new directory
     """
-    if not os.path.exists(path):
-        os.makedirs(path)
+    os.makedirs(path, exist_ok = True)
 
 def MakeOutName(stage, tag, label = "", steer = "", analysis = "", prefix = ""):
     """MakeOutName
@@ -149,7 +169,30 @@ def MakeScriptName(tag, label = "", steer = "", stage = "", analysis = ""):
     body = GetBody(label, steer, stage)
     return "do_aid2e_" + tag + body + ".sh"
 
-def MakeDetSetCommands(setup, config):
+def MakeParallelCommand(commands):
+    """MakeParallelCommand
+
+    Combines several commands into one block
+    which runs them all concurrently in the
+    background and waits for all of them. If
+    any fail, the rest are killed and the
+    block fails.
+
+    Args:
+      commands: list of commands to run concurrently
+    Returns:
+      block of commands to be run
+    """
+    block = "pids=()\n"
+    for command in commands:
+        block += "( " + command + " ) &\n"
+        block += "pids+=($!)\n"
+    block += 'for pid in "${pids[@]}"; do\n'
+    block += '  wait $pid || { kill "${pids[@]}" 2>/dev/null; exit 1; }\n'
+    block += "done"
+    return block
+
+def MakeDetSetCommands(setup, config, path = None):
     """MakeDetSetCommands
 
     Creates commands to set relevant
@@ -158,10 +201,13 @@ def MakeDetSetCommands(setup, config):
     Args:
       setup:  path to geometry installation script
       config: name of new detector config
+      path:   optional detector path to use instead of the installation's
     Returns:
       tuple of commands to set new detector path and config
     """
     setInsall = "source " + setup
+    if path is not None:
+        setInsall = setInsall + "\nexport DETECTOR_PATH=" + path
     setConfig = "export DETECTOR_CONFIG=" + config
     return setInsall, setConfig
 
@@ -6,16 +6,31 @@
 # -----------------------------------------------------------------------------
 ## @brief Class to generate and edit modified compact
 #    files for a trial.
+#
+#  Each trial gets its own overlay of the detector
+#  installation, where unchanged files and directories
+#  are symlinks to the installation and only edited
+#  files are real files. Pointing DETECTOR_PATH at the
+#  overlay then picks up the edits.
 # =============================================================================
 
+import copy
+import hashlib
+import json
 import os
 import pathlib
 import re
 import shutil
 import sys
+import threading
 import xml.etree.ElementTree as ET
 
 from EICMOBOTestTools import ConfigParser
+from EICMOBOTestTools import FileManager
+
+# pattern matching references to other xml
+# files (e.g. <include ref="..."/>)
+IncludePattern = re.compile(r'\b(?:ref|file|url)\s*=\s*"([^"]+\.xml)"')
 
 class GeometryEditor:
     """GeometryEditor
@@ -25,6 +40,19 @@ class GeometryEditor:
     for a trial.
     """
 
+    # parsed compact files, shared across editors
+    # (and so trials) so each is only parsed once
+    # per process, along with their modification
+    # times
+    BaseTrees = dict()
+    BaseLock  = threading.Lock()
+
+    # include indices of each detector installation
+    # (along with their inverse, and the trials which
+    # checked them), shared across editors
+    IncludeIndex = dict()
+    IndexLock    = threading.Lock()
+
     def __init__(self, run):
         """constructor accepting arguments
 
@@ -33,125 +61,103 @@ class GeometryEditor:
         """
         self.cfgRun = ConfigParser.ReadJsonFile(run)
 
-    def __GetNewXMLName(self, name, tag):
-        """GetNewXMLName
+    def GetOverlayPath(self, tag):
+        """GetOverlayPath
 
-        Helper method to add tag to provided
-        filename of xml.
+        Returns the path to the overlay of the
+        detector installation for a trial. The
+        overlay is placed under "overlay_path"
+        if it's set in the run config, and
+        otherwise in the trial's run directory.
 
         Args:
-          name: name of the xml file to tag
-          tag:  the tag to append
+          tag: the tag associated with the current trial
         Returns:
-          filename with tag appended
+          path to the overlay
         """
-        newSuffix = "_aid2e_" + tag + ".xml"
-        newName   = name.replace(".xml", newSuffix)
-        return newName
+        base = self.cfgRun.get("overlay_path", self.cfgRun["run_path"])
+        return base + "/" + tag + "/geometry"
 
-    def __GetCompact(self, param, tag):
-        """GetCompact
+    def GetTrialPath(self, tag):
+        """GetTrialPath
 
-        Checks if the compact file associated with a parameter
-        and a particular tag exists and returns the path to it.
-        If it doesn't exist, it creates it.
+        Returns the detector path to use for a
+        trial: its overlay if any edits created
+        one, and the original installation
+        otherwise.
 
         Args:
-          param: a parameter, structured according to parameter config file
-          tag:   the tag associated with the current trial
+          tag: the tag associated with the current trial
         Returns:
-          path to compact file associated with parameter and tag
+          detector path for trial
         """
+        overlay = self.GetOverlayPath(tag)
+        return overlay if os.path.isdir(overlay) else self.cfgRun["det_path"]
 
-        # extract path and create relevant name
-        oldCompact = self.cfgRun["det_path"] + "/" + param["compact"]
-        newCompact = self.__GetNewXMLName(oldCompact, tag)
-
-        # if new compact does not exist, create it
-        if not os.path.exists(newCompact):
-            shutil.copyfile(oldCompact, newCompact)
+    def __LinkDirectory(self, source, target):
+        """LinkDirectory
 
-        # and return path
-        return newCompact
-
-    def __GetConfig(self, tag):
-        """GetConfig
-
-        Checks if the configuration file associated
-        a particular tag exists and returns the path
-        to it. If it doesn't exist, it creates it.
+        Fills a directory with symlinks to
+        every entry of another directory.
 
         Args:
-          tag: the tag associated with the current trial
-        Returns:
-          path to the config file with tag
+          source: directory to link to
+          target: directory to fill
         """
+        FileManager.MakeDir(target)
+        for entry in os.listdir(source):
+            link = target + "/" + entry
+            if not os.path.lexists(link):
+                os.symlink(source + "/" + entry, link)
 
-        # extract path and create relevant name
-        oldConfig = self.cfgRun["det_path"] + "/" + self.cfgRun["det_config"] + ".xml"
-        newConfig = self.__GetNewXMLName(oldConfig, tag) 
-
-        # if new config does not exist, create it
-        if not os.path.exists(newConfig):
-            shutil.copyfile(oldConfig, newConfig)
-
-        # and return path
-        return newConfig
-
-    def __GetFile(self, file, tag):
+    def __GetFile(self, file, tag, keep = True):
         """GetFile
 
-        Checks if an xml file associated with a
-        particular tag exists and returns the path
-        to it. If it doesn't exist, it creates it.
+        Makes sure a file in the overlay of a trial
+        is a real file (rather than a symlink to the
+        installation) and returns the path to it.
+        Any symlinked directories on the way to it
+        are replaced by real directories of symlinks.
 
         Args:
-          file: the xml file to get/created
+          file: path of the xml file relative to det_path
           tag:  the tag associated with the current trial
+          keep: whether or not to copy the original contents
         Returns:
-          path to the xml file with tag
+          path to the file in the overlay
         """
 
-        # create relevant name
-        newFile = self.__GetNewXMLName(file, tag)
-
-        # if new file does not exist, create it
-        if not os.path.exists(newFile):
-            shutil.copyfile(file, newFile)
+        # make sure overlay exists
+        detPath = self.cfgRun["det_path"]
+        overlay = self.GetOverlayPath(tag)
+        if not os.path.isdir(overlay):
+            self.__LinkDirectory(detPath, overlay)
+
+        # replace symlinked directories along the way
+        parts = os.path.normpath(file).split(os.sep)
+        for depth in range(1, len(parts)):
+            relDir = "/".join(parts[:depth])
+            if os.path.islink(overlay + "/" + relDir):
+                os.unlink(overlay + "/" + relDir)
+                self.__LinkDirectory(detPath + "/" + relDir, overlay + "/" + relDir)
+
+        # and then the file itself
+        newFile = overlay + "/" + "/".join(parts)
+        if os.path.islink(newFile) or not os.path.exists(newFile):
+            if os.path.lexists(newFile):
+                os.unlink(newFile)
+            if keep:
+                shutil.copyfile(detPath + "/" + file, newFile)
 
         # and return path
         return newFile
 
-    def __IsPatternInFile(self, pattern, file):
-        """IsPatternInFile
-
-        Checks if a provided pattern (eg. a
-        file name) is in a file, and returns
-        true or false of it is or isn't.
-
-        Args:
-          pattern: the pattern to look for
-          file:    the file to look in
-        Returns:
-          whether or not pattern was found
-        """
-
-        # iterate through lines until pattern is found
-        found = False
-        with open(file, 'r') as lines:
-            for iLine, line in enumerate(lines, start=1):
-                if re.search(pattern, line):
-                    found = True
-                    break
-
-        # return whether or not pattern was ever found
-        return found
-
     def EditCompact(self, param, value, tag):
         """EditCompact
 
         Updates the value of a parameter in the compact
-        file associated with it and the provided tag.
+        file associated with it in the overlay of the
+        provided tag.
 
         Args:
           param: the parameter and its associated compact file
@@ -161,7 +167,7 @@ class GeometryEditor:
 
         # get path to compact file to edit, and
         # parse the xml
-        fileToEdit = self.__GetCompact(param, tag)
+        fileToEdit = self.__GetFile(param["compact"], tag)
         treeToEdit = ET.parse(fileToEdit)
  
         # extract relevant info from parameter
@@ -178,12 +184,77 @@ class GeometryEditor:
         treeToEdit.write(fileToEdit)
         return
 
+    def __GetBaseTree(self, compact):
+        """GetBaseTree
+
+        Returns the parsed, unedited version of a
+        compact file, parsing it only if it hasn't
+        been parsed yet or has changed since.
+
+        Args:
+          compact: path to the compact file
+        Returns:
+          parsed xml tree
+        """
+        mtime = os.path.getmtime(compact)
+        with GeometryEditor.BaseLock:
+            cached = GeometryEditor.BaseTrees.get(compact)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, ET.parse(compact))
+                GeometryEditor.BaseTrees[compact] = cached
+        return cached[1]
+
+    def EditCompacts(self, edits, tag):
+        """EditCompacts
+
+        Updates the values of several parameters at
+        once. Parameters are grouped by compact file,
+        and each compact file in the overlay of the
+        provided tag is written once with all of its
+        edits applied to a copy of its unedited
+        version.
+
+        Args:
+          edits: list of tuples of a parameter (structured according
+                 to parameter config file) and the value to update to
+          tag:   the tag associated with the current trial
+        """
+
+        # group edits by compact file
+        grouped = dict()
+        for param, value in edits:
+            grouped.setdefault(param["compact"], list()).append((param, value))
+
+        # apply all edits to each file in one go
+        for compact, toApply in grouped.items():
+            oldCompact = self.cfgRun["det_path"] + "/" + compact
+            newCompact = self.__GetFile(compact, tag, keep = False)
+            treeToEdit = ET.ElementTree(
+                copy.deepcopy(self.__GetBaseTree(oldCompact).getroot())
+            )
+            for param, value in toApply:
+
+                # extract relevant info from parameter
+                path, elem, unit = ConfigParser.GetPathElementAndUnits(param)
+
+                # now find and edit the relevant info
+                elemToEdit = treeToEdit.getroot().find(path)
+                if unit != '':
+                    elemToEdit.set(elem, "{}*{}".format(value, unit))
+                else:
+                    elemToEdit.set(elem, "{}".format(value))
+
+            # save edits
+            treeToEdit.write(newCompact)
+
     def EditConfig(self, param, tag):
         """EditConfig
 
-        Updates the compact file associated with
-        a provided parameter in the config file
-        associated with the provided tag.
+        Returns the config file of the overlay of
+        the provided tag. Since every include is
+        resolved relative to the overlay, the
+        config picks up edited compact files
+        without needing any changes itself.
 
         Args:
           param: the parameter and its associated compact file
@@ -191,95 +262,205 @@ class GeometryEditor:
         Returns:
           new config name
         """
+        return self.GetOverlayPath(tag) + "/" + self.cfgRun["det_config"] + ".xml"
 
-        # get path to config file to edit, and
-        # parse the xml
-        fileToEdit = self.__GetConfig(tag)
-        treeToEdit = ET.parse(fileToEdit)
+    def __ReadIncludes(self, file):
+        """ReadIncludes
 
-        # grab old & new compact files
-        # associated with parameter
-        oldCompact = param["compact"]
-        newCompact = self.__GetNewXMLName(oldCompact, tag)
+        Finds the xml files an xml file refers
+        to, via include or other file references.
 
-        # find old compact and replace
-        # with new one
-        path="${DETECTOR_PATH}/"
-        for element in treeToEdit.getroot().findall('.//include'):
-            if element.get('ref') == str(path + oldCompact):
-                element.set('ref', str(path + newCompact))
-                break
+        Args:
+          file: path to the xml file
+        Returns:
+          list of the references as written in the file
+          and the paths (relative to det_path) they
+          resolve to
+        """
+        with open(file, 'r', encoding = "utf-8", errors = "replace") as xml:
+            text = xml.read()
+
+        detPath  = os.path.normpath(self.cfgRun["det_path"])
+        includes = list()
+        for ref in IncludePattern.findall(text):
+            if "${DETECTOR_PATH}" in ref:
+                target = ref.replace("${DETECTOR_PATH}", detPath)
+            elif os.path.isabs(ref):
+                target = ref
+            else:
+                target = os.path.join(os.path.dirname(file), ref)
+            target = os.path.relpath(os.path.normpath(target), detPath)
+            includes.append([ref, target])
+        return includes
+
+    def GetIndexPath(self):
+        """GetIndexPath
+
+        Returns where the include index of the
+        detector installation is cached on disk:
+        "include_index" if it's set in the run
+        config, and otherwise under the run
+        directory (the installation itself may be
+        read-only or shared), named by a hash of
+        det_path.
 
-        # save edits and exit
-        treeToEdit.write(fileToEdit)
-        return fileToEdit
+        Returns:
+          path to the cached index
+        """
+        detPath = os.path.normpath(self.cfgRun["det_path"])
+        if "include_index" in self.cfgRun:
+            return self.cfgRun["include_index"]
+        detHash = hashlib.sha256(detPath.encode()).hexdigest()[:16]
+        return self.cfgRun["run_path"] + "/include_index/" + detHash + ".json"
+
+    def GetIncludeIndex(self, tag = None):
+        """GetIncludeIndex
+
+        Returns an index of which xml files in det_path
+        refer to which. The index is cached on disk (see
+        GetIndexPath) and in memory, and only files which
+        are new or whose modification time or size changed
+        are re-read. Files created for trials are left out.
+
+        If a tag is provided, the installation is only
+        checked against the index the first time the
+        trial asks for it, so a trial editing several
+        compact files walks the installation once.
+
+        Args:
+          tag: optional tag of the trial asking for the index
+        Returns:
+          dictionary of files (relative to det_path) and
+          their modification time ("mtime"), size ("size"),
+          and list of references and files they resolve to
+          ("includes")
+        """
+        detPath   = os.path.normpath(self.cfgRun["det_path"])
+        indexPath = self.GetIndexPath()
+        with GeometryEditor.IndexLock:
+
+            # nothing to check if this trial
+            # already checked the index
+            cached = GeometryEditor.IncludeIndex.get(indexPath)
+            if cached is not None and tag is not None and tag in cached["tags"]:
+                return cached["index"]
+
+            # load index from disk if not already in memory
+            index = cached["index"] if cached is not None else None
+            if index is None and os.path.isfile(indexPath):
+                with open(indexPath, 'r') as saved:
+                    index = json.load(saved)
+            if index is None:
+                index = dict()
+
+            # now check every xml file against index
+            current = dict()
+            changed = False
+            for root, dirs, files in os.walk(detPath):
+                for file in files:
+                    if not file.endswith(".xml") or "_aid2e_" in file:
+                        continue
+                    full  = os.path.join(root, file)
+                    rel   = os.path.relpath(full, detPath)
+                    stat  = os.stat(full)
+                    entry = index.get(rel)
+                    if entry is None or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+                        entry = {
+                            "mtime"    : stat.st_mtime,
+                            "size"     : stat.st_size,
+                            "includes" : self.__ReadIncludes(full)
+                        }
+                        changed = True
+                    current[rel] = entry
+            changed = changed or len(current) != len(index)
+
+            # save index if anything changed
+            if changed:
+                FileManager.MakeDir(os.path.dirname(indexPath))
+                temp = indexPath + "." + str(os.getpid()) + ".tmp"
+                with open(temp, 'w') as saved:
+                    json.dump(current, saved)
+                os.replace(temp, indexPath)
+
+            # and invert it (so that each file points to
+            # the files which include it) only if needed
+            if changed or cached is None:
+                includedBy = dict()
+                for file, entry in current.items():
+                    for ref, target in entry["includes"]:
+                        includedBy.setdefault(target, list()).append((file, ref))
+                cached = {"index" : current, "included_by" : includedBy, "tags" : set()}
+            if tag is not None:
+                cached["tags"].add(tag)
+            GeometryEditor.IncludeIndex[indexPath] = cached
+        return current
+
+    def GetIncludedBy(self, tag = None):
+        """GetIncludedBy
+
+        Returns the include index inverted, so that
+        each file points to the files including it.
+
+        Args:
+          tag: optional tag of the trial asking for it (see GetIncludeIndex)
+        Returns:
+          dictionary of files (relative to det_path) and
+          lists of the files including them and the
+          references they use
+        """
+        self.GetIncludeIndex(tag)
+        with GeometryEditor.IndexLock:
+            return GeometryEditor.IncludeIndex[self.GetIndexPath()]["included_by"]
 
     def EditRelatedFiles(self, param, tag):
         """EditRelatedFiles
 
-        Updates _all_ xml files related to a
-        provided parameter, including related
-        config files and intermediaries.
+        Updates the xml files related to a provided
+        parameter in the overlay of the provided tag.
+        References via ${DETECTOR_PATH} or relative
+        paths already resolve to the edited files in
+        the overlay, so only files referring to them
+        (or to any file including them) by absolute
+        path need new versions. These are found by
+        walking backwards through the include index
+        from the parameter's compact file.
 
         Args:
           param: the parameter and its associated compact file
           tag:   the tag associated with the current trial
-        Returns:
-          ...
         """
 
-        # step 1:grab old & new compact files
-        #   associated with parameter
-        oldCompact = param["compact"]
-        newCompact = self.__GetNewXMLName(oldCompact, tag)
-
-        # step 2: split old compact path into directories
-        #   relative to cfg["det_path"] to search in
-        split = oldCompact.split('/')
-        split.insert(0, "")
-
-        # step 3: now iterate upwards through sequence
-        #   of directories to check to find related
-        #   files
-        path    = ""
-        steps   = len(split) + 1
-        queries = [split[-1]]
-        for step in range(2, steps):
-
-            # step 3(a): loop through all files in directory
-            search = '/'.join(part for part in split[0:steps - step])
-            root   = self.cfgRun["det_path"] + search
-            new    = list()
-            for file in os.listdir(self.cfgRun["det_path"] + "/" + search):
-
-                full = root + "/" + file
-                if os.path.isdir(full):
-                    continue
-
-                # step 3(a)(i): check if any files include
-                #   any of the files related to the compact
-                for query in queries:
-                    if self.__IsPatternInFile(query, full):
-
-                        # step3(a)(ii): if it does, create
-                        #   new version with filenames
-                        #   updated accordingly
-                        copy     = self.__GetFile(full, tag)
-                        update   = self.__GetNewXMLName(query, tag)
-                        editable = pathlib.Path(copy)
-                        text     = editable.read_text(encoding="utf-8")
-                        edited   = text.replace(query, update)
-                        editable.write_text(edited, encoding="utf-8")
-
-                        if file not in new:
-                            new.append(file)
-
-            # step 3(b): add any new related files to list
-            #   and update relative paths
-            path = split[-step] + "/" + path
-            add  = path.split("/")[0]
-
-            queries.extend(new)
-            queries[:] = [f"{add}/{query}" for query in queries]
+        # step 1: look up the files which include each
+        #   file (checked against the installation once
+        #   per trial)
+        includedBy = self.GetIncludedBy(tag)
+
+        # step 2: walk backwards from the compact file
+        #   through every file which includes it (however
+        #   it's referred to), creating a new version of
+        #   each file which refers to one on the way by
+        #   absolute path, with references pointed to
+        #   the overlay
+        overlay = self.GetOverlayPath(tag)
+        toVisit = [os.path.normpath(param["compact"])]
+        visited = set(toVisit)
+        while toVisit:
+            target = toVisit.pop(0)
+            for file, ref in includedBy.get(target, list()):
+                if os.path.isabs(ref):
+                    newFile  = self.__GetFile(file, tag)
+                    update   = overlay + "/" + target
+                    editable = pathlib.Path(newFile)
+                    text     = editable.read_text(encoding="utf-8")
+                    edited   = text.replace('"' + ref + '"', '"' + update + '"')
+                    editable.write_text(edited, encoding="utf-8")
+
+                # step 3: and then files which include it,
+                #   since a file included by relative path
+                #   only picks up edits if it's loaded from
+                #   the overlay too
+                if file not in visited:
+                    visited.add(file)
+                    toVisit.append(file)
 
 # end =========================================================================
@@ -0,0 +1,294 @@
+# =============================================================================
+## @file   InputStager.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Class to stage (remote) input files of the
+#    simulation into a local cache once, so trials
+#    don't fetch them again.
+#
+#  The staging of a trial is a stage of its graph,
+#  which runs this module as a script (e.g. within
+#  eic-shell) to stage the input files of a steering
+#  file:
+#
+#    python3 InputStager.py -r <run config> -s <steering file>
+# =============================================================================
+
+import argparse
+import ast
+import fcntl
+import hashlib
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import uuid
+
+try:
+    from EICMOBOTestTools import ConfigParser
+    from EICMOBOTestTools import FileManager
+except ImportError:
+    import ConfigParser
+    import FileManager
+
+class InputStager:
+    """InputStager
+
+    A class to copy the input files of a steering file
+    (e.g. HepMC files read over xrootd) into a local
+    cache the first time a trial needs them. A copy is
+    checked against its source before it's cached, and
+    is then stored with a checksum, which is verified
+    before the file is reused. A file being staged is
+    locked so that trials needing the same file (in
+    any process) wait for it rather than fetching it
+    again.
+    """
+
+    # cached files verified by this process, so
+    # large files are only hashed once
+    Verified = set()
+    Lock     = threading.Lock()
+
+    def __init__(self, run):
+        """constructor accepting arguments
+
+        The cache is placed in "input_cache" if it's
+        set in the run config, and otherwise under the
+        output directory. Remote files are fetched with
+        "stage_command", where <SOURCE> and <TARGET>
+        are replaced by the remote and local paths.
+        The command has to fail if the copy doesn't
+        match its source: by default, xrdcp compares
+        the adler32 checksum of the copy to the one
+        the server reports for the source.
+
+        Args:
+          run: runtime configuration file
+        """
+        self.runPath  = os.path.realpath(run)
+        self.cfgRun   = ConfigParser.ReadJsonFile(run)
+        self.cacheDir = self.cfgRun.get(
+            "input_cache",
+            self.cfgRun["out_path"] + "/input_cache"
+        )
+        self.command  = self.cfgRun.get(
+            "stage_command",
+            "xrdcp -f --cksum adler32:source <SOURCE> <TARGET>"
+        )
+
+    def IsRemote(self, source):
+        """IsRemote
+
+        Checks if a file needs to be fetched
+        (e.g. via xrootd) rather than copied.
+
+        Args:
+          source: path or url of the file
+        Returns:
+          whether or not file is remote
+        """
+        return re.match(r"^[a-z][a-z0-9+.\-]*://", source) is not None and not source.startswith("file://")
+
+    def GetInputFiles(self, path, steer):
+        """GetInputFiles
+
+        Extracts the input files of a steering
+        file from its SIM.inputFiles setting.
+
+        Args:
+          path:  the path to the input steering file
+          steer: the input steering file
+        Returns:
+          list of input files (empty if none are set)
+        """
+        inFiles = list()
+        with open(path + "/" + steer, 'r') as lines:
+            for line in lines:
+                match = re.search(r"^\s*SIM\.inputFiles\s*=\s*(.+?)\s*$", line)
+                if match:
+                    inFiles = ast.literal_eval(match.group(1))
+        return [inFiles] if isinstance(inFiles, str) else list(inFiles)
+
+    def GetEntry(self, source):
+        """GetEntry
+
+        Returns the path a file is (or will be)
+        cached at, without staging it.
+
+        Args:
+          source: path or url of the file
+        Returns:
+          path to the cached file
+        """
+        key = hashlib.sha256(source.encode()).hexdigest()[:16]
+        return self.cacheDir + "/" + key + "_" + os.path.basename(source)
+
+    def __HashFile(self, path):
+        """HashFile
+
+        Computes the checksum of a file, reading
+        it in chunks.
+
+        Args:
+          path: path to the file
+        Returns:
+          checksum of the file
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda : file.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def __IsIntact(self, entry):
+        """IsIntact
+
+        Checks if a cached file matches its
+        recorded checksum.
+
+        Args:
+          entry: path to the cached file
+        Returns:
+          whether or not the file is intact
+        """
+        if not os.path.isfile(entry) or not os.path.isfile(entry + ".sha256"):
+            return False
+        with InputStager.Lock:
+            if entry in InputStager.Verified:
+                return True
+        with open(entry + ".sha256", 'r') as sums:
+            checksum = sums.read().strip()
+        if self.__HashFile(entry) != checksum:
+            print(f"WARNING: staged input {entry} doesn't match its checksum, staging it again")
+            return False
+        with InputStager.Lock:
+            InputStager.Verified.add(entry)
+        return True
+
+    def Stage(self, source):
+        """Stage
+
+        Returns the path to a local copy of a file,
+        staging it into the cache if needed. The
+        file is copied under a temporary name, checked
+        against its source (by the stage command for
+        remote files, and by their checksums for local
+        ones), and then moved into place once its
+        checksum is recorded.
+
+        Args:
+          source: path or url of the file
+        Returns:
+          path to the cached file
+        """
+        FileManager.MakeDir(self.cacheDir)
+        entry = self.GetEntry(source)
+        key   = os.path.basename(entry).split("_", 1)[0]
+
+        with open(self.cacheDir + "/" + key + ".lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self.__IsIntact(entry):
+                    return entry
+
+                # fetch or copy file
+                print(f"INFO: staging input {source} into {entry}")
+                temp = entry + "." + uuid.uuid4().hex + ".tmp"
+                if self.IsRemote(source):
+                    command = self.command.replace("<SOURCE>", source).replace("<TARGET>", temp)
+                    process = subprocess.run(command, shell = True)
+                    if process.returncode != 0 or not os.path.isfile(temp):
+                        if os.path.exists(temp):
+                            os.remove(temp)
+                        raise RuntimeError(f"Couldn't stage input {source} (exit code {process.returncode})")
+                    checksum = self.__HashFile(temp)
+                else:
+                    checksum = self.__HashFile(source.removeprefix("file://"))
+                    shutil.copyfile(source.removeprefix("file://"), temp)
+                    if self.__HashFile(temp) != checksum:
+                        os.remove(temp)
+                        raise RuntimeError(f"Copy of input {source} doesn't match its source")
+
+                # record checksum and move
+                # file into place
+                with open(temp + ".sha256", 'w') as sums:
+                    sums.write(checksum + "\n")
+                os.replace(temp, entry)
+                os.replace(temp + ".sha256", entry + ".sha256")
+                with InputStager.Lock:
+                    InputStager.Verified.add(entry)
+                return entry
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def StageSteering(self, path, steer):
+        """StageSteering
+
+        Stages every remote input file of a
+        steering file (local files are used
+        where they are).
+
+        Args:
+          path:  the path to the input steering file
+          steer: the input steering file
+        Returns:
+          list of paths to the input files to use
+        """
+        return [
+            self.Stage(inFile) if self.IsRemote(inFile) else inFile
+            for inFile in self.GetInputFiles(path, steer)
+        ]
+
+    def MakeStageCommand(self, path, steer):
+        """MakeStageCommand
+
+        Makes a command to stage the remote input
+        files of a steering file (see StageSteering),
+        so that staging can run as a stage of a trial,
+        along with the local paths the simulation
+        should read instead.
+
+        Args:
+          path:  the path to the input steering file
+          steer: the input steering file
+        Returns:
+          tuple of the command to be run (None if there
+          are no remote files) and the list of paths to
+          the input files to use
+        """
+        inFiles = self.GetInputFiles(path, steer)
+        remote  = [inFile for inFile in inFiles if self.IsRemote(inFile)]
+        if not remote:
+            return None, inFiles
+
+        stager  = os.path.realpath(__file__)
+        steerer = os.path.realpath(path + "/" + steer)
+        command = "python3 " + stager + " -r " + shlex.quote(self.runPath) + " -s " + shlex.quote(steerer)
+        return command, [
+            self.GetEntry(inFile) if self.IsRemote(inFile) else inFile
+            for inFile in inFiles
+        ]
+
+# main ========================================================================
+
+if __name__ == "__main__":
+
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--run", help = "Runtime configuration file", type = str, required = True)
+    parser.add_argument("-s", "--steer", help = "Steering file to stage input of", type = str, required = True)
+
+    # stage remote input files of steering file
+    args = parser.parse_args()
+    try:
+        InputStager(args.run).StageSteering(os.path.dirname(args.steer), os.path.basename(args.steer))
+    except RuntimeError as error:
+        print(f"ERROR: {error}")
+        sys.exit(1)
+
+# end =========================================================================
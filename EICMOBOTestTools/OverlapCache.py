@@ -0,0 +1,163 @@
+# =============================================================================
+## @file   OverlapCache.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Class to cache the results of overlap checks,
+#    keyed on the contents of the geometry checked.
+# =============================================================================
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from EICMOBOTestTools import ConfigParser
+from EICMOBOTestTools import FileManager
+
+class OverlapCache:
+    """OverlapCache
+
+    A class to store and look up the results (verdict
+    and log) of overlap checks, so that a geometry
+    which has already been checked isn't checked
+    again. Entries are keyed on a hash of the contents
+    of every xml file making up the geometry, and are
+    written atomically so that several trials can
+    share the cache.
+    """
+
+    def __init__(self, run):
+        """constructor accepting arguments
+
+        The cache is placed in "overlap_cache" if it's
+        set in the run config, and otherwise under the
+        output directory.
+
+        Args:
+          run: runtime configuration file
+        """
+        self.cfgRun   = ConfigParser.ReadJsonFile(run)
+        self.cacheDir = self.cfgRun.get(
+            "overlap_cache",
+            self.cfgRun["out_path"] + "/overlap_cache"
+        )
+
+    def __GetIncludes(self, file, path):
+        """GetIncludes
+
+        Finds the paths of all files included
+        by an xml file.
+
+        Args:
+          file: path to the xml file
+          path: detector path to resolve ${DETECTOR_PATH} with
+        Returns:
+          list of paths to included files
+        """
+        with open(file, 'r', encoding = "utf-8") as xml:
+            text = xml.read()
+
+        includes = list()
+        for ref in re.findall(r'<include\s[^>]*ref\s*=\s*"([^"]+)"', text):
+            if "${DETECTOR_PATH}" in ref:
+                ref = ref.replace("${DETECTOR_PATH}", path)
+            elif not os.path.isabs(ref):
+                ref = os.path.join(os.path.dirname(file), ref)
+            includes.append(os.path.normpath(ref))
+        return includes
+
+    def MakeKey(self, path, config):
+        """MakeKey
+
+        Computes the key of a geometry by hashing
+        every xml file reachable from its config
+        file. Files are identified by their path
+        relative to the detector path, so the same
+        geometry has the same key whether it's in
+        the installation or a trial's overlay.
+
+        Args:
+          path:   detector path (e.g. of a trial's overlay)
+          config: name of the detector config (without .xml)
+        Returns:
+          key of the geometry
+        """
+
+        # the check also depends on how it's run
+        digest = hashlib.sha256()
+        for setting in ["epic_setup", "det_path", "overlap_check"]:
+            digest.update(str(self.cfgRun[setting]).encode())
+
+        # walk through all included files,
+        # hashing each once
+        detPath = os.path.normpath(path)
+        toHash  = [os.path.normpath(detPath + "/" + config + ".xml")]
+        hashed  = set()
+        while toHash:
+            file = toHash.pop(0)
+            if file in hashed:
+                continue
+            hashed.add(file)
+
+            # hash relative path, and contents
+            # if file exists
+            name = os.path.relpath(file, detPath)
+            digest.update(b"\0" + name.encode() + b"\0")
+            if not os.path.isfile(file):
+                digest.update(b"missing")
+                continue
+            with open(file, 'rb') as xml:
+                digest.update(xml.read())
+            toHash.extend(self.__GetIncludes(file, detPath))
+        return digest.hexdigest()
+
+    def Lookup(self, key):
+        """Lookup
+
+        Looks up the result of an overlap
+        check in the cache.
+
+        Args:
+          key: key of the geometry
+        Returns:
+          path to the cached log of the check, or
+          None if geometry isn't in the cache
+        """
+        log = self.cacheDir + "/" + key + "/" + FileManager.GetSuffix("geo").lstrip(".")
+        return log if os.path.isfile(log) else None
+
+    def Store(self, key, log, verdict):
+        """Store
+
+        Stores the result of an overlap check in
+        the cache. The entry is assembled in a
+        temporary directory and then renamed into
+        place, so other trials only ever see
+        complete entries. If another trial stored
+        the same geometry first, its entry is kept.
+
+        Args:
+          key:     key of the geometry
+          log:     path to the log of the check
+          verdict: exit code of the check (0 if no overlaps, 9 if any)
+        """
+        FileManager.MakeDir(self.cacheDir)
+        entry = self.cacheDir + "/" + key
+        if os.path.isdir(entry):
+            return
+
+        # assemble entry
+        temp = tempfile.mkdtemp(prefix = "." + key + ".", dir = self.cacheDir)
+        shutil.copyfile(log, temp + "/" + FileManager.GetSuffix("geo").lstrip("."))
+        with open(temp + "/verdict.txt", 'w') as out:
+            out.write(f"{verdict}\n")
+
+        # and move it into place
+        try:
+            os.rename(temp, entry)
+        except OSError:
+            shutil.rmtree(temp, ignore_errors = True)
+
+# end =========================================================================
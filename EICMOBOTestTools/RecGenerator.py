@@ -27,7 +27,6 @@ class RecGenerator:
           run: runtime configuration file
         """
         self.cfgRun = ConfigParser.ReadJsonFile(run)
-        self.argParams = dict()
 
     def __AddValueToArg(self, arg, value, units = ''):
         """AddValueToArg
@@ -46,24 +45,18 @@ class RecGenerator:
             arg += "{}".format(value)
         return arg
 
-    # FIXME this is not thread-safe!
-    def ClearArgs(self):
-        """ClearArgs
-
-        Clear dictionary of arguments to apply
-        """
-        self.argParams.clear()
-
-    def AddParamToArgs(self, param, value):
+    def AddParamToArgs(self, args, param, value):
         """AddParamToArgs
 
-        Adds a parameter to dictionary
+        Adds a parameter to a dictionary
         of arguments to apply.
 
         Args:
+            args:  dictionary of arguments to add to
             param: the parameter to add
             value: the value it's going to take
-
+        Returns:
+            the updated dictionary of arguments
         """
 
         # grab info and current value
@@ -71,8 +64,8 @@ class RecGenerator:
         path   = param["path"]
         units  = param["units"]
         argVal = ""
-        if path in self.argParams:
-            argVal = self.argParams[path]
+        if path in args:
+            argVal = args[path]
 
         # if dealing with a vector, then  will have to
         # insert value in appropriate component
@@ -96,12 +89,32 @@ class RecGenerator:
         # otherwise dealing with a scalar, and
         # can just add value to argument
         else:
-            self.__AddValueToArg(argVal, value, units)
+            argVal = self.__AddValueToArg(argVal, value, units)
 
         # save updated/new arg
-        self.argParams[path] = argVal
+        args[path] = argVal
+        return args
+
+    def MakeArgs(self, params):
+        """MakeArgs
+
+        Builds a fresh dictionary of arguments
+        to apply from a list of parameters. Nothing
+        is kept on the generator, so the same
+        generator can be used by several trials
+        at once.
+
+        Args:
+            params: list of tuples of parameters and their values
+        Returns:
+            dictionary of argument paths and their values
+        """
+        args = dict()
+        for param, value in params:
+            self.AddParamToArgs(args, param, value)
+        return args
 
-    def MakeCommand(self, tag, label, steer):
+    def MakeCommand(self, tag, label, steer, shard = None, args = None):
         """MakeCommand
 
         Generates command to run reconstruction
@@ -112,14 +125,17 @@ class RecGenerator:
           tag:   the tag associated with the current trial
           label: the label associated with the input
           steer: the input steering file
+          shard: optional index of the shard to reconstruct
+          args:  optional dictionary of arguments to apply (see MakeArgs)
         Returns:
           command to be run
         """
 
         # construct input/output names
         steeTag = FileManager.ConvertSteeringToTag(steer)
-        inFile  = FileManager.MakeOutName("sim", tag, label, steeTag)
-        outFile = FileManager.MakeOutName("rec", tag, label, steeTag)
+        shaTag  = FileManager.MakeShardTag(steeTag, shard)
+        inFile  = FileManager.MakeOutName("sim", tag, label, shaTag)
+        outFile = FileManager.MakeOutName("rec", tag, label, shaTag)
 
         # make sure output directory
         # exists for trial
@@ -142,7 +158,7 @@ class RecGenerator:
 
         # construct most of command
         command = self.cfgRun["rec_exec"] + " " + outArg + " " + collArg
-        for param, value in self.argParams.items():
+        for param, value in (args or dict()).items():
             command = command + " -P" + param + "=\"" + value + "\""
 
         # return command with input file attached
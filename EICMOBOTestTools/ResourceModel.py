@@ -0,0 +1,171 @@
+# =============================================================================
+## @file   ResourceModel.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Class to describe the resources (cores,
+#    memory, thread flags) each stage of a trial
+#    needs, and what a trial needs as a whole.
+# =============================================================================
+
+import math
+import os
+import re
+
+from EICMOBOTestTools import ConfigParser
+
+# resources of a stage not listed in
+# the run config
+DefaultResources = {
+    "cores"  : 1,
+    "memory" : "2G",
+    "flags"  : list()
+}
+
+class ResourceModel:
+    """ResourceModel
+
+    A class to look up the resources each kind of stage
+    (overlap check, simulation, reconstruction, merging,
+    mapping, analysis) needs from the "resources" block
+    of the run config, e.g.
+
+        "resources" : {
+            "rec" : {
+                "cores"  : 4,
+                "memory" : "8G",
+                "flags"  : ["-Pjana:nthreads=<CORES>"]
+            }
+        }
+
+    where any flags are added right after the executable
+    of the stage's command, with <CORES> replaced by the
+    no. of cores of the stage. Stages which aren't listed
+    use one core and 2G of memory.
+    """
+
+    def __init__(self, run):
+        """constructor accepting arguments
+
+        Args:
+          run: runtime configuration file
+        """
+        self.cfgRun = ConfigParser.ReadJsonFile(run)
+        self.cfgRes = self.cfgRun.get("resources", dict())
+        self.budget = self.cfgRun.get("max_cores", os.cpu_count())
+
+    def GetStage(self, name):
+        """GetStage
+
+        Returns the kind of stage a stage of the
+        trial graph is (e.g. "rec" for the stage
+        "rec_single_electron_backward_e18ele").
+
+        Args:
+          name: name of the stage in the trial graph
+        Returns:
+          kind of stage
+        """
+        return name.split("_")[0]
+
+    def __GetOption(self, stage, option):
+        """GetOption
+
+        Looks up a resource of a kind of stage,
+        falling back to the default.
+
+        Args:
+          stage:  kind of stage
+          option: resource to look up
+        Returns:
+          value of resource
+        """
+        return self.cfgRes.get(stage, dict()).get(option, DefaultResources[option])
+
+    def ParseMemory(self, memory):
+        """ParseMemory
+
+        Converts an amount of memory in Slurm
+        notation (e.g. "500M", "8G") to MB.
+
+        Args:
+          memory: amount of memory
+        Returns:
+          amount of memory in MB
+        """
+        match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*", str(memory), re.IGNORECASE)
+        if match is None:
+            raise ValueError(f"Can't parse amount of memory '{memory}'!")
+        scale = {"K" : 1 / 1024, "" : 1, "M" : 1, "G" : 1024, "T" : 1024**2}
+        return int(math.ceil(float(match.group(1)) * scale[match.group(2).upper()]))
+
+    def GetCores(self, stage):
+        """GetCores
+
+        Returns the no. of cores a kind of stage
+        uses, capped at the cores of a trial.
+
+        Args:
+          stage: kind of stage
+        Returns:
+          no. of cores
+        """
+        return max(1, min(self.__GetOption(stage, "cores"), self.budget))
+
+    def GetMemory(self, stage):
+        """GetMemory
+
+        Returns the memory a kind of stage uses.
+
+        Args:
+          stage: kind of stage
+        Returns:
+          memory in MB
+        """
+        return self.ParseMemory(self.__GetOption(stage, "memory"))
+
+    def AddFlags(self, command, stage):
+        """AddFlags
+
+        Adds the flags of a kind of stage (e.g.
+        setting the no. of threads) right after
+        the executable of its command.
+
+        Args:
+          command: command running the stage
+          stage:   kind of stage
+        Returns:
+          command with flags added
+        """
+        flags = [
+            flag.replace("<CORES>", str(self.GetCores(stage)))
+            for flag in self.__GetOption(stage, "flags")
+        ]
+        if not flags:
+            return command
+        parts = command.split(" ", 1)
+        return " ".join([parts[0]] + flags + parts[1:])
+
+    def GetTrialRequest(self):
+        """GetTrialRequest
+
+        Works out what to request for a whole trial
+        (e.g. from Slurm): the cores a trial runs its
+        stages within ("max_cores"), and enough memory
+        for any packing of stages onto those cores,
+        i.e. the cores times the most memory any kind
+        of stage needs per core.
+
+        Returns:
+          tuple of no. of cores and memory (in Slurm notation)
+        """
+        stages  = {stage for stage in self.cfgRes if not stage.startswith("_")}
+        stages |= {"geo", "sim", "rec", "merge", "map", "ana"}
+        perCore = max(self.GetMemory(stage) / self.GetCores(stage) for stage in stages)
+        memory  = max(
+            int(math.ceil(perCore * self.budget)),
+            max(self.GetMemory(stage) for stage in stages)
+        )
+        return self.budget, str(memory) + "M"
+
+# end =========================================================================
@@ -0,0 +1,148 @@
+# =============================================================================
+## @file   SimCache.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Class to cache the output of simulation,
+#    so that trials which only change reconstruction
+#    parameters don't simulate again.
+# =============================================================================
+
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+from EICMOBOTestTools import ConfigParser
+from EICMOBOTestTools import FileManager
+
+class SimCache:
+    """SimCache
+
+    A class to store and look up the output of the
+    simulation of a steering file (or one of its
+    shards). Entries are keyed on the values of the
+    simulation parameters, the hash of the geometry
+    (see OverlapCache), the contents of the steering
+    file, and the simulation command itself, so a
+    trial differing from an earlier one only in its
+    reconstruction parameters reuses its simulation.
+    """
+
+    def __init__(self, run):
+        """constructor accepting arguments
+
+        The cache is placed in "sim_cache" if it's
+        set in the run config, and otherwise under
+        the output directory.
+
+        Args:
+          run: runtime configuration file
+        """
+        self.cfgRun   = ConfigParser.ReadJsonFile(run)
+        self.cacheDir = self.cfgRun.get(
+            "sim_cache",
+            self.cfgRun["out_path"] + "/sim_cache"
+        )
+
+    def MakeKey(self, tag, geoKey, params, command, path, steer, events = None):
+        """MakeKey
+
+        Computes the key of the simulation of a
+        steering file. Paths specific to the trial
+        are left out of the command hashed, so the
+        same simulation has the same key in any
+        trial.
+
+        Args:
+          tag:     the tag associated with the current trial
+          geoKey:  key of the trial's geometry (see OverlapCache)
+          params:  dictionary of simulation parameter names and values
+          command: command running the simulation
+          path:    the path to the input steering file
+          steer:   the input steering file
+          events:  optional shard or no. of events simulated
+        Returns:
+          key of the simulation
+        """
+
+        # remove anything specific to the trial
+        # from the command
+        command = command.replace(self.cfgRun["out_path"] + "/" + tag, "<OUT>")
+        command = command.replace(self.cfgRun["run_path"] + "/" + tag, "<RUN>")
+        command = command.replace("aid2e_" + tag, "aid2e_<TAG>")
+
+        digest = hashlib.sha256()
+        digest.update(geoKey.encode())
+        digest.update(json.dumps(params, sort_keys = True).encode())
+        digest.update(command.encode())
+        digest.update(json.dumps(events).encode())
+
+        # hash the steering file and its macro (if any)
+        for file in [steer, steer.replace(".py", ".mac")]:
+            digest.update(b"\0" + file.encode() + b"\0")
+            if os.path.isfile(path + "/" + file):
+                with open(path + "/" + file, 'rb') as contents:
+                    digest.update(contents.read())
+        return digest.hexdigest()
+
+    def Lookup(self, key):
+        """Lookup
+
+        Looks up the output of a simulation
+        in the cache.
+
+        Args:
+          key: key of the simulation
+        Returns:
+          path to the cached output, or None if
+          the simulation isn't in the cache
+        """
+        entry = self.cacheDir + "/" + key + FileManager.GetSuffix("sim")
+        return entry if os.path.isfile(entry) else None
+
+    def MakeLinkCommand(self, cached, output):
+        """MakeLinkCommand
+
+        Generates a command to link the output of a
+        cached simulation to where a trial expects it.
+
+        Args:
+          cached: path to the cached output
+          output: path to the output expected by the trial
+        Returns:
+          command to be run
+        """
+        return "ln -sfn " + cached + " " + output
+
+    def Store(self, key, output):
+        """Store
+
+        Stores the output of a simulation in the
+        cache. The output is hard-linked into the
+        cache if possible (and copied otherwise)
+        under a temporary name, and then renamed
+        into place, so other trials only ever see
+        complete entries.
+
+        Args:
+          key:    key of the simulation
+          output: path to the output of the simulation
+        """
+        FileManager.MakeDir(self.cacheDir)
+        entry = self.cacheDir + "/" + key + FileManager.GetSuffix("sim")
+        if os.path.isfile(entry) or os.path.islink(output):
+            return
+
+        # assemble entry
+        temp = entry + "." + uuid.uuid4().hex + ".tmp"
+        try:
+            os.link(output, temp)
+        except OSError:
+            shutil.copyfile(output, temp)
+
+        # and move it into place
+        os.replace(temp, entry)
+
+# end =========================================================================
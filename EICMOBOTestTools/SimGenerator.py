@@ -8,6 +8,7 @@
 # =============================================================================
 
 import os
+import re
 
 from EICMOBOTestTools import ConfigParser
 from EICMOBOTestTools import FileManager
@@ -28,15 +29,111 @@ class SimGenerator:
         """
         self.cfgRun = ConfigParser.ReadJsonFile(run)
 
-    def MakeOverlapCheckCommand(self, tag):
+    def GetNEvents(self, path, steer, inType):
+        """GetNEvents
+
+        Extracts the no. of events a steering file
+        generates, either from the /run/beamOn
+        command of its macro (for gps input) or
+        from its SIM.numberOfEvents setting.
+
+        Args:
+          path:   the path to the input steering file
+          steer:  the input steering file
+          inType: the type of input (e.g. gun, gps, hepmc, etc.)
+        Returns:
+          no. of events, or None if it couldn't be found
+        """
+
+        # pick file and pattern to search
+        if inType == "gps":
+            file    = path + "/" + steer.replace(".py", ".mac")
+            pattern = r"^\s*/run/beamOn\s+(\d+)"
+        else:
+            file    = path + "/" + steer
+            pattern = r"^\s*SIM\.numberOfEvents\s*=\s*(\d+)"
+
+        # take the last setting found
+        nEvents = None
+        with open(file, 'r') as lines:
+            for line in lines:
+                match = re.search(pattern, line)
+                if match:
+                    nEvents = int(match.group(1))
+        return nEvents
+
+    def MakeShards(self, nEvents, nShards):
+        """MakeShards
+
+        Splits a no. of events into contiguous
+        ranges of (nearly) equal size.
+
+        Args:
+          nEvents: total no. of events
+          nShards: no. of shards to split into
+        Returns:
+          list of (index, no. of events to skip, no. of events) of each shard
+        """
+        shards = list()
+        nShards = max(1, min(nShards, nEvents))
+        for index in range(nShards):
+            first = (index * nEvents) // nShards
+            last  = ((index + 1) * nEvents) // nShards
+            shards.append((index, first, last - first))
+        return shards
+
+    def MakeShardMacro(self, tag, label, path, steer, shard):
+        """MakeShardMacro
+
+        Creates a copy of the macro associated with
+        a steering file which only generates the
+        events of the provided shard. A shard with
+        no index covers a whole (shortened) run.
+
+        Args:
+          tag:   the tag associated with the current trial
+          label: the label associated with the input
+          path:  the path to the input steering file
+          steer: the input steering file
+          shard: tuple of (index or None, no. of events to skip, no. of events) of shard
+        Returns:
+          path to the shard macro
+        """
+
+        # make sure run directory
+        # exists for trial
+        runDir = self.cfgRun["run_path"] + "/" + tag
+        FileManager.MakeDir(runDir)
+
+        # construct macro name
+        index, skip, count = shard
+        steeTag  = FileManager.ConvertSteeringToTag(steer)
+        shaTag   = FileManager.MakeShardTag(steeTag, index)
+        macName  = "aid2e_" + tag + FileManager.GetBody(label, shaTag) + ".mac"
+        macPath  = runDir + "/" + macName
+
+        # replace no. of events to generate
+        with open(path + "/" + steer.replace(".py", ".mac"), 'r') as macro:
+            text = macro.read()
+        text = re.sub(r"(/run/beamOn\s+)\d+", r"\g<1>" + str(count), text)
+        with open(macPath, 'w') as macro:
+            macro.write(text)
+
+        # return path to macro
+        return macPath
+
+    def MakeOverlapCheckCommand(self, tag, cached = None):
         """MakeOverlapCheckCommand
 
         Generates command to run overlap check
         and exit subprocess if an overlap is
-        found.
+        found. If the log of an earlier check
+        of the same geometry is provided, it's
+        used instead of running the check.
 
         Args:
-          tag: tag associated with current trial
+          tag:    tag associated with current trial
+          cached: optional path to log of an earlier check
         Returns:
           command to be run
         """
@@ -49,6 +146,8 @@ class SimGenerator:
         # command to do overlap check
         log = outDir + "/" + FileManager.MakeOutName("geo", tag)
         run = self.cfgRun["overlap_check"] + " -c $DETECTOR_PATH/$DETECTOR_CONFIG.xml > " + log + " 2>&1"
+        if cached is not None:
+            run = "cp " + cached + " " + log
 
         # command(s) to exit if there were any overlaps
         checks = [
@@ -69,26 +168,43 @@ class SimGenerator:
         # return full command
         return run + "\n" + check
 
-    def MakeCommand(self, tag, label, path, steer, inType): 
+    def MakeCommand(self, tag, label, path, steer, inType, shard = None, nEvents = None, inFiles = None): 
         """MakeCommand
 
         Generates command to run sim executable
         (npsim, ddsim) on provided inputs for
         a given tag.
 
+        If a shard is provided, the command only
+        generates the events of that shard with
+        its own random seed, and writes them to
+        the shard's own output file. Otherwise,
+        if a no. of events is provided (e.g. the
+        fidelity of the trial), only that many
+        events are generated.
+
+        If input files are provided (e.g. local
+        copies of remote files), they're read instead
+        of the input files of the steering file.
+
         Args:
-          tag:    the tag associated with the current trial
-          label:  the label associated with the input
-          path:   the path to the input steering file
-          steer:  the input steering file
-          inType: the type of input (e.g. gun, gps, hepmc, etc.)
+          tag:     the tag associated with the current trial
+          label:   the label associated with the input
+          path:    the path to the input steering file
+          steer:   the input steering file
+          inType:  the type of input (e.g. gun, gps, hepmc, etc.)
+          shard:   optional tuple of (index, no. of events to skip, no. of events)
+          nEvents: optional no. of events to generate if not sharding
+          inFiles: optional list of input files to read
         Returns:
           command to be run
         """
 
         # construct output name
+        index   = None if shard is None else shard[0]
         steeTag = FileManager.ConvertSteeringToTag(steer)
-        outFile = FileManager.MakeOutName("sim", tag, label, steeTag)
+        shaTag  = FileManager.MakeShardTag(steeTag, index)
+        outFile = FileManager.MakeOutName("sim", tag, label, shaTag)
 
         # make sure output directory
         # exists for trial
@@ -100,19 +216,43 @@ class SimGenerator:
         #       has already been set to the trial's config file
         compact = " --compactFile $DETECTOR_PATH/$DETECTOR_CONFIG.xml" 
         steerer = " --steeringFile " + path + "/" + steer
+        if inFiles:
+            steerer = steerer + " --inputFiles " + " ".join(inFiles)
         output  = " --outputFile " + outDir + "/" + outFile
 
         otherArgs= ""
-        if "sim_args" in self.cfgRun["sim_args"]:
+        if "sim_args" in self.cfgRun:
             for arg in self.cfgRun["sim_args"]:
                 otherArgs = otherArgs + " " + arg
 
+        # if running a shard, give it its own seed
+        if shard is not None:
+            seed = self.cfgRun.get("sim_seed", 1) + shard[0]
+            otherArgs = otherArgs + " --random.seed " + str(seed)
+
+        # and restrict to its events (or to the no.
+        # of events requested)
+        #   --> n.b. gps events are set by the macro,
+        #       so a shard gets its own copy of it
+        macFile = path + "/" + steer.replace(".py", ".mac")
+        events  = shard
+        if shard is None and nEvents is not None:
+            events = (None, 0, nEvents)
+        if events is not None:
+            index, skip, count = events
+            if inType == "gps":
+                macFile = self.MakeShardMacro(tag, label, path, steer, events)
+            else:
+                otherArgs = otherArgs + " --numberOfEvents " + str(count)
+            if inType not in ["gps", "gun"]:
+                otherArgs = otherArgs + " --skipNEvents " + str(skip)
+
         # construct most of command
         command = self.cfgRun["sim_exec"] + compact + steerer + otherArgs
         if inType == "gun":
             command = command + " -G "
         elif inType == "gps":
-            macro   = " --macroFile " + path + "/" + steer.replace(".py", ".mac")
+            macro   = " --macroFile " + macFile
             command = command + " --enableG4GPS "
             command = command + macro
 
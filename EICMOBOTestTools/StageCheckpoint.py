@@ -0,0 +1,174 @@
+# =============================================================================
+## @file   StageCheckpoint.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Class to mark the stages of a trial as
+#    complete, so a retried trial can pick up where
+#    it left off.
+# =============================================================================
+
+import hashlib
+import json
+import os
+
+from EICMOBOTestTools import ConfigParser
+from EICMOBOTestTools import FileManager
+
+class StageCheckpoint:
+    """StageCheckpoint
+
+    A class to record the completion of each stage
+    (and so of each shard) of a trial in the trial's
+    output directory, along with checksums of the
+    files it produced. When a trial is retried, a
+    stage is only run again if its command or the
+    stages it depends on changed, or if any of its
+    outputs is missing or no longer matches its
+    checksum.
+    """
+
+    def __init__(self, run):
+        """constructor accepting arguments
+
+        Args:
+          run: runtime configuration file
+        """
+        self.cfgRun = ConfigParser.ReadJsonFile(run)
+
+    def GetMarkerPath(self, tag, name):
+        """GetMarkerPath
+
+        Returns the path to the completion
+        marker of a stage.
+
+        Args:
+          tag:  the tag associated with the trial
+          name: name of the stage
+        Returns:
+          path to the marker
+        """
+        return self.cfgRun["out_path"] + "/" + tag + "/checkpoints/" + name + ".json"
+
+    def __HashFile(self, path):
+        """HashFile
+
+        Computes the checksum of a file, reading
+        it in chunks so large outputs aren't
+        loaded into memory all at once.
+
+        Args:
+          path: path to the file
+        Returns:
+          checksum of the file
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda : file.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def __HashStage(self, node, preamble, inputs):
+        """HashStage
+
+        Computes the hash of what a stage runs:
+        its command, the commands run before it,
+        and the digests of the stages it runs on.
+
+        Args:
+          node:     the stage, as stored in the trial graph
+          preamble: list of commands to run before the stage
+          inputs:   dictionary of stages depended on and their digests
+        Returns:
+          hash of the stage
+        """
+        stage = {
+            "command"  : node["command"],
+            "preamble" : preamble,
+            "inputs"   : inputs
+        }
+        return hashlib.sha256(json.dumps(stage, sort_keys = True).encode()).hexdigest()
+
+    def Lookup(self, tag, name, node, preamble, inputs):
+        """Lookup
+
+        Checks if a stage has already completed:
+        its marker must exist, be for the same
+        stage run on the same inputs, and every
+        output it lists must be intact.
+
+        Args:
+          tag:      the tag associated with the trial
+          name:     name of the stage
+          node:     the stage, as stored in the trial graph
+          preamble: list of commands to run before the stage
+          inputs:   dictionary of stages depended on and their digests
+        Returns:
+          digest of the outputs of the stage, or None
+          if it still needs to be run
+        """
+        marker = self.GetMarkerPath(tag, name)
+        if not os.path.isfile(marker):
+            return None
+
+        try:
+            with open(marker, 'r') as mark:
+                entry = json.load(mark)
+        except ValueError:
+            return None
+
+        if entry.get("stage") != self.__HashStage(node, preamble, inputs):
+            return None
+        for path, checksum in entry["outputs"].items():
+            if not os.path.isfile(path) or self.__HashFile(path) != checksum:
+                return None
+        return entry["digest"]
+
+    def Store(self, tag, name, node, preamble, inputs):
+        """Store
+
+        Marks a stage as complete, recording the
+        checksum of each of its outputs. The marker
+        is written to a temporary file and then
+        moved into place, so it's never seen
+        half-written. If an output is missing, no
+        marker is written.
+
+        Args:
+          tag:      the tag associated with the trial
+          name:     name of the stage
+          node:     the stage, as stored in the trial graph
+          preamble: list of commands to run before the stage
+          inputs:   dictionary of stages depended on and their digests
+        Returns:
+          digest of the outputs of the stage, or None
+          if it couldn't be marked as complete
+        """
+        outputs = dict()
+        for path in node.get("outputs", list()):
+            if not os.path.isfile(path):
+                print(f"WARNING: stage '{name}' of trial {tag} didn't produce {path}")
+                return None
+            outputs[path] = self.__HashFile(path)
+
+        # the digest only depends on what was produced,
+        # so that stages downstream of a stage which
+        # is rerun with the same result aren't rerun
+        digest = hashlib.sha256(json.dumps(outputs, sort_keys = True).encode()).hexdigest()
+        entry  = {
+            "stage"   : self.__HashStage(node, preamble, inputs),
+            "inputs"  : inputs,
+            "outputs" : outputs,
+            "digest"  : digest
+        }
+
+        marker = self.GetMarkerPath(tag, name)
+        path, file = FileManager.SplitPathAndFile(marker)
+        FileManager.MakeDir(path)
+        temp = marker + "." + str(os.getpid()) + ".tmp"
+        with open(temp, 'w') as mark:
+            json.dump(entry, mark, indent = 4)
+        os.replace(temp, marker)
+        return digest
+
+# end =========================================================================
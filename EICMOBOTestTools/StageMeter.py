@@ -0,0 +1,255 @@
+# =============================================================================
+## @file   StageMeter.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Module to measure the time and resources
+#    each stage of a trial uses, and to collect and
+#    aggregate the measurements.
+#
+#  This module only uses the standard library, so
+#  that it can also be run as a script (e.g. within
+#  eic-shell) to wrap the command of a stage, or to
+#  collect the records of a trial:
+#
+#    python3 StageMeter.py -n <stage> -o <record> -- <command>
+#    python3 StageMeter.py -c <directory> -o <record> [-t <tag>]
+# =============================================================================
+
+import argparse
+import glob
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+# functions exposed by the package
+__all__ = [
+    "AggregateRecords",
+    "CollectRecords",
+    "MakeCollectCommand",
+    "MakeMeasuredCommand",
+    "MeasureCommand",
+    "ReadIO",
+    "WriteRecord"
+]
+
+# fields of /proc/<pid>/io to record
+IOFields = ["rchar", "wchar", "read_bytes", "write_bytes"]
+
+def ReadIO():
+    """ReadIO
+
+    Reads the I/O counters of the current
+    process, which include those of every
+    child process it has waited for.
+
+    Returns:
+      dictionary of counters, or None if they
+      aren't available (e.g. not on Linux)
+    """
+    try:
+        with open("/proc/self/io", 'r') as io:
+            counters = dict(line.split(":", 1) for line in io if ":" in line)
+    except OSError:
+        return None
+    return {field : int(counters[field]) for field in IOFields if field in counters}
+
+def WriteRecord(record, output):
+    """WriteRecord
+
+    Writes a record as JSON, atomically
+    so that it's never read half-written.
+
+    Args:
+      record: dictionary to write
+      output: path to the record to create
+    """
+    path = os.path.dirname(output)
+    if path:
+        os.makedirs(path, exist_ok = True)
+    with open(output + ".tmp", 'w') as out:
+        json.dump(record, out, indent = 4)
+    os.replace(output + ".tmp", output)
+
+def MeasureCommand(command, name, output):
+    """MeasureCommand
+
+    Runs a command in bash, exiting at the first
+    line which fails (as in a trial script), and
+    records its exit code, wall time, CPU time
+    (user and system), peak resident memory, and
+    bytes read and written (including those of
+    every process it started) as JSON.
+
+    Args:
+      command: the command to be run
+      name:    name of the stage
+      output:  path to the record to create
+    Returns:
+      exit code of the command
+    """
+    ioStart = ReadIO()
+    start   = time.time()
+    process = subprocess.Popen(["bash", "-e", "-c", command])
+    _, status, usage = os.wait4(process.pid, 0)
+    wall    = time.time() - start
+    ioStop  = ReadIO()
+
+    code   = os.waitstatus_to_exitcode(status)
+    record = {
+        "stage"    : name,
+        "code"     : code,
+        "start"    : start,
+        "wall"     : wall,
+        "cpu_user" : usage.ru_utime,
+        "cpu_sys"  : usage.ru_stime,
+        "max_rss"  : usage.ru_maxrss * 1024,
+        "io"       : None
+    }
+    if ioStart is not None and ioStop is not None:
+        record["io"] = {field : ioStop[field] - ioStart[field] for field in ioStop}
+
+    WriteRecord(record, output)
+    return code
+
+def MakeMeasuredCommand(command, name, output):
+    """MakeMeasuredCommand
+
+    Wraps a command so that it's run (and
+    measured) by this module.
+
+    Args:
+      command: the command to be wrapped
+      name:    name of the stage
+      output:  path to the record to create
+    Returns:
+      wrapped command
+    """
+    meter = os.path.realpath(__file__)
+    return "python3 " + meter + " -n " + name + " -o " + output + " -- " + shlex.quote(command)
+
+def MakeCollectCommand(path, output, tag = None):
+    """MakeCollectCommand
+
+    Makes a command to collect the records of
+    every stage of a trial (see CollectRecords),
+    e.g. for when the trial runs as a script.
+
+    Args:
+      path:   directory holding the records of each stage
+      output: path to the record of the trial to create
+      tag:    optional tag of the trial
+    Returns:
+      command to be run
+    """
+    meter   = os.path.realpath(__file__)
+    command = "python3 " + meter + " -c " + path + " -o " + output
+    if tag is not None:
+        command = command + " -t " + tag
+    return command
+
+def CollectRecords(path, output, tag = None):
+    """CollectRecords
+
+    Collects the records of every stage of a
+    trial into one record of the trial.
+
+    Args:
+      path:   directory holding the records of each stage
+      output: path to the record of the trial to create
+      tag:    optional tag of the trial
+    Returns:
+      the record of the trial
+    """
+    stages = dict()
+    for file in sorted(glob.glob(path + "/*.json")):
+        try:
+            with open(file, 'r') as rec:
+                record = json.load(rec)
+        except ValueError:
+            continue
+        stages[record["stage"]] = record
+
+    trial = {
+        "tag"    : tag,
+        "wall"   : None,
+        "stages" : stages
+    }
+    if stages:
+        begin = min(rec["start"] for rec in stages.values())
+        end   = max(rec["start"] + rec["wall"] for rec in stages.values())
+        trial["wall"] = end - begin
+
+    WriteRecord(trial, output)
+    return trial
+
+def AggregateRecords(files):
+    """AggregateRecords
+
+    Aggregates the records of many trials (e.g.
+    of a campaign) by kind of stage, i.e. the
+    part of the stage name before the first
+    underscore ("sim", "rec", "merge", etc.).
+
+    Args:
+      files: list of paths to records of trials
+    Returns:
+      dictionary of kinds of stages and their no. of
+      runs, no. of failures, total and mean wall and
+      CPU time, peak memory, and total bytes read and
+      written
+    """
+    summary = dict()
+    for file in files:
+        with open(file, 'r') as rec:
+            trial = json.load(rec)
+        for name, record in trial["stages"].items():
+            kind = name.split("_")[0]
+            agg  = summary.setdefault(kind, {
+                "runs"        : 0,
+                "failed"      : 0,
+                "wall"        : 0.0,
+                "cpu"         : 0.0,
+                "max_rss"     : 0,
+                "read_bytes"  : 0,
+                "write_bytes" : 0
+            })
+            agg["runs"]    += 1
+            agg["failed"]  += record["code"] != 0
+            agg["wall"]    += record["wall"]
+            agg["cpu"]     += record["cpu_user"] + record["cpu_sys"]
+            agg["max_rss"]  = max(agg["max_rss"], record["max_rss"])
+            for field in ["read_bytes", "write_bytes"]:
+                agg[field] += (record["io"] or dict()).get(field, 0)
+
+    for agg in summary.values():
+        agg["mean_wall"] = agg["wall"] / agg["runs"]
+        agg["mean_cpu"]  = agg["cpu"] / agg["runs"]
+    return summary
+
+# main ========================================================================
+
+if __name__ == "__main__":
+
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--name", help = "Name of stage to measure", type = str)
+    parser.add_argument("-c", "--collect", help = "Directory of stage records to collect", type = str)
+    parser.add_argument("-t", "--tag", help = "Tag of trial to collect", type = str)
+    parser.add_argument("-o", "--output", help = "Record to create", type = str, required = True)
+    parser.add_argument("command", help = "Command to measure", type = str, nargs = "?")
+
+    # either collect records of a trial, or
+    # run and measure a command
+    args = parser.parse_args()
+    if args.collect is not None:
+        CollectRecords(args.collect, args.output, args.tag)
+        sys.exit(0)
+    if args.name is None or args.command is None:
+        parser.error("a stage name and command are needed to measure a stage")
+    sys.exit(MeasureCommand(args.command, args.name, args.output))
+
+# end =========================================================================
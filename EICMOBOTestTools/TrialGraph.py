@@ -0,0 +1,218 @@
+# =============================================================================
+## @file   TrialGraph.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Class to collect the stages of a trial as a
+#    graph of commands and their dependencies, and to
+#    run independent stages concurrently.
+# =============================================================================
+
+import concurrent.futures as cf
+import os
+
+from EICMOBOTestTools import FileManager
+
+class TrialGraph:
+    """TrialGraph
+
+    A class to collect the stages (nodes) of a trial
+    and the stages each depends on, and to run them
+    either concurrently within a budget of cores or
+    serially as a single script.
+    """
+
+    # exit code given to stages which weren't run
+    # because the trial was stopped early
+    Stopped = "stopped"
+
+    def __init__(self):
+        """default constructor
+
+        Nodes are stored in the order they're
+        added, which is always a valid order to
+        run them in.
+        """
+        self.nodes = dict()
+
+    def AddNode(self, name, command, deps = None, cores = 1, stoppable = False, outputs = None, memory = 0):
+        """AddNode
+
+        Adds a stage to the graph. Any stage it
+        depends on must already have been added.
+
+        Args:
+          name:      unique name of the stage
+          command:   the command to be run
+          deps:      optional list of names of stages to run first
+          cores:     no. of cores the stage uses
+          stoppable: whether the stage can be left out if the trial stops early
+          outputs:   optional list of paths to the files the stage produces
+          memory:    memory the stage uses (in MB)
+        Returns:
+          name of the stage
+        """
+        deps = list() if deps is None else list(deps)
+        if name in self.nodes:
+            raise ValueError(f"Stage '{name}' was already added!")
+        for dep in deps:
+            if dep not in self.nodes:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'!")
+
+        self.nodes[name] = {
+            "command"   : command,
+            "deps"      : deps,
+            "cores"     : cores,
+            "memory"    : memory,
+            "stoppable" : stoppable,
+            "outputs"   : list() if outputs is None else list(outputs)
+        }
+        return name
+
+    def GetLevels(self):
+        """GetLevels
+
+        Groups stages into levels, such that each
+        stage only depends on stages in earlier
+        levels.
+
+        Returns:
+          list of lists of stage names
+        """
+        depth  = dict()
+        levels = list()
+        for name, node in self.nodes.items():
+            depth[name] = 1 + max([depth[dep] for dep in node["deps"]], default = -1)
+            if depth[name] == len(levels):
+                levels.append(list())
+            levels[depth[name]].append(name)
+        return levels
+
+    def MakeScript(self, path, preamble = None):
+        """MakeScript
+
+        Writes the graph out as a single script, running
+        each level of stages after the last and the
+        stages within a level concurrently.
+
+        Args:
+          path:     path to the script to create
+          preamble: optional list of commands to run first
+        Returns:
+          path to the script created
+        """
+        with open(path, 'w') as script:
+            script.write("#!/bin/bash\n\n")
+            script.write("set -e\n\n")
+            for command in (preamble or list()):
+                script.write(command + "\n\n")
+            for level in self.GetLevels():
+                commands = [self.nodes[name]["command"] for name in level]
+                if len(commands) > 1:
+                    script.write(FileManager.MakeParallelCommand(commands) + "\n\n")
+                else:
+                    script.write(commands[0] + "\n\n")
+
+        # make sure script can be run
+        os.chmod(path, 0o777)
+        return path
+
+    def Run(self, runner, cores = 1, monitor = None, memory = None):
+        """Run
+
+        Runs every stage once all of the stages it
+        depends on have succeeded, running as many
+        at once as fit within the budget of cores
+        (and of memory, if provided). Stages which
+        are ready are packed into the free cores
+        largest first. If a stage fails, only stages
+        downstream of it are skipped.
+
+        If a monitor is provided, it's called after
+        each stage succeeds and can stop the trial
+        early: stoppable stages which haven't started
+        yet are then left out (marked as Stopped),
+        and the remaining stages run on the output
+        of the stages which did.
+
+        Args:
+          runner:  callable taking a stage name and node, and returning its exit code
+          cores:   total no. of cores stages can use at once (at least 1)
+          monitor: optional callable taking a stage name and the exit codes so
+                   far, and returning whether to stop the trial early
+          memory:  optional total memory (in MB) stages can use at once
+        Returns:
+          dictionary of stage names and their exit codes,
+          with None for skipped stages and Stopped for
+          stages left out by stopping early
+        """
+        if cores < 1:
+            raise ValueError(f"Stages need at least 1 core to run, but {cores} were given!")
+
+        codes   = dict()
+        waiting = list(self.nodes)
+        running = dict()
+        free    = cores
+        freeMem = memory
+        stopped = False
+        with cf.ThreadPoolExecutor(max_workers = max(1, len(self.nodes))) as pool:
+            while waiting or running:
+
+                # skip any stage with a failed or skipped dependency
+                for name in list(waiting):
+                    deps = self.nodes[name]["deps"]
+                    if any(dep in codes and codes[dep] not in (0, TrialGraph.Stopped) for dep in deps):
+                        codes[name] = None
+                        waiting.remove(name)
+
+                # if stopping early, leave out stoppable stages
+                # and stages left with nothing to run on
+                if stopped:
+                    for name in list(waiting):
+                        deps = self.nodes[name]["deps"]
+                        left = deps and all(codes.get(dep) == TrialGraph.Stopped for dep in deps)
+                        if self.nodes[name]["stoppable"] or left:
+                            codes[name] = TrialGraph.Stopped
+                            waiting.remove(name)
+
+                # launch stages which are ready and fit in the
+                # budget, largest first (a stage needing more
+                # than the whole budget is run once nothing
+                # else is)
+                ready = [
+                    name for name in waiting
+                    if all(codes.get(dep) in (0, TrialGraph.Stopped) for dep in self.nodes[name]["deps"])
+                ]
+                ready.sort(key = lambda name : (self.nodes[name]["cores"], self.nodes[name]["memory"]), reverse = True)
+                for name in ready:
+                    node   = self.nodes[name]
+                    need   = min(node["cores"], cores)
+                    fits   = freeMem is None or node["memory"] <= freeMem or not running
+                    if need <= free and fits:
+                        running[pool.submit(runner, name, node)] = name
+                        waiting.remove(name)
+                        free -= need
+                        if freeMem is not None:
+                            freeMem -= node["memory"]
+
+                # wait for a stage to finish
+                if not running:
+                    continue
+                done, pending = cf.wait(running, return_when = cf.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        codes[name] = future.result()
+                    except Exception as error:
+                        print(f"WARNING: stage '{name}' could not be run ({error})")
+                        codes[name] = 1
+                    free += min(self.nodes[name]["cores"], cores)
+                    if freeMem is not None:
+                        freeMem += self.nodes[name]["memory"]
+
+                    # check if trial should stop early
+                    if monitor is not None and not stopped and codes[name] == 0:
+                        stopped = monitor(name, codes)
+        return codes
+
+# end =========================================================================
@@ -11,20 +11,37 @@ import datetime
 import pathlib
 import re
 import os
+import shlex
 import subprocess
+import time
+import uuid
 
 from EICMOBOTestTools import AnaGenerator
 from EICMOBOTestTools import ConfigParser
+from EICMOBOTestTools import CorePool
 from EICMOBOTestTools import FileManager
 from EICMOBOTestTools import GeometryEditor
+from EICMOBOTestTools import InputStager
+from EICMOBOTestTools import OverlapCache
 from EICMOBOTestTools import RecGenerator
+from EICMOBOTestTools import ResourceModel
+from EICMOBOTestTools import SimCache
 from EICMOBOTestTools import SimGenerator
+from EICMOBOTestTools import StageCheckpoint
+from EICMOBOTestTools import StageMeter
+from EICMOBOTestTools import TrialGraph
 
 class TrialManager:
     """TrialManager
 
     A class to generate commands and scripts to be run
     for a given trial.
+
+    Planning a trial doesn't change the manager: every
+    trial's geometry, arguments, stages, and analysis
+    jobs are returned together as a plan. This way, one
+    manager (or several) can plan and run many trials
+    on threads within the same process.
     """
 
     def __init__(self, run, par, ana, tag = None):
@@ -32,7 +49,9 @@ class TrialManager:
 
         Note that if no tag is provided, then
         one will be autogenerated based on
-        start time.
+        start time. This is the tag used for
+        trials planned without a tag of their
+        own.
 
         Args:
           run: runtime configuration file
@@ -40,59 +59,81 @@ class TrialManager:
           ana: objectives configuration file
           tag: tag to use for trial
         """
-        self.cfgRun  = ConfigParser.ReadJsonFile(run)
-        self.cfgPar  = ConfigParser.ReadJsonFile(par)
-        self.cfgAna  = ConfigParser.ReadJsonFile(ana)
-        self.geoEdit = GeometryEditor(run)
-        self.simGen  = SimGenerator(run)
-        self.recGen  = RecGenerator(run)
-        self.anaGen  = AnaGenerator(run, ana)
-        self.tag     = self.__MakeTimeTag() if tag == None else tag
+        self.cfgRun   = ConfigParser.ReadJsonFile(run)
+        self.cfgPar   = ConfigParser.ReadJsonFile(par)
+        self.cfgAna   = ConfigParser.ReadJsonFile(ana)
+        self.geoEdit  = GeometryEditor(run)
+        self.geoCache = OverlapCache(run)
+        self.simCache = SimCache(run)
+        self.simGen   = SimGenerator(run)
+        self.stager   = InputStager(run)
+        self.recGen   = RecGenerator(run)
+        self.anaGen   = AnaGenerator(run, ana)
+        self.checkpt  = StageCheckpoint(run)
+        self.resModel = ResourceModel(run)
+        self.corePool = CorePool(run)
+        self.tag      = self.__MakeTimeTag() if tag == None else tag
 
     def __MakeTimeTag(self):
        """MakeTimeTag
 
-       Generates a tag based on current time.
+       Generates a tag based on current time,
+       with a random suffix so that trials
+       started at the same time (e.g. on
+       different threads) don't collide.
 
        Returns:
          generated tag
        """
        time = str(datetime.datetime.now())
        time = re.sub(r'[.\-:\ ]', '', time)
-       tag = f"AID2ETrial{time}"
+       tag = f"AID2ETrial{time}{uuid.uuid4().hex[:6]}"
        return tag
 
-    def __DoGeometryEdits(self, params):
+    def __DoGeometryEdits(self, params, tag):
         """DoGeometryEdits
 
-        Generate new geometry files.
+        Generate new geometry files in the
+        trial's overlay.
 
         Args:
           params: dictionary of parameter names and current values (eg. from Ax)
+          tag:    the tag associated with the trial
         Returns:
-          name of new epic config file
+          tuple of detector path and name of epic config file to use
         """
-        trialConfig = ""
+        edits = list()
         for par, value in params.items():
             cfg = self.cfgPar["parameters"][par]
             if cfg["stage"] != "sim":
                 continue
             else:
-                self.geoEdit.EditCompact(cfg, value, self.tag)
-                self.geoEdit.EditRelatedFiles(cfg, self.tag)
+                edits.append((cfg, value))
+
+        # apply all edits with one write per compact
+        # file, and then update files related to each
+        # edited compact file once
+        self.geoEdit.EditCompacts(edits, tag)
+        related = dict()
+        for cfg, value in edits:
+            related.setdefault(cfg["compact"], cfg)
+        for cfg in related.values():
+            self.geoEdit.EditRelatedFiles(cfg, tag)
 
-        # return name of new config file
-        return trialConfig
+        # return path to overlay and name of config file
+        return self.geoEdit.GetTrialPath(tag), self.cfgRun["det_config"]
 
-    def __SetRecoArgs(self, params):
-        """SetRecoArgs
+    def __MakeRecoArgs(self, params):
+        """MakeRecoArgs
 
-        Set updated reconstruction arguments.
+        Make updated reconstruction arguments.
 
         Args:
           params: dictionary of parameter names and current values (eg. from Ax)
+        Returns:
+          dictionary of argument paths and their values
         """
-        self.recGen.ClearArgs()
+        recParams = list()
         for par, value in params.items():
 
             # ignore parameters from earlier stages
@@ -100,37 +141,171 @@ class TrialManager:
             if cfg["stage"] != "rec":
                 continue
             else:
-                self.recGen.AddParamToArgs(cfg, value)
+                recParams.append((cfg, value))
+        return self.recGen.MakeArgs(recParams)
 
-    def MakeTrialScript(self, params):
-        """MakeTrialScript
+    def __AddStage(self, graph, name, command, deps = None, flags = True, **kwargs):
+        """AddStage
 
-        Generate needed geometry files and script to run
-        full sequence of trial.
+        Adds a stage to the graph of a trial with
+        the cores and memory its kind of stage needs
+        (see ResourceModel), adding its flags to the
+        command.
 
         Args:
-          params: dictionary of parameter names and current values (eg. from Ax)
+          graph:   graph of the trial
+          name:    unique name of the stage
+          command: the command to be run
+          deps:    optional list of names of stages to run first
+          flags:   whether to add the flags of the stage
+          kwargs:  any other options of the stage (see TrialGraph.AddNode)
         Returns:
-          tuple of path to script and a dictionary of output files
-          associated with each objective
+          name of the stage
+        """
+        stage = self.resModel.GetStage(name)
+        if flags:
+            command = self.resModel.AddFlags(command, stage)
+        return graph.AddNode(name,
+                             command,
+                             deps,
+                             cores  = self.resModel.GetCores(stage),
+                             memory = self.resModel.GetMemory(stage),
+                             **kwargs)
+
+    def GetNeededInputs(self):
+        """GetNeededInputs
+
+        Works out which inputs are needed by working
+        backwards from the objectives, and sorts the
+        objectives needing each into those run by
+        their own rule and those run by the driver.
+
+        Returns:
+          dictionary of needed inputs and a tuple of the
+          lists of ruled and driven objectives needing each
         """
+        needed = dict()
+        for anaKey, anaCfg in self.cfgAna["objectives"].items():
+
+            # skip if objective is not an analysis
+            if anaCfg["stage"] != "ana":
+                continue
 
-        # step 1: edit geometry files, set
-        # reconstruction parameters
-        self.__DoGeometryEdits(params)
-        self.__SetRecoArgs(params)
+            # make sure input is actually available
+            inKey = anaCfg["input"]
+            if inKey not in self.cfgRun["sim_input"]:
+                raise ValueError(f"Objective '{anaKey}' needs unknown input '{inKey}'!")
+
+            # defer analyses run by the driver so
+            # they share a single pass over input
+            ruled, driven = needed.setdefault(inKey, (list(), list()))
+            if self.anaGen.UsesDriver(anaKey):
+                driven.append(anaKey)
+            else:
+                ruled.append(anaKey)
+        return needed
+
+    def MakeTrialPlan(self, params, inProcess = False, tag = None, nEvents = None, base = None):
+        """MakeTrialPlan
+
+        Generate needed geometry files and the plan of a
+        full trial. The plan is a dictionary holding the
+        trial's tag ("tag") and parameters ("params"),
+        the graph of stages making up the trial ("graph"):
+        the overlap check, then simulation and
+        reconstruction of each input, and then merging
+        and analyses; the commands every stage needs to
+        run first ("preamble"), the output files of each
+        objective ("outputs"), the inputs which no
+        objective needs and so are skipped ("skipped"),
+        and the key of the trial's geometry in the
+        overlap cache and whether it needs to be checked
+        ("geo_key", "geo_new"), the key in the simulation
+        cache and output of each simulation stage which
+        needs to be run ("sim_new"), and the no. of events
+        the trial is capped at ("events").
+
+        If analyses run by the driver are to be run
+        in-process, they are left out of the graph
+        and collected in the plan's "jobs" instead, with
+        one entry per input holding the input label
+        ("input"), merged sim and rec files ("sim",
+        "rec"), output file of each objective
+        ("outputs"), and the stages which need to
+        succeed first ("deps"). If the driver maps
+        each shard to partial results, the merged
+        files are replaced by a glob pattern matching
+        the partial files of each objective
+        ("partials").
+
+        Nothing is stored on the manager, so trials
+        can be planned concurrently.
+
+        If the same simulation (i.e. the same geometry,
+        simulation parameters, steering, and events) was
+        already run by an earlier trial, its output is
+        linked from the simulation cache instead, so a
+        trial which only changes reconstruction
+        parameters starts at reconstruction.
+
+        If a no. of events is provided (e.g. the
+        fidelity of a multi-fidelity trial), no more
+        than that many events are simulated from each
+        steering file.
+
+        Inputs with "stage_input" set have their remote
+        input files staged into a local cache by a stage
+        which runs alongside the overlap check (see
+        InputStager), and each shard only reads its own
+        range of events from the local copy.
+
+        Unless "measure_stages" is turned off in the run
+        config, each stage records its wall time, CPU
+        time, peak memory, and I/O in the trial's run
+        directory (see StageMeter and CollectStats).
+
+        If the tag of an earlier trial with the same
+        simulation parameters (and no. of events) is
+        provided via base, e.g. for the inner trials of
+        a nested optimization, the trial uses its
+        geometry and links its simulation output rather
+        than editing, checking, and simulating again,
+        so only reconstruction and analyses are run.
+
+        Args:
+          params:    dictionary of parameter names and current values (eg. from Ax)
+          inProcess: leave driven analyses out of the graph
+          tag:       optional tag of the trial (the manager's tag if not provided)
+          nEvents:   optional no. of events to simulate per steering file
+          base:      optional tag of a trial to reuse the geometry and simulation of
+        Returns:
+          the plan of the trial
+        """
+        tag = self.tag if tag is None else tag
+        if base is not None and not os.path.isdir(self.cfgRun["out_path"] + "/" + base):
+            print(f"WARNING: output of trial {base} not found, trial {tag} will run its own simulation")
+            base = None
+
+        # step 1: edit geometry files (or reuse those
+        # of the base trial), make reconstruction
+        # arguments
+        if base is None:
+            trialPath, trialConfig = self.__DoGeometryEdits(params, tag)
+        else:
+            trialPath, trialConfig = self.geoEdit.GetTrialPath(base), self.cfgRun["det_config"]
+        recArgs   = self.__MakeRecoArgs(params)
+        simParams = {
+            par : value for par, value in params.items()
+            if self.cfgPar["parameters"][par]["stage"] == "sim"
+        }
 
         # create commands to set detector path, config
         setDetInstall, setDetConfig = FileManager.MakeDetSetCommands(
             self.cfgRun["epic_setup"],
-            self.cfgRun["det_config"]
-        )
-        commands = [setDetInstall, setDetConfig]
-
-        # check for overlaps
-        commands.append(
-            self.simGen.MakeOverlapCheckCommand(self.tag)
+            trialConfig,
+            trialPath
         )
+        preamble = [setDetInstall, setDetConfig]
 
         # if an eicrecon installation is specified,
         # make command to set that
@@ -138,17 +313,65 @@ class TrialManager:
             setRecInstall = FileManager.MakeRecSetCommands(
                 self.cfgRun["eicrecon_setup"]
             )
-            commands.append(setRecInstall)
+            preamble.append(setRecInstall)
+
+        # check for overlaps before anything else,
+        # reusing the result of an earlier check of
+        # the same geometry if there is one
+        #   --> a base trial has already been
+        #       checked, so there's nothing to do
+        outDir = self.cfgRun["out_path"] + "/" + tag
+        graph  = TrialGraph()
+        geoKey = None
+        geoNew = False
+        doGeo  = list()
+        if base is None:
+            geoKey = self.geoCache.MakeKey(trialPath, trialConfig)
+            geoLog = self.geoCache.Lookup(geoKey)
+            geoNew = geoLog is None
+            if geoLog is not None:
+                print(f"INFO: trial {tag} reusing overlap check {geoLog}")
+            doGeo = [
+                self.__AddStage(
+                    graph,
+                    "geo",
+                    self.simGen.MakeOverlapCheckCommand(tag, geoLog),
+                    flags   = False,
+                    outputs = [outDir + "/" + FileManager.MakeOutName("geo", tag)]
+                )
+            ]
 
         # step 2: generate relevant simulation,
-        # reconstruction commands
+        # reconstruction stages for only the
+        # inputs some objective needs
         outFiles = dict()
+        anaJobs  = list()
+        simNew   = dict()
+        needed   = self.GetNeededInputs()
+        skipped  = [inKey for inKey in self.cfgRun["sim_input"] if inKey not in needed]
+        if skipped:
+            print(f"INFO: trial {tag} skipping inputs not needed by any objective: {', '.join(skipped)}")
+
         for inKey, inCfg in self.cfgRun["sim_input"].items():
 
+            # find objectives requiring current input,
+            # and skip input if there are none
+            if inKey not in needed:
+                continue
+            ruled, driven = needed[inKey]
+
+            # if mapping, driven analyses are run on
+            # each set of output as soon as it's
+            # reconstructed
+            mapped = driven if self.anaGen.UsesMapReduce() else list()
+
             # if there are multiple steering files,
             # loop over each
-            inLoc  = inCfg["location"]
-            inType = inCfg["type"]
+            inLoc   = inCfg["location"]
+            inType  = inCfg["type"]
+            doSims  = list()
+            doRecs  = list()
+            doMaps  = list()
             for inSteer in os.listdir(inLoc):
 
                 # only consider steering files
@@ -157,102 +380,511 @@ class TrialManager:
                 if not isSteer:
                     continue
 
-                # generate command to run simulation
-                commands.append(
-                    self.simGen.MakeCommand(
-                        self.tag,
-                        inKey,
-                        inLoc,
-                        inSteer,
-                        inType
+                # if needed, stage remote input files
+                # locally (once across trials) in a stage
+                # the simulation waits for
+                inFiles  = None
+                doStage  = None
+                stageCmd = None
+                if inCfg.get("stage_input", False) and base is None:
+                    stageCmd, inFiles = self.stager.MakeStageCommand(inLoc, inSteer)
+
+                # if capped, simulate no more events than
+                # the steering file would
+                inEvents = self.simGen.GetNEvents(inLoc, inSteer, inType)
+                if nEvents is not None:
+                    inEvents = nEvents if inEvents is None else min(nEvents, inEvents)
+
+                # if sharding, split input into event ranges
+                # which can each be simulated and reconstructed
+                # independently
+                nShards = inCfg.get("shards", 1)
+                shards  = [None]
+                if nShards > 1 and inEvents:
+                    shards = self.simGen.MakeShards(inEvents, nShards)
+
+                for shard in shards:
+                    index  = None if shard is None else shard[0]
+                    shaTag = FileManager.MakeShardTag(
+                        FileManager.ConvertSteeringToTag(inSteer),
+                        index
                     )
-                )
-
-                # now generate command to run reconstruction
-                commands.append(
-                    self.recGen.MakeCommand(
-                        self.tag,
-                        inKey,
-                        inSteer
+                    node   = inKey + "_" + shaTag
+
+                    # generate stage to run simulation, or to
+                    # link its output if it's been run before
+                    # (or if the base trial ran it)
+                    simEvents = None if nEvents is None else inEvents
+                    simOut    = outDir + "/" + FileManager.MakeOutName("sim", tag, inKey, shaTag)
+                    if base is not None:
+                        baseOut = self.cfgRun["out_path"] + "/" + base + "/" + FileManager.MakeOutName("sim", base, inKey, shaTag)
+                        doSim   = graph.AddNode(
+                            "sim_" + node,
+                            self.simCache.MakeLinkCommand(baseOut, simOut),
+                            stoppable = True,
+                            outputs   = [simOut]
+                        )
+                    else:
+                        simCmd  = self.simGen.MakeCommand(tag,
+                                                          inKey,
+                                                          inLoc,
+                                                          inSteer,
+                                                          inType,
+                                                          shard,
+                                                          simEvents,
+                                                          inFiles)
+                        simCmd  = self.resModel.AddFlags(simCmd, "sim")
+                        simKey  = self.simCache.MakeKey(tag,
+                                                        geoKey,
+                                                        simParams,
+                                                        simCmd,
+                                                        inLoc,
+                                                        inSteer,
+                                                        shard or simEvents)
+                        simHit  = self.simCache.Lookup(simKey)
+                        simDeps = list(doGeo)
+                        if simHit is not None:
+                            print(f"INFO: trial {tag} reusing simulation {simHit}")
+                            simCmd = self.simCache.MakeLinkCommand(simHit, simOut)
+                        else:
+                            simNew["sim_" + node] = (simKey, simOut)
+                            if stageCmd is not None and doStage is None:
+                                doStage = self.__AddStage(
+                                    graph,
+                                    "stage_" + inKey + "_" + FileManager.ConvertSteeringToTag(inSteer),
+                                    stageCmd,
+                                    flags   = False,
+                                    outputs = [inFile for inFile in inFiles if inFile.startswith(self.stager.cacheDir)]
+                                )
+                            if doStage is not None:
+                                simDeps.append(doStage)
+
+                        doSim = self.__AddStage(
+                            graph,
+                            "sim_" + node,
+                            simCmd,
+                            simDeps,
+                            flags     = False,
+                            stoppable = True,
+                            outputs   = [simOut]
+                        )
+
+                    # now generate stage to run reconstruction
+                    doRec = self.__AddStage(
+                        graph,
+                        "rec_" + node,
+                        self.recGen.MakeCommand(tag,
+                                                inKey,
+                                                inSteer,
+                                                index,
+                                                recArgs),
+                        [doSim],
+                        stoppable = True,
+                        outputs   = [outDir + "/" + FileManager.MakeOutName("rec", tag, inKey, shaTag)]
                     )
-                )
-
-            # step 3: generate relevant merging/analysis commands
-            #   -- FIXME it would be better to have some way to
-            #      1st identify what needs to be merged and then
-            #      only merge that
-            doSimMerge, simMerged = self.anaGen.MakeMergeCommand(self.tag, inKey, "sim")
-            doRecMerge, recMerged = self.anaGen.MakeMergeCommand(self.tag, inKey, "rec")
-            commands.append(doSimMerge)
-            commands.append(doRecMerge)
-
-            # find objectives requiring current input
-            for anaKey, anaCfg in self.cfgAna["objectives"].items():
-
-                # skip if objective is not an analysis
-                if anaCfg["stage"] != "ana":
-                    continue
-
-                # skip if not needing input 
-                if anaCfg["input"] != inKey:
-                    continue
-
-                # otherwise generate command to run analysis and
+                    doSims.append(doSim)
+                    doRecs.append(doRec)
+
+                    # and map output to partial results
+                    if mapped:
+                        doMap, partFiles = self.anaGen.MakeMapCommand(tag,
+                                                                      inKey,
+                                                                      mapped,
+                                                                      inSteer,
+                                                                      index)
+                        doMaps.append(
+                            self.__AddStage(graph,
+                                            "map_" + node,
+                                            doMap,
+                                            [doRec],
+                                            stoppable = True,
+                                            outputs   = partFiles.values())
+                        )
+
+            # step 3: generate relevant merging/analysis stages,
+            # merging only if an analysis needs merged input
+            toMerge = list()
+            if ruled or (driven and not mapped):
+                doSimMerge, simMerged = self.anaGen.MakeMergeCommand(tag, inKey, "sim")
+                doRecMerge, recMerged = self.anaGen.MakeMergeCommand(tag, inKey, "rec")
+                toMerge = [
+                    self.__AddStage(graph, "merge_sim_" + inKey, doSimMerge, doSims, outputs = [simMerged]),
+                    self.__AddStage(graph, "merge_rec_" + inKey, doRecMerge, doRecs, outputs = [recMerged])
+                ]
+
+            # generate stages to run analyses with
+            # their own rules
+            for anaKey in ruled:
+
+                # generate command to run analysis and
                 # its output file
-                command, outFile = self.anaGen.MakeCommand(self.tag,
+                command, outFile = self.anaGen.MakeCommand(tag,
                                                            inKey,
                                                            anaKey,
                                                            simMerged,
                                                            recMerged)
 
-                # append analysis command and output file
-                # to appropriate lists/dictionaries
-                commands.append(command)
+                # add analysis stage and output file
+                # to appropriate graph/dictionaries
+                self.__AddStage(graph, "ana_" + inKey + "_" + anaKey, command, toMerge, outputs = [outFile])
                 outFiles[anaKey] = outFile
 
+            # generate one stage to reduce the partial
+            # results of all mapped analyses
+            if mapped:
+                command, driveFiles, partGlobs = self.anaGen.MakeReduceCommand(tag,
+                                                                               inKey,
+                                                                               mapped)
+                outFiles.update(driveFiles)
+                job = {
+                    "input"    : inKey,
+                    "outputs"  : driveFiles,
+                    "partials" : partGlobs,
+                    "deps"     : doMaps
+                }
+
+            # or one stage to run all driven
+            # analyses over merged input
+            elif driven:
+                command, driveFiles = self.anaGen.MakeDriverCommand(tag,
+                                                                    inKey,
+                                                                    driven,
+                                                                    simMerged,
+                                                                    recMerged)
+                outFiles.update(driveFiles)
+                job = {
+                    "input"   : inKey,
+                    "sim"     : simMerged,
+                    "rec"     : recMerged,
+                    "outputs" : driveFiles,
+                    "deps"    : toMerge
+                }
+
+            # if running in-process, hand off the
+            # analyses instead of adding them
+            if driven:
+                if inProcess:
+                    anaJobs.append(job)
+                else:
+                    self.__AddStage(graph, "ana_" + inKey, command, job["deps"], outputs = driveFiles.values())
+
+        # step 4: wrap each stage so that its time
+        # and resources are recorded (see StageMeter)
+        if self.cfgRun.get("measure_stages", True):
+            statDir = self.GetStatsPath(tag)
+            for name, node in graph.nodes.items():
+                node["command"] = StageMeter.MakeMeasuredCommand(
+                    node["command"],
+                    name,
+                    statDir + "/" + name + ".json"
+                )
+
+        # return plan of trial
+        return {
+            "tag"      : tag,
+            "params"   : dict(params),
+            "graph"    : graph,
+            "preamble" : preamble,
+            "outputs"  : outFiles,
+            "jobs"     : anaJobs,
+            "skipped"  : skipped,
+            "geo_key"  : geoKey,
+            "geo_new"  : geoNew,
+            "sim_new"  : simNew,
+            "events"   : nEvents
+        }
+
+    def GetStatsPath(self, tag):
+        """GetStatsPath
+
+        Returns the directory where the stages
+        of a trial record their time and
+        resources.
+
+        Args:
+          tag: the tag associated with the trial
+        Returns:
+          path to the directory
+        """
+        return self.cfgRun["run_path"] + "/" + tag + "/stats"
+
+    def CollectStats(self, tag):
+        """CollectStats
+
+        Collects the time and resources each stage
+        of a trial used into one JSON record, placed
+        next to the trial's other output.
+
+        Args:
+          tag: the tag associated with the trial
+        Returns:
+          path to the record of the trial
+        """
+        outDir  = self.cfgRun["out_path"] + "/" + tag
+        outStat = outDir + "/" + FileManager.MakeOutName("time", tag)
+        FileManager.MakeDir(outDir)
+        StageMeter.CollectRecords(self.GetStatsPath(tag), outStat, tag)
+        return outStat
+
+    def WriteParamText(self, path, params, value = None):
+        """WriteParamText
+
+        Writes the values of the parameters of a
+        trial after the lines an analysis wrote to
+        its text output (the objective, then e.g.
+        its error). Parameters written by an earlier
+        attempt at the trial are replaced rather
+        than repeated: since the tag of a trial is
+        derived from its parameters, those are the
+        same lines as the ones being written.
+
+        Args:
+          path:   path to the text output
+          params: dictionary of parameters and their values
+          value:  optional value to write in place of the
+                  analysis' lines (e.g. a dummy objective)
+        """
+        parLines = [f"{parVal}" for parVal in params.values()]
+        anaLines = [""]
+        if value is not None:
+            anaLines = [f"{value}"]
+        elif os.path.exists(path):
+            with open(path, 'r') as txt:
+                anaLines = txt.read().split("\n")
+            nPar = len(parLines)
+            if nPar > 0 and len(anaLines) > nPar and anaLines[-nPar:] == parLines:
+                anaLines = anaLines[:-nPar]
+
+        with open(path, 'w') as txt:
+            txt.write("\n".join(anaLines + parLines))
+
+    def MakeTrialScript(self, params, inProcess = False):
+        """MakeTrialScript
+
+        Generate needed geometry files and script to run
+        full sequence of trial. Stages which don't depend
+        on each other are run concurrently.
+
+        Args:
+          params:    dictionary of parameter names and current values (eg. from Ax)
+          inProcess: leave driven analyses out of the script
+        Returns:
+          tuple of path to script and a dictionary of output files
+          associated with each objective
+        """
+
+        # generate plan of trial
+        plan = self.MakeTrialPlan(params, inProcess)
+
         # make sure run directory
         # exists for trial
-        runDir = self.cfgRun["run_path"] + "/" + self.tag
+        runDir = self.cfgRun["run_path"] + "/" + plan["tag"]
         FileManager.MakeDir(runDir)
 
         # construct script name
-        runScript = FileManager.MakeScriptName(self.tag)
+        runScript = FileManager.MakeScriptName(plan["tag"])
+        runPath   = runDir + "/" + runScript
+
+        # collect time and resources of the
+        # stages however the script exits
+        preamble = list(plan["preamble"])
+        if self.cfgRun.get("measure_stages", True):
+            collect = StageMeter.MakeCollectCommand(
+                self.GetStatsPath(plan["tag"]),
+                self.cfgRun["out_path"] + "/" + plan["tag"] + "/" + FileManager.MakeOutName("time", plan["tag"]),
+                plan["tag"]
+            )
+            preamble.insert(0, "trap " + shlex.quote(collect) + " EXIT")
+
+        # compose script and return path to it
+        plan["graph"].MakeScript(runPath, preamble)
+        return runPath, plan["outputs"]
+
+    def __RunStage(self, tag, name, node, preamble):
+        """RunStage
+
+        Writes a script to run a single stage
+        of the trial and runs it in the EIC
+        environment.
+
+        Args:
+          tag:      the tag associated with the trial
+          name:     name of the stage
+          node:     the stage, as stored in the trial graph
+          preamble: list of commands to run before the stage
+        Returns:
+          exit code of the stage
+        """
+
+        # construct script name
+        runDir    = self.cfgRun["run_path"] + "/" + tag
+        runScript = FileManager.MakeScriptName(tag, name)
         runPath   = runDir + "/" + runScript
 
         # compose script
         with open(runPath, 'w') as script:
             script.write("#!/bin/bash\n\n")
             script.write("set -e\n\n")
-            for command in commands:
+            for command in preamble:
                 script.write(command + "\n\n")
+            script.write(node["command"] + "\n")
 
         # make sure script can be run
         os.chmod(runPath, 0o777)
 
-        # return path to script
-        return runPath, outFiles
+        # now run it
+        process = subprocess.run([self.cfgRun["eic_shell"], "--", runPath])
+        return process.returncode
 
-    def DoTrial(self, param):
-        """DoTrial
+    def __ResumeStage(self, tag, name, node, preamble, digests):
+        """ResumeStage
 
-        Carries out trial by generating the relevant
-        script and then running it. For each objective
-        run, current parameter values will be appended
-        to an output text file.
+        Runs a single stage of the trial unless it
+        already completed in an earlier attempt at
+        the trial (see StageCheckpoint), retrying it
+        if it fails. Up to "stage_retries" retries
+        are made (none if not set in the run config),
+        waiting "retry_backoff" seconds before the
+        first and twice as long before each one
+        after, so that transient failures (e.g.
+        reading remote input) don't kill the trial.
 
-        Note that extracting objectives depends on the
-        individual analyses. That functionality is
-        deferred to a separate interface module.
+        Args:
+          tag:      the tag associated with the trial
+          name:     name of the stage
+          node:     the stage, as stored in the trial graph
+          preamble: list of commands to run before the stage
+          digests:  dictionary of stages and the digests of their
+                    outputs, which is updated with this stage's
+        Returns:
+          exit code of the stage
+        """
+        inputs = {dep : digests.get(dep) for dep in node["deps"]}
+        digest = self.checkpt.Lookup(tag, name, node, preamble, inputs)
+        if digest is not None:
+            print(f"INFO: trial {tag} reusing completed stage '{name}'")
+            digests[name] = digest
+            return 0
+
+        retries = self.cfgRun.get("stage_retries", 0)
+        backoff = self.cfgRun.get("retry_backoff", 30)
+        for attempt in range(retries + 1):
+            code = self.corePool.Run(
+                node["cores"],
+                lambda : self.__RunStage(tag, name, node, preamble)
+            )
+            if code == 0:
+                digests[name] = self.checkpt.Store(tag, name, node, preamble, inputs)
+                return code
+
+            # overlaps aren't going to go away
+            if name == "geo" and code == 9:
+                return code
+            if attempt < retries:
+                wait = backoff * 2**attempt
+                print(f"WARNING: stage '{name}' of trial {tag} failed with code {code}, retrying in {wait} s")
+                time.sleep(wait)
+        return code
+
+    def RunTrialPlan(self, plan, analyze = None, monitor = None, cores = None):
+        """RunTrialPlan
+
+        Carries out a planned trial by running its
+        graph, with independent stages running
+        concurrently within the budget of cores set
+        by "max_cores" in the run config. For each
+        objective run, current parameter values will
+        be appended to an output text file.
+
+        Each stage which succeeds is marked complete
+        in the trial's output directory, so running
+        the plan of a trial again with the same tag
+        (e.g. retrying a failed trial) only runs the
+        stages which didn't complete or whose inputs
+        changed. In particular, intact simulation
+        output is never regenerated.
+
+        If a callable is provided via analyze, each
+        entry of the plan's "jobs" is passed to it
+        once the stages it needs complete successfully.
+        This lets the caller run them in the current
+        process.
+
+        If a callable is provided via monitor, it's
+        called after each stage succeeds and can stop
+        the trial early (see TrialGraph.Run), in which
+        case the simulation, reconstruction, and mapping
+        of shards which haven't started are left out and
+        the analyses run on the shards which completed.
+
+        If a no. of cores is provided via cores (e.g. a
+        share of the cores of an outer trial), the trial
+        runs within that budget instead.
 
         Args:
-          param: dictionary of parameters and their current values
+          plan:    the plan of the trial (see MakeTrialPlan)
+          analyze: optional callable to run driven analyses in-process
+          monitor: optional callable deciding whether to stop early
+          cores:   optional no. of cores to use instead of "max_cores"
         Returns:
           dictionary of output files
         """
+        tag     = plan["tag"]
+        digests = dict()
+
+        # make sure run directory
+        # exists for trial
+        FileManager.MakeDir(self.cfgRun["run_path"] + "/" + tag)
+
+        # run graph, picking up where any earlier
+        # attempt at the trial left off
+        #   --> if parameters generated overlap, the
+        #       overlap check exits with code 9
+        #       and nothing else is run
+        codes = plan["graph"].Run(
+            lambda name, node : self.__ResumeStage(tag, name, node, plan["preamble"], digests),
+            cores or self.cfgRun.get("max_cores", os.cpu_count()),
+            monitor,
+            self.resModel.ParseMemory(self.cfgRun["max_memory"]) if "max_memory" in self.cfgRun else None
+        )
 
-        # create and run script
-        script, outFiles = self.MakeTrialScript(param)
-        process = subprocess.run([self.cfgRun["eic_shell"], "--", script])
+        # store result of overlap check if it
+        # was run and completed
+        if plan["geo_new"] and codes["geo"] in (0, 9):
+            geoLog = self.cfgRun["out_path"] + "/" + tag + "/" + FileManager.MakeOutName("geo", tag)
+            self.geoCache.Store(plan["geo_key"], geoLog, codes["geo"])
+
+        # and cache output of any simulation
+        # which was run and completed
+        for name, (simKey, simOut) in plan["sim_new"].items():
+            if codes[name] == 0:
+                self.simCache.Store(simKey, simOut)
+
+        # collect time and resources used by
+        # each stage
+        if self.cfgRun.get("measure_stages", True):
+            self.CollectStats(tag)
+
+        returncode = 0
+        done       = (0, TrialGraph.Stopped)
+        if codes.get("geo") == 9:
+            returncode = 9
+        elif any(code not in done for code in codes.values()):
+            failed = [name for name, code in codes.items() if code not in (*done, None)]
+            print(f"WARNING: trial {tag} had failed stages: {', '.join(failed)}")
+            returncode = 1
+
+        stopped = [name for name, code in codes.items() if code == TrialGraph.Stopped]
+        if stopped:
+            print(f"INFO: trial {tag} stopped early, leaving out {len(stopped)} stages")
+
+        # run any in-process analyses whose
+        # inputs were produced successfully
+        if analyze is not None:
+            for job in plan["jobs"]:
+                deps = [codes[dep] for dep in job["deps"]]
+                if all(code in done for code in deps) and (0 in deps or not deps):
+                    analyze(job)
 
         # write out values of parameters for later
         # analysis
@@ -260,18 +892,36 @@ class TrialManager:
         #       (return code 9), punish with
         #       objectives above or below
         #       threshold
-        for anaKey, anaOut in outFiles.items():
+        for anaKey, anaOut in plan["outputs"].items():
             anaPath = pathlib.Path(anaOut)
             anaTxt  = anaPath.with_suffix('.txt')
-            with open(anaTxt, 'a+') as txt:
-                if process.returncode == 9:
-                    dum = self.anaGen.GetDummyValue(anaKey)
-                    txt.write(f"{dum}")
-                for parKey, parVal in param.items():
-                    txt.write("\n")
-                    txt.write(f"{parVal}")
+            anaDum  = self.anaGen.GetDummyValue(anaKey) if returncode == 9 else None
+            self.WriteParamText(anaTxt, plan["params"], anaDum)
 
         # return relevant output files
-        return outFiles
+        return plan["outputs"]
+
+    def DoTrial(self, param, analyze = None, tag = None):
+        """DoTrial
+
+        Carries out trial by planning it and then
+        running the plan. If a callable is provided
+        via analyze, analyses run by the driver are
+        left out of the graph and passed to it
+        instead (see RunTrialPlan).
+
+        Note that extracting objectives depends on the
+        individual analyses. That functionality is
+        deferred to a separate interface module.
+
+        Args:
+          param:   dictionary of parameters and their current values
+          analyze: optional callable to run driven analyses in-process
+          tag:     optional tag of the trial (the manager's tag if not provided)
+        Returns:
+          dictionary of output files
+        """
+        plan = self.MakeTrialPlan(param, analyze is not None, tag)
+        return self.RunTrialPlan(plan, analyze)
 
 # end =========================================================================
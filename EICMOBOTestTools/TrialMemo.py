@@ -0,0 +1,167 @@
+# =============================================================================
+## @file   TrialMemo.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Class to memoize the objectives of trials,
+#    so that repeated parameterizations are only run
+#    once.
+# =============================================================================
+
+import fcntl
+import hashlib
+import json
+import os
+
+from EICMOBOTestTools import ConfigParser
+from EICMOBOTestTools import FileManager
+
+class TrialMemo:
+    """TrialMemo
+
+    A class to store the objectives of completed trials
+    on disk, keyed on the parameterization (rounded to
+    the precision of each parameter) and the contents of
+    the config files. A trial matching one which is still
+    running waits for it to finish rather than running
+    again, including across processes sharing the same
+    filesystem.
+    """
+
+    def __init__(self, run, par, ana):
+        """constructor accepting arguments
+
+        Entries are placed in "memo_path" if it's
+        set in the run config, and otherwise under
+        the output directory.
+
+        Args:
+          run: runtime configuration file
+          par: parameter configuration file
+          ana: objectives configuration file
+        """
+        self.cfgRun  = ConfigParser.ReadJsonFile(run)
+        self.cfgPar  = ConfigParser.ReadJsonFile(par)
+        self.memoDir = self.cfgRun.get(
+            "memo_path",
+            self.cfgRun["out_path"] + "/memo"
+        )
+
+        # hash config contents once
+        digest = hashlib.sha256()
+        for config in [run, par, ana]:
+            with open(config, 'rb') as cfg:
+                digest.update(cfg.read())
+        self.cfgHash = digest.hexdigest()
+
+    def Quantize(self, params):
+        """Quantize
+
+        Rounds parameters to the precision set by
+        their "precision" field in the parameter
+        config. Parameters without a precision are
+        left as is.
+
+        Args:
+          params: dictionary of parameter names and values
+        Returns:
+          dictionary of parameter names and rounded values
+        """
+        quantized = dict()
+        for par, value in params.items():
+            cfg = self.cfgPar["parameters"].get(par, dict())
+            if "precision" in cfg and isinstance(value, float):
+                step  = float(cfg["precision"])
+                value = round(round(value / step) * step, 12)
+            quantized[par] = value
+        return quantized
+
+    def MakeKey(self, params):
+        """MakeKey
+
+        Computes the key of a (quantized)
+        parameterization.
+
+        Args:
+          params: dictionary of parameter names and values
+        Returns:
+          key of the trial
+        """
+        digest = hashlib.sha256(self.cfgHash.encode())
+        digest.update(json.dumps(params, sort_keys = True).encode())
+        return digest.hexdigest()
+
+    def Lookup(self, key):
+        """Lookup
+
+        Looks up the objectives of a
+        completed trial.
+
+        Args:
+          key: key of the trial
+        Returns:
+          dictionary of objectives and their values (or
+          tuples of values and errors), or None if no
+          trial with the key has completed
+        """
+        entry = self.memoDir + "/" + key + ".json"
+        if not os.path.isfile(entry):
+            return None
+        with open(entry, 'r') as memo:
+            objectives = json.load(memo)["objectives"]
+        return {
+            obj : tuple(value) if isinstance(value, list) else value
+            for obj, value in objectives.items()
+        }
+
+    def Store(self, key, params, objectives):
+        """Store
+
+        Stores the objectives of a completed trial.
+        The entry is written to a temporary file and
+        then moved into place, so it's never seen
+        half-written.
+
+        Args:
+          key:        key of the trial
+          params:     dictionary of parameter names and values
+          objectives: dictionary of objectives and their values
+        """
+        entry = self.memoDir + "/" + key + ".json"
+        temp  = entry + "." + str(os.getpid()) + ".tmp"
+        with open(temp, 'w') as memo:
+            json.dump({"params" : params, "objectives" : objectives}, memo, indent = 4)
+        os.replace(temp, entry)
+
+    def Run(self, params, trial):
+        """Run
+
+        Returns the objectives of a parameterization,
+        only running the trial if no matching trial has
+        completed. While a trial runs, it holds a lock
+        on its key, so a matching request waits for it
+        and then picks up its result. If the trial fails,
+        nothing is stored and the next request runs it.
+
+        Args:
+          params: dictionary of (quantized) parameter names and values
+          trial:  callable running the trial and returning its objectives
+        Returns:
+          dictionary of objectives and their values
+        """
+        FileManager.MakeDir(self.memoDir)
+        key = self.MakeKey(params)
+        with open(self.memoDir + "/" + key + ".lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                objectives = self.Lookup(key)
+                if objectives is not None:
+                    print(f"INFO: reusing objectives of earlier trial with parameters {params}")
+                    return objectives
+                objectives = trial()
+                self.Store(key, params, objectives)
+                return objectives
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+# end =========================================================================
@@ -0,0 +1,233 @@
+# =============================================================================
+## @file   TrialStore.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Class to record every completed trial in a
+#    SQLite database which persists across runs.
+# =============================================================================
+
+import ast
+import datetime
+import hashlib
+import json
+import sqlite3
+
+from EICMOBOTestTools import ConfigParser
+from EICMOBOTestTools import FileManager
+
+# fields of a parameter which can change without
+# changing what a trial at a given point means
+# (e.g. when widening a campaign)
+ParIgnore = ["default", "lower", "upper", "domain", "precision"]
+
+# and fields of an objective which only change
+# how long a trial runs for
+AnaIgnore = ["target_error"]
+
+# fields of the run config which change what a
+# trial measures (rather than where or how it's
+# run)
+RunKeep = ["det_config", "overlap_check", "sim_exec", "sim_args", "rec_exec", "rec_collect"]
+
+# and fields of a simulation input which don't
+InputIgnore = ["location", "shards", "stage_input"]
+
+class TrialStore:
+    """TrialStore
+
+    A class to record the parameters, objectives, config
+    hashes and output files of completed trials in a
+    SQLite database, and to look up the trials which are
+    compatible with the current configuration (e.g. to
+    warm start a new experiment).
+    """
+
+    def __init__(self, run, par, ana):
+        """constructor accepting arguments
+
+        The database is placed at "trial_store" if it's
+        set in the run config, and otherwise in the
+        output directory.
+
+        Args:
+          run: runtime configuration file
+          par: parameter configuration file
+          ana: objectives configuration file
+        """
+        self.cfgRun  = ConfigParser.ReadJsonFile(run)
+        self.cfgPar  = ConfigParser.ReadJsonFile(par)
+        self.cfgAna  = ConfigParser.ReadJsonFile(ana)
+        self.path    = self.cfgRun.get(
+            "trial_store",
+            self.cfgRun["out_path"] + "/trials.db"
+        )
+        self.runHash = self.__HashRun()
+        self.parHash = self.__HashConfig(self.cfgPar["parameters"], ParIgnore)
+        self.anaHash = self.__HashConfig(self.cfgAna["objectives"], AnaIgnore)
+
+    def __HashConfig(self, config, ignore = None):
+        """HashConfig
+
+        Hashes the contents of a config, leaving out
+        comments and any of the listed fields of each
+        entry.
+
+        Args:
+          config: dictionary to hash
+          ignore: optional list of fields to leave out of each entry
+        Returns:
+          hash of config
+        """
+        ignore = list() if ignore is None else ignore
+        kept   = dict()
+        for key, value in config.items():
+            if key.startswith("_"):
+                continue
+            if isinstance(value, dict):
+                value = {k : v for k, v in value.items() if k not in ignore}
+            kept[key] = value
+        return hashlib.sha256(json.dumps(kept, sort_keys = True).encode()).hexdigest()
+
+    def __HashRun(self):
+        """HashRun
+
+        Hashes the parts of the run config which
+        change what a trial measures (see RunKeep
+        and InputIgnore), so that trials run from
+        other directories or machines, or with other
+        resources, still count as compatible.
+
+        Returns:
+          hash of run config
+        """
+        kept = {key : self.cfgRun[key] for key in RunKeep if key in self.cfgRun}
+        kept["sim_input"] = self.__HashConfig(self.cfgRun.get("sim_input", dict()), InputIgnore)
+        return self.__HashConfig(kept)
+
+    def __Connect(self):
+        """Connect
+
+        Opens the database, creating it
+        if it doesn't exist.
+
+        Returns:
+          connection to database
+        """
+        path, file = FileManager.SplitPathAndFile(self.path)
+        FileManager.MakeDir(path)
+        connection = sqlite3.connect(self.path, timeout = 60)
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS trials (
+                   id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                   tag        TEXT,
+                   time       TEXT,
+                   run_hash   TEXT,
+                   par_hash   TEXT,
+                   ana_hash   TEXT,
+                   params     TEXT,
+                   objectives TEXT,
+                   artifacts  TEXT,
+                   stopped    INTEGER NOT NULL DEFAULT 0
+               )"""
+        )
+
+        # databases from before trials could stop
+        # early lack a column to flag them
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(trials)")]
+        if "stopped" not in columns:
+            connection.execute("ALTER TABLE trials ADD COLUMN stopped INTEGER NOT NULL DEFAULT 0")
+        return connection
+
+    def Record(self, tag, params, objectives, artifacts, stopped = False):
+        """Record
+
+        Records a completed trial.
+
+        Args:
+          tag:        the tag associated with the trial
+          params:     dictionary of parameter names and values
+          objectives: dictionary of objectives and their values
+          artifacts:  dictionary of objectives and their output files
+          stopped:    whether the trial stopped early (i.e. its
+                      objectives are from only some of its events)
+        """
+        with self.__Connect() as connection:
+            connection.execute(
+                """INSERT INTO trials
+                       (tag, time, run_hash, par_hash, ana_hash, params, objectives, artifacts, stopped)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    tag,
+                    datetime.datetime.now().isoformat(),
+                    self.runHash,
+                    self.parHash,
+                    self.anaHash,
+                    json.dumps(params),
+                    json.dumps(objectives),
+                    json.dumps(artifacts),
+                    int(stopped)
+                )
+            )
+        connection.close()
+
+    def IsInBounds(self, params):
+        """IsInBounds
+
+        Checks if a parameterization lies within
+        the current bounds (or domain) of each
+        parameter. Anything which isn't a design
+        parameter (e.g. the fidelity) is left
+        for the caller to check.
+
+        Args:
+          params: dictionary of parameter names and values
+        Returns:
+          whether or not all parameters are in bounds
+        """
+        for par, value in params.items():
+            if par not in self.cfgPar["parameters"]:
+                continue
+            cfg = self.cfgPar["parameters"][par]
+            if "domain" in cfg and value not in ast.literal_eval(cfg["domain"]):
+                return False
+            if "lower" in cfg and value < ast.literal_eval(cfg["lower"]):
+                return False
+            if "upper" in cfg and value > ast.literal_eval(cfg["upper"]):
+                return False
+        return True
+
+    def GetCompatible(self):
+        """GetCompatible
+
+        Looks up completed trials whose parameter and
+        objective definitions and whose detector,
+        simulation, and reconstruction setup (see
+        HashRun) match the current ones, and whose
+        parameters are within the current bounds. Trials which stopped early are left
+        out, since their objectives don't have the
+        full statistics of their fidelity. If a point
+        was evaluated more than once, only its latest
+        trial is returned.
+
+        Returns:
+          list of tuples of parameters and objectives
+        """
+        with self.__Connect() as connection:
+            rows = connection.execute(
+                """SELECT params, objectives FROM trials
+                   WHERE run_hash = ? AND par_hash = ? AND ana_hash = ? AND stopped = 0
+                   ORDER BY id""",
+                (self.runHash, self.parHash, self.anaHash)
+            ).fetchall()
+        connection.close()
+
+        # keep latest trial at each point
+        trials = dict()
+        for params, objectives in rows:
+            params = json.loads(params)
+            if self.IsInBounds(params):
+                trials[json.dumps(params, sort_keys = True)] = (params, json.loads(objectives))
+        return list(trials.values())
+
+# end =========================================================================
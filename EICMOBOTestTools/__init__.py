@@ -9,30 +9,60 @@ software stack
 __version__="0.0.0"
 
 from .AnaGenerator import AnaGenerator
+from .CorePool import CorePool
+from .EarlyStopper import EarlyStopper
 from .GeometryEditor import GeometryEditor
+from .InputStager import InputStager
+from .OverlapCache import OverlapCache
 from .RecGenerator import RecGenerator
+from .ResourceModel import ResourceModel
+from .SimCache import SimCache
 from .SimGenerator import SimGenerator
+from .StageCheckpoint import StageCheckpoint
+from .TrialGraph import TrialGraph
 from .TrialManager import TrialManager
+from .TrialMemo import TrialMemo
+from .TrialStore import TrialStore
 
 from .ConfigParser import *
 from .FileManager import *
+from .StageMeter import *
 
 __all__ = [
+    "AggregateRecords",
     "AnaGenerator",
+    "CollectRecords",
     "ConvertSteeringToTag",
+    "CorePool",
+    "EarlyStopper",
     "GeometryEditor",
+    "InputStager",
     "ReadJsonFile",
     "GetConfigFromPath",
     "GetBody",
     "GetParameter",
     "GetPathElementAndUnits",
     "GetSuffix",
+    "MakeCollectCommand",
     "MakeDir",
+    "MakeMeasuredCommand",
     "MakeOutName",
+    "MakeParallelCommand",
     "MakeScriptName",
     "MakeSetCommands",
+    "MakeShardTag",
+    "MeasureCommand",
+    "OverlapCache",
+    "ReadIO",
     "RecGenerator",
+    "ResourceModel",
+    "SimCache",
     "SimGenerator",
     "SplitPathAndFile",
-    "TrialManager"
+    "StageCheckpoint",
+    "TrialGraph",
+    "TrialManager",
+    "TrialMemo",
+    "TrialStore",
+    "WriteRecord"
 ]
@@ -0,0 +1,369 @@
+# =============================================================================
+## @file   bench-geometry.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Benchmark of how preparing the geometry of a
+#    trial (see GeometryEditor) scales with the no. of
+#    parameters and compact files, run on a synthetic
+#    detector tree shaped like compact/far_backward so
+#    that no ePIC installation is needed.
+#
+#  Usage:
+#    python bench-geometry.py \
+#        [-f <no. of files> ...] \
+#        [-p <no. of parameters> ...] \
+#        [-d <include depth>] \
+#        [-s <constants per file>] \
+#        [-a <fraction of absolute includes>] \
+#        [-n <trials per point>] \
+#        [-j <results json>] \
+#        [-b <baseline json> [-t <tolerance>]]
+#
+#  If a baseline (e.g. the results json of an earlier
+#  run) is provided, the benchmark fails if preparing
+#  the geometry of a trial got slower than the
+#  tolerance allows.
+# =============================================================================
+
+import argparse as ap
+import json
+import os
+import pathlib
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# make sure tools can be found
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import EICMOBOTestTools as emt
+
+# default arguments
+FilesDefault    = [10, 100, 1000]
+ParamsDefault   = [1, 4, 16, 64]
+DepthDefault    = 3
+SizeDefault     = 50
+AbsoluteDefault = 0.1
+TrialsDefault   = 5
+SeedDefault     = 20261017
+
+# name of the synthetic detector config
+ConfigDefault = "epic_ip6_extended"
+
+# -----------------------------------------------------------------------------
+# Synthetic detector tree
+# -----------------------------------------------------------------------------
+
+def GetCompactName(index, depth):
+    """GetCompactName
+
+    Returns where a file of the synthetic tree goes
+    (relative to the detector path): files are spread
+    over nested directories of compact/far_backward,
+    one level deeper for each level of includes.
+
+    Args:
+      index: index of the file
+      depth: include depth of the tree
+    Returns:
+      path of the file relative to the detector path
+    """
+    level = 1 + index % depth
+    subs  = "/".join(f"level{lvl}" for lvl in range(2, level + 1))
+    path  = "compact/far_backward/" + (subs + "/" if subs else "")
+    return path + f"component{index}.xml"
+
+def WriteDetectorTree(detPath, nFiles, depth = DepthDefault, size = SizeDefault, absolute = AbsoluteDefault, seed = SeedDefault):
+    """WriteDetectorTree
+
+    Writes a synthetic detector installation: a
+    config including compact/far_backward.xml, which
+    includes the first level of component files, each
+    of which includes files of the next level down to
+    the include depth. Each component defines a no. of
+    constants (which sets its size), and a fraction of
+    the includes refer to files by absolute path, like
+    some of the ePIC compact files do.
+
+    Args:
+      detPath:  path to create the installation at
+      nFiles:   no. of component files
+      depth:    no. of levels of includes below far_backward.xml
+      size:     no. of constants defined in each file
+      absolute: fraction of includes by absolute path
+      seed:     seed of random no. generator
+    Returns:
+      list of the component files (relative to the
+      detector path)
+    """
+    rng   = random.Random(seed)
+    names = [GetCompactName(index, depth) for index in range(nFiles)]
+
+    # each file is included by a file one level up
+    children = {"compact/far_backward.xml" : list()}
+    for index, name in enumerate(names):
+        level  = 1 + index % depth
+        parent = "compact/far_backward.xml"
+        if level > 1:
+            parent = names[index - 1]
+        children.setdefault(parent, list()).append(name)
+
+    def MakeInclude(parent, child):
+        if rng.random() < absolute:
+            ref = os.path.normpath(detPath + "/" + child)
+        else:
+            ref = os.path.relpath(child, os.path.dirname(parent))
+        return f'  <include ref="{ref}"/>\n'
+
+    # write config and top-level compact file
+    os.makedirs(detPath + "/compact", exist_ok = True)
+    with open(detPath + "/" + ConfigDefault + ".xml", 'w') as xml:
+        xml.write('<lccdd>\n  <include ref="${DETECTOR_PATH}/compact/far_backward.xml"/>\n</lccdd>\n')
+    with open(detPath + "/compact/far_backward.xml", 'w') as xml:
+        xml.write("<lccdd>\n")
+        for child in children["compact/far_backward.xml"]:
+            xml.write(MakeInclude("compact/far_backward.xml", child))
+        xml.write("</lccdd>\n")
+
+    # and then each component
+    for index, name in enumerate(names):
+        os.makedirs(os.path.dirname(detPath + "/" + name), exist_ok = True)
+        with open(detPath + "/" + name, 'w') as xml:
+            xml.write("<lccdd>\n  <define>\n")
+            for const in range(size):
+                xml.write(f"    <constant name='Component{index}_Constant{const}' value='{rng.uniform(1.0, 500.0):.3f}*mm'/>\n")
+            xml.write("  </define>\n")
+            for child in children.get(name, list()):
+                xml.write(MakeInclude(name, child))
+            xml.write("</lccdd>\n")
+    return names
+
+def MakeParameters(names, nParams, size = SizeDefault):
+    """MakeParameters
+
+    Makes parameters (structured according to the
+    parameter config file) editing constants of the
+    synthetic tree, spread round-robin over its
+    files.
+
+    Args:
+      names:   list of the component files
+      nParams: no. of parameters to make
+      size:    no. of constants defined in each file
+    Returns:
+      list of parameters
+    """
+    params = list()
+    for index in range(nParams):
+        file  = index % len(names)
+        const = (index // len(names)) % size
+        params.append({
+            "element"    : "value",
+            "path"       : f".//constant[@name='Component{file}_Constant{const}']",
+            "default"    : "100.0",
+            "units"      : "mm",
+            "lower"      : "50.0",
+            "upper"      : "150.0",
+            "compact"    : names[file],
+            "stage"      : "sim",
+            "value_type" : "float",
+            "param_type" : "range"
+        })
+    return params
+
+# -----------------------------------------------------------------------------
+# Benchmark
+# -----------------------------------------------------------------------------
+
+def PrepareGeometry(editor, edits, tag):
+    """PrepareGeometry
+
+    Prepares the geometry of a trial the way the
+    trial manager does, timing each step: editing
+    the compact files, updating files related to
+    them, and finding the config of the overlay.
+
+    Args:
+      editor: geometry editor to use
+      edits:  list of tuples of a parameter and its value
+      tag:    the tag associated with the trial
+    Returns:
+      dictionary of steps and the time they took (s)
+    """
+    times = dict()
+
+    start = time.perf_counter()
+    editor.EditCompacts(edits, tag)
+    times["compacts"] = time.perf_counter() - start
+
+    start   = time.perf_counter()
+    related = dict()
+    for param, value in edits:
+        related.setdefault(param["compact"], param)
+    for param in related.values():
+        editor.EditRelatedFiles(param, tag)
+    times["related"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for param in related.values():
+        editor.EditConfig(param, tag)
+    editor.GetTrialPath(tag)
+    times["config"] = time.perf_counter() - start
+
+    times["total"] = sum(times.values())
+    return times
+
+def RunPoint(workDir, nFiles, nParams, depth, size, absolute, nTrials):
+    """RunPoint
+
+    Benchmarks preparing the geometry of several
+    trials for one size of tree and no. of
+    parameters. The first trial is cold (nothing
+    parsed or indexed yet), and the rest are warm.
+
+    Args:
+      workDir:  directory to create tree and overlays in
+      nFiles:   no. of component files
+      nParams:  no. of parameters
+      depth:    include depth of the tree
+      size:     no. of constants defined in each file
+      absolute: fraction of includes by absolute path
+      nTrials:  no. of trials to prepare
+    Returns:
+      dictionary of results
+    """
+    base    = f"{workDir}/f{nFiles}_p{nParams}"
+    detPath = base + "/det"
+    names   = WriteDetectorTree(detPath, nFiles, depth, size, absolute)
+    params  = MakeParameters(names, nParams, size)
+
+    # write run config pointing to
+    # synthetic installation
+    runCfg = base + "/run.config"
+    with open(runCfg, 'w') as cfg:
+        json.dump(
+            {
+                "run_path"   : base + "/run",
+                "det_path"   : detPath,
+                "det_config" : ConfigDefault
+            },
+            cfg,
+            indent = 4
+        )
+    editor = emt.GeometryEditor(runCfg)
+
+    # prepare each trial with different values
+    trials = list()
+    for trial in range(nTrials):
+        edits = [(param, 100.0 + 0.1 * trial) for param in params]
+        trials.append(PrepareGeometry(editor, edits, f"bench{trial}"))
+
+    warm  = trials[1:] or trials
+    nBytes = sum(os.path.getsize(detPath + "/" + name) for name in names)
+    return {
+        "files"    : nFiles,
+        "params"   : nParams,
+        "depth"    : depth,
+        "size"     : size,
+        "absolute" : absolute,
+        "bytes"    : nBytes,
+        "cold"     : trials[0],
+        "warm"     : {step : statistics.mean(times[step] for times in warm) for step in trials[0]},
+        "trials"   : trials
+    }
+
+def CompareToBaseline(results, baseline, tolerance):
+    """CompareToBaseline
+
+    Compares the mean time of a warm trial to a
+    baseline with the same tree and no. of
+    parameters.
+
+    Args:
+      results:   list of results of this run
+      baseline:  list of results of the baseline
+      tolerance: fraction the time may grow by
+    Returns:
+      list of descriptions of any regressions
+    """
+    def GetKey(res):
+        return (res["files"], res["params"], res["depth"], res["size"], res["absolute"])
+
+    reference   = {GetKey(res) : res for res in baseline}
+    regressions = list()
+    for res in results:
+        ref = reference.get(GetKey(res))
+        if ref is None:
+            continue
+        if res["warm"]["total"] > (1.0 + tolerance) * ref["warm"]["total"]:
+            regressions.append(
+                f"{res['files']} files and {res['params']} parameters: "
+                f"{1e3 * res['warm']['total']:.1f} ms vs. {1e3 * ref['warm']['total']:.1f} ms in baseline"
+            )
+    return regressions
+
+# main ========================================================================
+
+if __name__ == "__main__":
+
+    # set up arguments
+    parser = ap.ArgumentParser()
+    parser.add_argument("-f", "--files", help = "No. of compact files in tree", type = int, nargs = "+", default = FilesDefault)
+    parser.add_argument("-p", "--params", help = "No. of parameters to edit", type = int, nargs = "+", default = ParamsDefault)
+    parser.add_argument("-d", "--depth", help = "No. of levels of includes", type = int, default = DepthDefault)
+    parser.add_argument("-s", "--size", help = "No. of constants per file", type = int, default = SizeDefault)
+    parser.add_argument("-a", "--absolute", help = "Fraction of includes by absolute path", type = float, default = AbsoluteDefault)
+    parser.add_argument("-n", "--trials", help = "No. of trials per point", type = int, default = TrialsDefault)
+    parser.add_argument("-w", "--work", help = "Directory for trees and overlays (temporary and removed if not set)", type = str)
+    parser.add_argument("-j", "--json", help = "Write results as JSON to this file", type = str)
+    parser.add_argument("-b", "--baseline", help = "Results JSON of an earlier run to compare to", type = str)
+    parser.add_argument("-t", "--tolerance", help = "Fraction time may grow by before failing", type = float, default = 0.5)
+
+    args    = parser.parse_args()
+    workDir = args.work if args.work is not None else tempfile.mkdtemp(prefix = "bench_geometry_")
+    os.makedirs(workDir, exist_ok = True)
+
+    # run each point of the scan
+    results = list()
+    try:
+        for nFiles in args.files:
+            for nParams in args.params:
+                results.append(
+                    RunPoint(workDir, nFiles, nParams, args.depth, args.size, args.absolute, args.trials)
+                )
+    finally:
+        if args.work is None:
+            shutil.rmtree(workDir, ignore_errors = True)
+
+    # report results
+    print(f"  {'files':>6} {'params':>6} {'size [KB]':>10} {'cold [ms]':>10} {'warm [ms]':>10} {'compacts':>9} {'related':>9} {'config':>9}")
+    for res in results:
+        print(
+            f"  {res['files']:>6} {res['params']:>6} {res['bytes'] / 1024:>10.1f}"
+            f" {1e3 * res['cold']['total']:>10.2f} {1e3 * res['warm']['total']:>10.2f}"
+            f" {1e3 * res['warm']['compacts']:>9.2f} {1e3 * res['warm']['related']:>9.2f} {1e3 * res['warm']['config']:>9.2f}"
+        )
+    if args.json is not None:
+        host = {
+            "platform" : platform.platform(),
+            "python"   : platform.python_version(),
+            "cores"    : os.cpu_count()
+        }
+        with open(args.json, 'w') as out:
+            json.dump({"host" : host, "results" : results}, out, indent = 4)
+
+    # and compare to baseline
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as base:
+            regressions = CompareToBaseline(results, json.load(base)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"WARNING: geometry preparation regressed for {regression}")
+        if regressions:
+            sys.exit(1)
+
+# end =========================================================================
@@ -0,0 +1,455 @@
+# =============================================================================
+## @file   bench-objectives.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Benchmark of how fast the Low-Q2 objectives
+#    process events, run on synthetic EDM4hep/EDM4eic-
+#    like files so that no EIC stack is needed to
+#    generate input.
+#
+#  Usage:
+#    python bench-objectives.py \
+#        [-n <no. of events> ...] \
+#        [-p <MC particles per event>] \
+#        [-c <chunk size>] \
+#        [-j <results json>] \
+#        [-b <baseline json> [-t <tolerance>]]
+#
+#  Each objective is run in its own process so that
+#  its peak memory can be measured. If a baseline
+#  (e.g. the results json of an earlier run) is
+#  provided, the benchmark fails if any objective
+#  got slower than the tolerance allows.
+# =============================================================================
+
+import argparse as ap
+import json
+import os
+import pathlib
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import awkward as ak
+import numpy as np
+import uproot
+
+# make sure objectives can be found
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+# default arguments
+EventsDefault    = [10000, 100000]
+ParticlesDefault = 10
+ChunkDefault     = 10000
+BatchDefault     = 10000
+SeedDefault      = 20261017
+
+# objectives to benchmark
+Implementations = ["global", "local1", "local2", "driver"]
+
+# collections written to each synthetic file, and
+# the type of each member
+MomentumTypes = {
+    "momentum.x" : "var * float32",
+    "momentum.y" : "var * float32",
+    "momentum.z" : "var * float32"
+}
+ParticleTypes = {
+    "PDG"             : "var * int32",
+    "generatorStatus" : "var * int32",
+    "momentum.x"      : "var * float64",
+    "momentum.y"      : "var * float64",
+    "momentum.z"      : "var * float64"
+}
+SyntheticCollections = {
+    "sim" : {
+        "MCParticles"           : ParticleTypes,
+        "BackwardsBeamlineHits" : MomentumTypes
+    },
+    "rec" : {
+        "MCParticles"                         : ParticleTypes,
+        "TaggerTrackerReconstructedParticles" : MomentumTypes,
+        "TaggerTrackerM1LocalTracks"          : MomentumTypes,
+        "TaggerTrackerM2LocalTracks"          : MomentumTypes
+    }
+}
+
+# -----------------------------------------------------------------------------
+# Synthetic events
+# -----------------------------------------------------------------------------
+
+def SmearDirections(rng, dirs, sigma):
+    """SmearDirections
+
+    Smears an array of unit vectors by
+    a small angle.
+
+    Args:
+      rng:   random no. generator
+      dirs:  (n, 3) array of unit vectors
+      sigma: spread of smearing (in radians)
+    Returns:
+      (n, 3) array of smeared unit vectors
+    """
+    smeared = dirs + rng.normal(0.0, sigma, dirs.shape)
+    return smeared / np.linalg.norm(smeared, axis = 1)[:, np.newaxis]
+
+def MakeCollection(counts, momenta, **members):
+    """MakeCollection
+
+    Turns flat arrays of a collection into
+    jagged arrays of its members.
+
+    Args:
+      counts:  no. of objects in each event
+      momenta: (n, 3) array of momenta
+      members: any other flat members (e.g. PDG)
+    Returns:
+      dictionary of members and their jagged arrays
+    """
+    collection = {
+        "momentum.x" : ak.unflatten(momenta[:, 0], counts),
+        "momentum.y" : ak.unflatten(momenta[:, 1], counts),
+        "momentum.z" : ak.unflatten(momenta[:, 2], counts)
+    }
+    for member, values in members.items():
+        collection[member] = ak.unflatten(values, counts)
+    return collection
+
+def MakeBatch(rng, nEvents, nParticles):
+    """MakeBatch
+
+    Generates a batch of synthetic Low-Q2 events:
+    a scattered e- (going backwards at a small angle)
+    along with the beams and some hadrons, the e-
+    leaving the beamline magnets (usually after 5
+    hits), and tagger tracks and particles close to
+    the e- for events where it's reconstructed.
+
+    Args:
+      rng:        random no. generator
+      nEvents:    no. of events to generate
+      nParticles: no. of MC particles per event
+    Returns:
+      dictionary of inputs ("sim", "rec") and their
+      collections
+    """
+
+    # scattered e-: energy between 2 and 17 GeV,
+    # within 10 mrad of the -z axis
+    pele  = rng.uniform(2.0, 17.0, nEvents)
+    theta = rng.uniform(0.0, 0.01, nEvents)
+    phi   = rng.uniform(0.0, 2.0 * np.pi, nEvents)
+    uele  = np.column_stack([
+        np.sin(theta) * np.cos(phi),
+        np.sin(theta) * np.sin(phi),
+        -np.cos(theta)
+    ])
+
+    # MC particles: e- and p beams (status 4), then
+    # the scattered e- and hadrons (status 1)
+    nHad    = max(nParticles - 3, 0)
+    mcCount = np.full(nEvents, 3 + nHad, dtype = np.int64)
+    pdg     = np.tile(np.array([11, 2212, 11] + [211] * nHad, dtype = np.int32), nEvents)
+    status  = np.tile(np.array([4, 4, 1] + [1] * nHad, dtype = np.int32), nEvents)
+    mcMom   = rng.normal(0.0, 1.0, (nEvents, 3 + nHad, 3))
+    mcMom[:, 0] = [0.0, 0.0, -18.0]
+    mcMom[:, 1] = [0.0, 0.0, 275.0]
+    mcMom[:, 2] = uele * pele[:, np.newaxis]
+    mcMom   = mcMom.reshape(-1, 3)
+    mcPars  = MakeCollection(mcCount, mcMom, PDG = pdg, generatorStatus = status)
+
+    # beamline hits: usually 5, each along the
+    # e- direction (the last one bent a little)
+    hitCount = rng.choice([3, 4, 5, 6], nEvents, p = [0.05, 0.05, 0.85, 0.05])
+    hitDirs  = SmearDirections(rng, np.repeat(uele, hitCount, axis = 0), 1e-3)
+    hitMom   = (hitDirs * np.repeat(pele, hitCount)[:, np.newaxis]).astype(np.float32)
+    magHits  = MakeCollection(hitCount, hitMom)
+    lastHit  = hitDirs[np.cumsum(hitCount) - 1]
+
+    # reconstructed e-: none, one or two per event,
+    # with a few % momentum resolution
+    recCount = rng.choice([0, 1, 2], nEvents, p = [0.3, 0.6, 0.1])
+    recP     = np.repeat(pele, recCount) * rng.normal(1.0, 0.03, recCount.sum())
+    recDirs  = SmearDirections(rng, np.repeat(uele, recCount, axis = 0), 1e-4)
+    recMom   = (recDirs * recP[:, np.newaxis]).astype(np.float32)
+    recPars  = MakeCollection(recCount, recMom)
+
+    # and local tracks in each tagger, close to
+    # the direction of the last beamline hit
+    tracks = dict()
+    for tagger in ["M1", "M2"]:
+        trkCount = rng.choice([0, 1, 2], nEvents, p = [0.3, 0.6, 0.1])
+        trkDirs  = SmearDirections(rng, np.repeat(lastHit, trkCount, axis = 0), 3e-4)
+        trkMom   = (trkDirs * np.repeat(pele, trkCount)[:, np.newaxis]).astype(np.float32)
+        tracks[tagger] = MakeCollection(trkCount, trkMom)
+
+    return {
+        "sim" : {
+            "MCParticles"           : mcPars,
+            "BackwardsBeamlineHits" : magHits
+        },
+        "rec" : {
+            "MCParticles"                         : mcPars,
+            "TaggerTrackerReconstructedParticles" : recPars,
+            "TaggerTrackerM1LocalTracks"          : tracks["M1"],
+            "TaggerTrackerM2LocalTracks"          : tracks["M2"]
+        }
+    }
+
+def WriteSyntheticEvents(sfile, rfile, nEvents, nParticles = ParticlesDefault, seed = SeedDefault, batch = BatchDefault):
+    """WriteSyntheticEvents
+
+    Writes synthetic sim and rec files with the podio
+    layout the event engine reads (an "events" tree
+    with one branch per collection member), a batch
+    of events at a time.
+
+    Args:
+      sfile:      output sim file name
+      rfile:      output rec file name
+      nEvents:    no. of events to write
+      nParticles: no. of MC particles per event
+      seed:       seed of random no. generator
+      batch:      no. of events to generate at a time
+    """
+    rng   = np.random.default_rng(seed)
+    files = {"sim" : uproot.recreate(sfile), "rec" : uproot.recreate(rfile)}
+    try:
+        for label, file in files.items():
+            file.mktree("events", {
+                collection + "." + member : kind
+                for collection, members in SyntheticCollections[label].items()
+                for member, kind in members.items()
+            })
+        for start in range(0, nEvents, batch):
+            events = MakeBatch(rng, min(batch, nEvents - start), nParticles)
+            for label, file in files.items():
+                file["events"].extend({
+                    collection + "." + member : values
+                    for collection, members in events[label].items()
+                    for member, values in members.items()
+                })
+    finally:
+        for file in files.values():
+            file.close()
+
+# -----------------------------------------------------------------------------
+# Benchmark worker
+# -----------------------------------------------------------------------------
+
+def GetMaxRSS():
+    """GetMaxRSS
+
+    Returns the peak resident memory
+    of this process so far.
+
+    Returns:
+      peak memory in bytes
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def RunWorker(impl, sfile, rfile, odir, chunk):
+    """RunWorker
+
+    Runs one objective over a pair of inputs twice:
+    once through its usual entry point, to measure
+    throughput and peak memory, and once stage by
+    stage (reading, processing, and finishing) to
+    see where the time goes.
+
+    Args:
+      impl:  objective to run (see Implementations)
+      sfile: input sim file name
+      rfile: input rec file name
+      odir:  directory for output files
+      chunk: no. of events to process at a time
+    Returns:
+      dictionary of results
+    """
+    import objectives.LowQ2AnalysisDriver as lqd
+    import objectives.LowQ2EventEngine as lqe
+    import objectives.LowQ2GlobalResolution as lqg
+    import objectives.LowQ2LocalResolution as lql
+
+    rssImport = GetMaxRSS()
+    ofile     = odir + "/bench_" + impl + ".root"
+
+    # analyses each objective runs, and its entry point
+    def MakeAnalyses():
+        if impl == "global":
+            return {"global" : (lqg.GlobalResolution(), ofile)}
+        elif impl in ("local1", "local2"):
+            return {impl : (lql.LocalResolution(int(impl[-1])), ofile)}
+        elif impl == "driver":
+            return {
+                "global" : (lqg.GlobalResolution(), odir + "/bench_driver_global.root"),
+                "local1" : (lql.LocalResolution(1), odir + "/bench_driver_local1.root"),
+                "local2" : (lql.LocalResolution(2), odir + "/bench_driver_local2.root")
+            }
+        raise ValueError(f"Unknown objective '{impl}' to benchmark!")
+
+    if impl == "global":
+        entry = lambda : lqg.CalculateMomReso(rfile, ofile, chunk)
+    elif impl in ("local1", "local2"):
+        entry = lambda : lql.CalculateMomReso(sfile, rfile, ofile, int(impl[-1]), chunk)
+    else:
+        entry = lambda : lqd.RunAnalyses(sfile, rfile, MakeAnalyses(), chunk)
+
+    # step 1: run entry point
+    start = time.perf_counter()
+    entry()
+    wall  = time.perf_counter() - start
+    rss   = GetMaxRSS()
+
+    # step 2: run again, timing each stage
+    analyses    = MakeAnalyses()
+    collections = dict()
+    for analysis, out in analyses.values():
+        for label, needed in analysis.collections.items():
+            merged = collections.setdefault(label, list())
+            merged.extend(c for c in needed if c not in merged)
+    inputs = {label : {"sim" : sfile, "rec" : rfile}[label] for label in collections}
+    stages = {"read" : 0.0, "process" : 0.0, "finish" : 0.0}
+    chunks = lqe.IterateChunks(inputs, collections, chunk)
+    events = 0
+    while True:
+        start = time.perf_counter()
+        data  = next(chunks, None)
+        stages["read"] += time.perf_counter() - start
+        if data is None:
+            break
+        start = time.perf_counter()
+        for analysis, out in analyses.values():
+            analysis.Process(data)
+        stages["process"] += time.perf_counter() - start
+        events += lqe.CountEvents(data)
+    start = time.perf_counter()
+    for analysis, out in analyses.values():
+        analysis.Finish(out)
+    stages["finish"] += time.perf_counter() - start
+
+    return {
+        "objective"    : impl,
+        "events"       : events,
+        "chunk"        : chunk,
+        "wall"         : wall,
+        "events_per_s" : events / wall if wall > 0 else None,
+        "stages"       : stages,
+        "rss_import"   : rssImport,
+        "max_rss"      : rss
+    }
+
+# -----------------------------------------------------------------------------
+# Benchmark driver
+# -----------------------------------------------------------------------------
+
+def CompareToBaseline(results, baseline, tolerance):
+    """CompareToBaseline
+
+    Compares the throughput of each objective to
+    a baseline with the same no. of events.
+
+    Args:
+      results:   list of results of this run
+      baseline:  list of results of the baseline
+      tolerance: fraction the throughput may drop by
+    Returns:
+      list of descriptions of any regressions
+    """
+    reference   = {(res["objective"], res["events"]) : res for res in baseline}
+    regressions = list()
+    for res in results:
+        ref = reference.get((res["objective"], res["events"]))
+        if ref is None or not ref["events_per_s"]:
+            continue
+        if res["events_per_s"] < (1.0 - tolerance) * ref["events_per_s"]:
+            regressions.append(
+                f"{res['objective']} with {res['events']} events: "
+                f"{res['events_per_s']:.0f} events/s vs. {ref['events_per_s']:.0f} in baseline"
+            )
+    return regressions
+
+# main ========================================================================
+
+if __name__ == "__main__":
+
+    # set up arguments
+    parser = ap.ArgumentParser()
+    parser.add_argument("-n", "--events", help = "No. of events to benchmark with", type = int, nargs = "+", default = EventsDefault)
+    parser.add_argument("-p", "--particles", help = "No. of MC particles per event", type = int, default = ParticlesDefault)
+    parser.add_argument("-c", "--chunk", help = "No. of events to process at a time", type = int, default = ChunkDefault)
+    parser.add_argument("-o", "--objectives", help = "Objectives to benchmark", nargs = "+", choices = Implementations, default = Implementations)
+    parser.add_argument("-d", "--dir", help = "Directory for synthetic and output files (temporary if not set)", type = str)
+    parser.add_argument("-j", "--json", help = "Write results as JSON to this file", type = str)
+    parser.add_argument("-b", "--baseline", help = "Results JSON of an earlier run to compare to", type = str)
+    parser.add_argument("-t", "--tolerance", help = "Fraction throughput may drop by before failing", type = float, default = 0.2)
+    parser.add_argument("--worker", help = ap.SUPPRESS, nargs = 5)
+
+    # if running as a worker, run one objective and
+    # write its results to a file (ROOT may still
+    # print to stdout)
+    args = parser.parse_args()
+    if args.worker is not None:
+        impl, sfile, rfile, odir, ofile = args.worker
+        with open(ofile, 'w') as out:
+            json.dump(RunWorker(impl, sfile, rfile, odir, args.chunk), out)
+        sys.exit(0)
+
+    workDir = args.dir if args.dir is not None else tempfile.mkdtemp(prefix = "bench_objectives_")
+    os.makedirs(workDir, exist_ok = True)
+
+    # step 1: write synthetic inputs, reusing any
+    # already written with the same settings
+    results = list()
+    for nEvents in args.events:
+        base  = f"{workDir}/synthetic_n{nEvents}_p{args.particles}"
+        sfile = base + ".edm4hep.root"
+        rfile = base + ".edm4eic.root"
+        if not (os.path.exists(sfile) and os.path.exists(rfile)):
+            start = time.perf_counter()
+            WriteSyntheticEvents(sfile, rfile, nEvents, args.particles)
+            print(f"INFO: wrote {nEvents} synthetic events to {base}.* in {time.perf_counter() - start:.1f} s")
+
+        # step 2: run each objective in its
+        # own process
+        for impl in args.objectives:
+            ofile   = f"{workDir}/bench_{impl}_n{nEvents}.json"
+            process = subprocess.run(
+                [sys.executable, __file__, "--worker", impl, sfile, rfile, workDir, ofile, "-c", str(args.chunk)],
+                capture_output = True,
+                text = True
+            )
+            if process.returncode != 0:
+                print(f"WARNING: benchmark of {impl} with {nEvents} events failed:\n{process.stderr}")
+                continue
+            with open(ofile, 'r') as out:
+                result = json.load(out)
+            result["particles"] = args.particles
+            results.append(result)
+
+    # step 3: report results
+    print(f"  {'objective':<10} {'events':>8} {'events/s':>10} {'wall [s]':>9} {'read [s]':>9} {'proc [s]':>9} {'fin [s]':>9} {'max rss [MB]':>13}")
+    for res in results:
+        print(
+            f"  {res['objective']:<10} {res['events']:>8} {res['events_per_s']:>10.0f} {res['wall']:>9.2f}"
+            f" {res['stages']['read']:>9.2f} {res['stages']['process']:>9.2f} {res['stages']['finish']:>9.2f}"
+            f" {res['max_rss'] / 1024**2:>13.1f}"
+        )
+    if args.json is not None:
+        with open(args.json, 'w') as out:
+            json.dump({"results" : results}, out, indent = 4)
+
+    # and compare to baseline
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as base:
+            regressions = CompareToBaseline(results, json.load(base)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"WARNING: throughput regressed for {regression}")
+        if regressions:
+            sys.exit(1)
+
+# end =========================================================================
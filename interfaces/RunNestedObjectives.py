@@ -0,0 +1,184 @@
+# =============================================================================
+## @file   RunNestedObjectives.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Wrapper to run the objectives of a geometry
+#    after optimizing its reconstruction parameters on
+#    the same simulation output.
+# =============================================================================
+
+import ast
+import concurrent.futures as cf
+import os
+
+from ax.generation_strategy.generation_node import GenerationStep
+from ax.generation_strategy.generation_strategy import GenerationStrategy
+from ax.modelbridge.registry import Generators
+from ax.service.ax_client import AxClient, ObjectiveProperties
+
+import AID2ETestTools as att
+import EICMOBOTestTools as emt
+
+from .RunObjectives import GetConfigPaths, GetTrialTag, RunObjectives
+
+def ScoreObjectives(objectives, config):
+    """ScoreObjectives
+
+    Combines the objectives of a trial into a
+    single score to minimize, where each objective
+    is weighted by the inverse of its threshold
+    (so they're on comparable scales) and by its
+    "inner_weight" (1 if not set).
+
+    Args:
+      objectives: dictionary of objectives and their values (or values and errors)
+      config:     dictionary of objective options
+    Returns:
+      score of trial
+    """
+    score = 0.0
+    for key, value in objectives.items():
+        if isinstance(value, tuple):
+            value = value[0]
+        cfgObj = config["objectives"][key]
+        sign   = 1.0 if cfgObj["goal"] == "minimize" else -1.0
+        scale  = abs(cfgObj.get("threshold", 1.0)) or 1.0
+        score += sign * cfgObj.get("inner_weight", 1.0) * value / scale
+    return score
+
+def RunNestedObjectives(tag = None, **kwargs):
+    """RunNestedObjectives
+
+    Runs the objectives of a geometry (the "sim"
+    parameters provided) for the best found
+    reconstruction (the "rec" parameters). The
+    reconstruction parameters are tuned by an inner
+    optimization, where the first inner trial runs
+    the default reconstruction parameters (and so
+    builds the geometry and runs the simulation),
+    and the rest only rerun reconstruction and
+    analyses on its simulation output on a local
+    pool of processes.
+
+    Inner trials are compared by their score (see
+    ScoreObjectives). The inner loop is configured
+    by the "nested" options of the problem config:
+    the total no. of inner trials ("n_trials"), how
+    many are Sobol trials ("n_sobol"), and how many
+    run at once ("n_workers"). The inner trials
+    running at once share the cores of the outer
+    trial ("max_cores" in the run config), so no
+    more run at once than there are cores for their
+    reconstruction, and each runs on its share.
+
+    Args:
+      tag:    unused, kept for compatibility with RunObjectives
+      kwargs: any keyword arguments (e.g. parameterization)
+    Returns:
+      dictionary of objectives and their values for
+      the best reconstruction parameters
+    """
+
+    # load relevant config files
+    run_path, exp_path, par_path, obj_path = GetConfigPaths()
+    cfg_exp = emt.ReadJsonFile(exp_path)
+    cfg_par = emt.ReadJsonFile(par_path)
+    cfg_obj = emt.ReadJsonFile(obj_path)
+    cfg_nst = cfg_exp.get("nested", dict())
+
+    # nothing to tune if there are no
+    # reconstruction parameters
+    ax_pars, ax_cons = att.ConvertParamConfig(cfg_par, ["rec"])
+    if not ax_pars:
+        return RunObjectives(**kwargs)
+
+    # step 1: run default reconstruction, which
+    # also builds the geometry and runs the
+    # simulation the other inner trials reuse
+    defaults = {
+        par["name"] : ast.literal_eval(cfg_par["parameters"][par["name"]]["default"])
+        for par in ax_pars
+    }
+    n_trials = cfg_nst.get("n_trials", 10)
+    n_sobol  = min(cfg_nst.get("n_sobol", 4), n_trials - 1)
+    steps    = list()
+    if n_sobol > 0:
+        steps.append(
+            GenerationStep(
+                model = Generators.SOBOL,
+                num_trials = n_sobol,
+                max_parallelism = n_sobol
+            )
+        )
+    steps.append(
+        GenerationStep(
+            model = Generators.BOTORCH_MODULAR,
+            num_trials = -1
+        )
+    )
+    ax_client = AxClient(
+        generation_strategy = GenerationStrategy(steps = steps),
+        enforce_sequential_optimization = False,
+        verbose_logging = False
+    )
+    ax_client.create_experiment(
+        parameters = ax_pars,
+        objectives = {"score" : ObjectiveProperties(minimize = True)},
+        parameter_constraints = ax_cons or None
+    )
+    params, index = ax_client.attach_trial(parameters = defaults)
+    memo          = emt.TrialMemo(run_path, par_path, obj_path)
+    base          = GetTrialTag(memo, memo.Quantize({**kwargs, **params}))
+    results       = {index : RunObjectives(base, **{**kwargs, **params})}
+    ax_client.complete_trial(
+        trial_index = index,
+        raw_data    = {"score" : ScoreObjectives(results[index], cfg_obj)}
+    )
+
+    # step 2: tune reconstruction on the simulation
+    # of the default trial, a batch of trials at a
+    # time, splitting the cores of the outer trial
+    # between them
+    cfg_run   = emt.ReadJsonFile(run_path)
+    n_cores   = cfg_run.get("max_cores", os.cpu_count())
+    rec_cores = emt.ResourceModel(run_path).GetCores("rec")
+    n_workers = max(1, min(cfg_nst.get("n_workers", 4), n_cores // rec_cores))
+    n_share   = max(1, n_cores // n_workers)
+    with cf.ProcessPoolExecutor(max_workers = n_workers) as pool:
+        while len(results) < n_trials:
+            batch, finished = ax_client.get_next_trials(
+                max_trials = min(n_workers, n_trials - len(results))
+            )
+            if not batch:
+                break
+            futures = {
+                pool.submit(RunObjectives, base = base, cores = n_share, **{**kwargs, **params}) : index
+                for index, params in batch.items()
+            }
+            for future in cf.as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as error:
+                    print(f"WARNING: inner trial {index} failed ({error})")
+                    ax_client.log_trial_failure(trial_index = index)
+                    results[index] = None
+                    continue
+                ax_client.complete_trial(
+                    trial_index = index,
+                    raw_data    = {"score" : ScoreObjectives(results[index], cfg_obj)}
+                )
+
+    # step 3: report objectives of best
+    # reconstruction
+    scored = {
+        index : ScoreObjectives(objectives, cfg_obj)
+        for index, objectives in results.items()
+        if objectives is not None
+    }
+    best   = min(scored, key = scored.get)
+    print(f"INFO: best reconstruction parameters for {kwargs} are {ax_client.get_trial_parameters(best)}")
+    return results[best]
+
+# end =========================================================================
@@ -8,37 +8,96 @@
 # =============================================================================
 
 import argparse
+import concurrent.futures as cf
 import datetime
 import os
 import re
 import subprocess
+import threading
 
 import EICMOBOTestTools as emt 
 
-def RunObjectives(tag = None, **kwargs):
-    """RunObjectives
+# analysis driver, imported at most once per
+# worker process
+Driver = None
+
+# in-process analyses use ROOT, which isn't
+# thread-safe, so trials running on threads
+# take turns running them
+DriverLock = threading.Lock()
+
+def LoadDriver():
+    """LoadDriver
+
+    Imports the analysis driver (and with it
+    ROOT, uproot, etc.) the first time it is
+    needed. Since the workers running trials
+    are long-lived, later trials reuse it.
+
+    Returns:
+      driver module, or None if it can't be imported
+    """
+    global Driver
+    with DriverLock:
+        if Driver is None:
+            try:
+                from objectives import LowQ2AnalysisDriver
+                Driver = LowQ2AnalysisDriver
+            except ImportError as error:
+                print(f"WARNING: can't run analyses in-process ({error}), using trial script instead")
+                Driver = False
+    return Driver if Driver else None
+
+def SplitFidelity(exp_path, params):
+    """SplitFidelity
+
+    Splits the fidelity (the no. of events
+    to simulate) off of a parameterization,
+    if running multi-fidelity.
+
+    Args:
+      exp_path: path to problem configuration file
+      params:   dictionary of parameters (and fidelity) and their values
+    Returns:
+      tuple of the dictionary of parameters and their
+      values, and the no. of events (or None if not
+      running multi-fidelity)
+    """
+    cfgFid = emt.ReadJsonFile(exp_path).get("fidelity", dict())
+    if not cfgFid.get("enabled", False) or cfgFid["name"] not in params:
+        return params, None
+
+    nEvents = int(params[cfgFid["name"]])
+    params  = {par : value for par, value in params.items() if par != cfgFid["name"]}
+    return params, nEvents
+
+def RunTrial(run_path, par_path, obj_path, tag = None, exp_path = None, base = None, cores = None, **kwargs):
+    """RunTrial
 
     Runs trial (simulation, reconstruction,
     and all analyses) for provided set of
-    updated parameters.
+    updated parameters. If running multi-
+    fidelity, the fidelity sets the no. of
+    events to simulate.
 
     Args:
-      tag:    tag associated with trial
-      kwargs: any keyword arguments (e.g. parameterization)
+      run_path: path to runtime configuration file
+      par_path: path to parameter configuration file
+      obj_path: path to objectives configuration file
+      tag:      tag associated with trial
+      exp_path: optional path to problem configuration file
+      base:     optional tag of a trial to reuse the geometry and simulation of
+      cores:    optional no. of cores to run the trial with
+      kwargs:   any keyword arguments (e.g. parameterization)
     Returns:
-      dictionary of objectives and their values
+      dictionary of objectives and their values (or
+      their values and errors, if stopped early)
     """
 
-    # extract path to script being run currently
-    main_path, main_file = emt.SplitPathAndFile(
-        os.path.realpath(__file__)
-    )
-
-    # determine paths to config files
-    #   -- FIXME this is brittle!
-    run_path = main_path + "/../configuration/run.config"
-    par_path = main_path + "/../configuration/parameters.config"
-    obj_path = main_path + "/../configuration/objectives.config"
+    # split off fidelity, if any
+    params, nEvents = kwargs, None
+    if exp_path is not None:
+        params, nEvents = SplitFidelity(exp_path, kwargs)
 
     # create trial manager
     trial = emt.TrialManager(run_path,
@@ -46,14 +105,87 @@ def RunObjectives(tag = None, **kwargs):
                              obj_path,
                              tag)
 
-    # create and run script
-    oFiles = trial.DoTrial(kwargs)
+    # if possible, run analyses handled by the
+    # driver in this process rather than in the
+    # trial script
+    results = dict()
+    analyze = None
+    driver  = LoadDriver() if trial.anaGen.RunsInProcess() else None
+    if driver is not None:
+        def analyze(job):
+            with DriverLock:
+                if "partials" in job:
+                    results.update(
+                        driver.ReduceObjectives(job["outputs"],
+                                                job["partials"],
+                                                trial.cfgAna["objectives"])
+                    )
+                else:
+                    results.update(
+                        driver.RunObjectives(job["sim"],
+                                             job["rec"],
+                                             job["outputs"],
+                                             trial.cfgAna["objectives"])
+                    )
+
+    # plan trial
+    plan  = trial.MakeTrialPlan(params, analyze is not None, nEvents = nEvents, base = base)
+    store = emt.TrialStore(run_path, par_path, obj_path)
+
+    # if analyses are mapped in-process, evaluate the
+    # objectives each time a shard completes, and stop
+    # once they're known well enough
+    #   --> otherwise there are no intermediate
+    #       objectives to check, and every shard
+    #       is run
+    monitor = None
+    stopped = dict()
+    stopper = emt.EarlyStopper(run_path, obj_path)
+    mapJobs = [job for job in plan["jobs"] if "partials" in job]
+    if stopper.IsEnabled() and not mapJobs:
+        print(f"WARNING: early stopping needs analyses mapped in-process, trial {plan['tag']} will run all its shards")
+    if stopper.IsEnabled() and mapJobs:
+        stopper.SetFront([objectives for params, objectives in store.GetCompatible()])
+        def monitor(name, codes):
+            if not name.startswith("map_"):
+                return False
+            nDone   = sum(codes.get(dep) == 0 for job in mapJobs for dep in job["deps"])
+            interim = dict()
+            try:
+                with DriverLock:
+                    for job in mapJobs:
+                        if any(codes.get(dep) == 0 for dep in job["deps"]):
+                            interim.update(
+                                driver.EvaluatePartials(job["partials"],
+                                                        trial.cfgAna["objectives"])
+                            )
+            except Exception as error:
+                print(f"WARNING: couldn't evaluate trial {plan['tag']} after stage {name} ({error})")
+                return False
+            reason = stopper.Check(interim, nDone)
+            stopper.Report(plan["tag"], interim, nDone, reason)
+            if reason is not None:
+                stopped.update({"reason" : reason, "shards" : nDone})
+            return reason is not None
+
+    # and run it
+    oFiles = trial.RunTrialPlan(plan, analyze, monitor, cores)
 
     # extract relevant objectives
-    #   --> (should be 1st line in associated
-    #       text files)
+    #   --> (either returned directly from in-process
+    #       analyses, or should be 1st line in
+    #       associated text files)
+    #   --> if the trial stopped early, its objectives
+    #       are from only some of its events, so they
+    #       are returned along with their errors
     objectives = dict()
     for obj, file in oFiles.items():
+        if obj in results and stopped:
+            objectives[obj] = (results[obj]["value"], results[obj]["error"])
+            continue
+        if obj in results:
+            objectives[obj] = results[obj]["value"]
+            continue
         oTxt = file.replace(".root", ".txt")
         oVal = None
         with open(oTxt, 'r') as out:
@@ -61,9 +193,124 @@ def RunObjectives(tag = None, **kwargs):
             oVal = float(oDat[0])
         objectives[obj] = oVal
 
+    # record trial for later runs, flagging it
+    # if it stopped early so that it isn't taken
+    # as a full-statistics trial later on
+    store.Record(trial.tag, kwargs, objectives, oFiles, bool(stopped))
+
     # return dictionary of objectives
     return objectives
 
+def GetConfigPaths():
+    """GetConfigPaths
+
+    Determines the paths to the config files,
+    relative to this script.
+
+    Returns:
+      tuple of paths to the runtime, problem,
+      parameter, and objectives configuration
+      files
+    """
+
+    # extract path to script being run currently
+    main_path, main_file = emt.SplitPathAndFile(
+        os.path.realpath(__file__)
+    )
+
+    # determine paths to config files
+    #   -- FIXME this is brittle!
+    run_path = main_path + "/../configuration/run.config"
+    exp_path = main_path + "/../configuration/problem.config"
+    par_path = main_path + "/../configuration/parameters.config"
+    obj_path = main_path + "/../configuration/objectives.config"
+    return run_path, exp_path, par_path, obj_path
+
+def GetTrialTag(memo, params):
+    """GetTrialTag
+
+    Derives the tag of a trial from its key, so
+    that retrying a failed trial picks up its
+    completed stages.
+
+    Args:
+      memo:   memo of trials (see TrialMemo)
+      params: dictionary of (quantized) parameters and their values
+    Returns:
+      tag of the trial
+    """
+    return "AID2ETrial" + memo.MakeKey(params)[:16]
+
+def RunObjectives(tag = None, base = None, cores = None, **kwargs):
+    """RunObjectives
+
+    Runs trial (simulation, reconstruction,
+    and all analyses) for provided set of
+    updated parameters, unless a trial with
+    the same parameters (up to their precision)
+    and configuration has already been run or
+    is running. If an earlier attempt at the
+    trial failed, it resumes from the stages
+    that attempt completed.
+
+    Args:
+      tag:    tag associated with trial
+      base:   optional tag of a trial with the same simulation
+              parameters, whose geometry and simulation are reused
+      cores:  optional no. of cores to run the trial with
+      kwargs: any keyword arguments (e.g. parameterization)
+    Returns:
+      dictionary of objectives and their values
+    """
+
+    # determine paths to config files
+    run_path, exp_path, par_path, obj_path = GetConfigPaths()
+
+    # round parameters to their precision, and
+    # run trial only if needed
+    memo   = emt.TrialMemo(run_path, par_path, obj_path)
+    params = memo.Quantize(kwargs)
+
+    # if no tag is given, derive it from the trial's
+    # key so that retrying a failed trial picks up
+    # its completed stages
+    if tag is None:
+        tag = GetTrialTag(memo, params)
+    return memo.Run(
+        params,
+        lambda : RunTrial(run_path, par_path, obj_path, tag, exp_path, base, cores, **params)
+    )
+
+def RunObjectivesConcurrently(trials, workers = None):
+    """RunObjectivesConcurrently
+
+    Runs several trials at once on a pool of
+    threads within the current process. Each
+    trial is planned and run independently
+    (see RunObjectives), so trials only share
+    their configuration; in-process analyses
+    take turns.
+
+    Note that each trial runs its stages within
+    its own budget of cores ("max_cores" in the
+    run config), so the number of workers should
+    be chosen with that in mind.
+
+    Args:
+      trials:  list of dictionaries of parameters (optionally with a "tag")
+      workers: optional no. of trials to run at once (all if not provided)
+    Returns:
+      list of dictionaries of objectives and their values,
+      in the same order as trials
+    """
+    workers = len(trials) if workers is None else workers
+    with cf.ThreadPoolExecutor(max_workers = max(1, workers)) as pool:
+        futures = [
+            pool.submit(RunObjectives, **trial)
+            for trial in trials
+        ]
+        return [future.result() for future in futures]
+
 # main ========================================================================
 
 if __name__ == "__main__":
@@ -1,5 +1,8 @@
 from .RunObjectives import *
+from .RunNestedObjectives import *
 
 __all__ = [
-    "RunObjectives"
+    "RunNestedObjectives",
+    "RunObjectives",
+    "RunObjectivesConcurrently"
 ]
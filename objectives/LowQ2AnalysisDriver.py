@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# =============================================================================
+## @file   LowQ2AnalysisDriver.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Script to run several Low-Q2 objectives in a
+#    single pass over one set of sim/reco inputs.
+#
+#  Objectives can also be run map-reduce style: each
+#  set of inputs (e.g. a shard) is mapped to small
+#  partial results (histogram bins, sums, counts),
+#  which are later reduced to the final objectives
+#  without ever merging the inputs themselves.
+#
+#  Objectives opt in by naming a registered analysis in
+#  their "analysis" field in the objectives config, with
+#  any constructor arguments under "options". Analyses
+#  not registered here can be named by import path
+#  (e.g. "mypackage.mymodule:MyAnalysis").
+#
+#  An analysis is any callable returning an object with
+#  a "collections" dictionary of inputs (e.g. "sim",
+#  "rec") and the collections it reads from each, a
+#  Process(chunk) method, and a Finish(ofile) method
+#  returning a dictionary with at least a "value"
+#  (and only writing output if ofile isn't None).
+#
+#  Usage if executed directly:
+#    ./LowQ2AnalysisDriver.py \
+#        -c <objectives config> \
+#        -s <sim file> \
+#        -r <reco file> \
+#        -a <objective>=<output file> [-a ...] \
+#        [-n <chunk size>] \
+#        [-m]
+#
+#  where -m writes partial results to the output files
+#  instead. To reduce partial results:
+#    ./LowQ2AnalysisDriver.py \
+#        -c <objectives config> \
+#        -a <objective>=<output file> [-a ...] \
+#        -p <objective>=<partial files glob> [-p ...]
+# =============================================================================
+
+import argparse as ap
+import glob
+import importlib
+import json
+import numpy as np
+import os
+import sys
+
+try:
+    from objectives import LowQ2EventEngine as lqe
+    from objectives import LowQ2GlobalResolution as lqg
+    from objectives import LowQ2LocalResolution as lql
+except ImportError:
+    import LowQ2EventEngine as lqe
+    import LowQ2GlobalResolution as lqg
+    import LowQ2LocalResolution as lql
+
+# default arguments
+ChunkDefault = lqe.ChunkDefault
+
+# registered analyses
+Analyses = {
+    "LowQ2GlobalResolution" : lqg.GlobalResolution,
+    "LowQ2LocalResolution"  : lql.LocalResolution
+}
+
+def RegisterAnalysis(name, analysis):
+    """RegisterAnalysis
+
+    Registers an analysis so that objectives
+    can refer to it by name.
+
+    Args:
+      name:     name objectives refer to analysis by
+      analysis: callable returning an analysis
+    """
+    Analyses[name] = analysis
+
+def GetAnalysis(name):
+    """GetAnalysis
+
+    Looks up an analysis by its registered
+    name, or imports it if an import path
+    ("<module>:<callable>") is provided.
+
+    Args:
+      name: registered name or import path of analysis
+    Returns:
+      callable returning an analysis
+    """
+    if name in Analyses:
+        return Analyses[name]
+    if ":" in name:
+        module, attr = name.split(":", 1)
+        RegisterAnalysis(name, getattr(importlib.import_module(module), attr))
+        return Analyses[name]
+    raise ValueError(f"Unknown analysis '{name}' specified!")
+
+def MakeAnalysis(config):
+    """MakeAnalysis
+
+    Creates the analysis associated
+    with an objective.
+
+    Args:
+      config: the objective, structured according to objectives config file
+    Returns:
+      analysis to run
+    """
+    analysis = GetAnalysis(config["analysis"])
+    return analysis(**config.get("options", dict()))
+
+def ProcessInputs(sfile, rfile, analyses, chunk = ChunkDefault):
+    """ProcessInputs
+
+    Passes every chunk of events of the provided inputs
+    to a set of analyses, reading each needed collection
+    only once.
+
+    Args:
+      sfile:    input sim file name
+      rfile:    input rec file name
+      analyses: list of analyses to run
+      chunk:    no. of events to process at a time
+    Returns:
+      no. of events processed
+    """
+
+    # collect union of collections needed from each input
+    collections = dict()
+    for analysis in analyses:
+        for label, needed in analysis.collections.items():
+            merged = collections.setdefault(label, list())
+            merged.extend(c for c in needed if c not in merged)
+
+    # only open inputs that are actually needed
+    files  = {label : file for label, file in [("sim", sfile), ("rec", rfile)]}
+    inputs = {label : files[label] for label in collections}
+
+    # single pass over inputs
+    nEvents = 0
+    for data in lqe.IterateChunks(inputs, collections, chunk):
+        for analysis in analyses:
+            analysis.Process(data)
+        nEvents += lqe.CountEvents(data)
+    return nEvents
+
+def RunAnalyses(sfile, rfile, analyses, chunk = ChunkDefault):
+    """RunAnalyses
+
+    Runs a set of analyses over the provided inputs,
+    reading each needed collection once and passing
+    every chunk of events to every analysis.
+
+    Args:
+      sfile:    input sim file name
+      rfile:    input rec file name
+      analyses: dictionary of objectives and their (analysis, output file)
+      chunk:    no. of events to process at a time
+    Returns:
+      dictionary of objectives and their results
+    """
+
+    # single pass over inputs
+    ProcessInputs(sfile, rfile, [analysis for analysis, ofile in analyses.values()], chunk)
+
+    # now extract each objective
+    results = dict()
+    for objective, (analysis, ofile) in analyses.items():
+        results[objective] = analysis.Finish(ofile)
+    return results
+
+def SavePartial(analysis, pfile, nEvents):
+    """SavePartial
+
+    Saves the partial results of an analysis to
+    a .npz file. The file is written under a
+    temporary name and then moved into place so
+    that a partial file is never seen half-written.
+
+    Args:
+      analysis: analysis to save
+      pfile:    partial file name
+      nEvents:  no. of events the partial results are from
+    """
+    partial = analysis.GetPartial()
+    partial["events"] = np.array([nEvents])
+    temp = pfile + ".tmp"
+    with open(temp, 'wb') as out:
+        np.savez(out, **partial)
+    os.replace(temp, pfile)
+
+def LoadPartial(analysis, pfile):
+    """LoadPartial
+
+    Merges the partial results saved in
+    a .npz file into an analysis.
+
+    Args:
+      analysis: analysis to merge into
+      pfile:    partial file name
+    Returns:
+      no. of events the partial results are from
+    """
+    with np.load(pfile) as data:
+        partial = {key : data[key] for key in data.files}
+    analysis.AddPartial(partial)
+    return int(partial["events"][0])
+
+def RunObjectives(sfile, rfile, outputs, objectives, chunk = ChunkDefault):
+    """RunObjectives
+
+    Creates and runs the analyses of the requested
+    objectives in a single pass over the provided
+    inputs.
+
+    Args:
+      sfile:      input sim file name
+      rfile:      input rec file name
+      outputs:    dictionary of objectives and their output files
+      objectives: dictionary of objectives, structured according to objectives config file
+      chunk:      no. of events to process at a time
+    Returns:
+      dictionary of objectives and their results
+    """
+    analyses = dict()
+    for objective, ofile in outputs.items():
+        analyses[objective] = (MakeAnalysis(objectives[objective]), ofile)
+    return RunAnalyses(sfile, rfile, analyses, chunk)
+
+def MapObjectives(sfile, rfile, partials, objectives, chunk = ChunkDefault):
+    """MapObjectives
+
+    Creates and runs the analyses of the requested
+    objectives in a single pass over the provided
+    inputs, and saves their partial results.
+
+    Args:
+      sfile:      input sim file name
+      rfile:      input rec file name
+      partials:   dictionary of objectives and their partial files
+      objectives: dictionary of objectives, structured according to objectives config file
+      chunk:      no. of events to process at a time
+    """
+    analyses = {
+        objective : MakeAnalysis(objectives[objective])
+        for objective in partials
+    }
+    nEvents = ProcessInputs(sfile, rfile, list(analyses.values()), chunk)
+    for objective, analysis in analyses.items():
+        SavePartial(analysis, partials[objective], nEvents)
+
+def ReduceObjectives(outputs, partials, objectives):
+    """ReduceObjectives
+
+    Merges the partial results of the requested
+    objectives and extracts their final values.
+
+    Args:
+      outputs:    dictionary of objectives and their output files
+      partials:   dictionary of objectives and glob patterns of their partial files
+      objectives: dictionary of objectives, structured according to objectives config file
+    Returns:
+      dictionary of objectives and their results
+    """
+    results = dict()
+    for objective, ofile in outputs.items():
+
+        # find partial results to merge
+        pfiles = sorted(glob.glob(partials[objective]))
+        if not pfiles:
+            raise RuntimeError(f"No partial results found for {objective} ({partials[objective]})!")
+
+        # merge and extract objective
+        analysis = MakeAnalysis(objectives[objective])
+        for pfile in pfiles:
+            LoadPartial(analysis, pfile)
+        results[objective] = analysis.Finish(ofile)
+    return results
+
+def EvaluatePartials(partials, objectives):
+    """EvaluatePartials
+
+    Merges the partial results of the requested
+    objectives found so far and extracts interim
+    values, without writing any output (e.g. to
+    check a trial while its shards are mapped).
+
+    Args:
+      partials:   dictionary of objectives and glob patterns of their partial files
+      objectives: dictionary of objectives, structured according to objectives config file
+    Returns:
+      dictionary of objectives and their interim results,
+      leaving out objectives with no partial results yet
+    """
+    results = dict()
+    for objective, pattern in partials.items():
+        pfiles = sorted(glob.glob(pattern))
+        if not pfiles:
+            continue
+
+        # merge and extract objective in memory
+        analysis = MakeAnalysis(objectives[objective])
+        for pfile in pfiles:
+            LoadPartial(analysis, pfile)
+        results[objective] = analysis.Finish(None)
+    return results
+
+# main ========================================================================
+
+if __name__ == "__main__":
+
+    # set up argments
+    parser = ap.ArgumentParser()
+    parser.add_argument(
+        "-c",
+        "--config",
+        help = "Objectives configuration file",
+        type = str,
+        required = True
+    )
+    parser.add_argument(
+        "-s",
+        "--sim",
+        help = "Input simulation file",
+        type = str,
+        default = None
+    )
+    parser.add_argument(
+        "-r",
+        "--reco",
+        help = "Input reconstruction file",
+        type = str,
+        default = None
+    )
+    parser.add_argument(
+        "-a",
+        "--analysis",
+        help = "Objective to run and its output file, as <objective>=<output>",
+        action = "append",
+        type = str,
+        required = True
+    )
+    parser.add_argument(
+        "-p",
+        "--partials",
+        help = "Objective to reduce and a glob of its partial files, as <objective>=<glob>",
+        action = "append",
+        type = str,
+        default = None
+    )
+    parser.add_argument(
+        "-m",
+        "--map",
+        help = "Write partial results to outputs instead",
+        action = "store_true"
+    )
+    parser.add_argument(
+        "-n",
+        "--chunk",
+        help = "No. of events to process at a time",
+        nargs = '?',
+        const = ChunkDefault,
+        default = ChunkDefault,
+        type = int
+    )
+
+    # grab arguments
+    args = parser.parse_args()
+    with open(args.config) as cfg:
+        objectives = json.load(cfg)["objectives"]
+
+    # collect requested objectives
+    outputs = dict()
+    for request in args.analysis:
+        objective, ofile = request.split("=", 1)
+        outputs[objective] = ofile
+
+    # if partial results were provided, reduce them
+    if args.partials:
+        partials = dict()
+        for request in args.partials:
+            objective, pattern = request.split("=", 1)
+            partials[objective] = pattern
+        ReduceObjectives(outputs, partials, objectives)
+        sys.exit(0)
+
+    # otherwise run analyses over inputs
+    if args.sim is None and args.reco is None:
+        parser.error("an input sim and/or reco file is required")
+    if args.map:
+        MapObjectives(args.sim, args.reco, outputs, objectives, args.chunk)
+    else:
+        RunObjectives(args.sim, args.reco, outputs, objectives, args.chunk)
+
+# end =========================================================================
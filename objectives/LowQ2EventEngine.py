@@ -0,0 +1,345 @@
+# =============================================================================
+## @file   LowQ2EventEngine.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Module to read podio collections in fixed-size
+#    chunks of events as flat NumPy arrays, to compute
+#    kinematics on a whole chunk at once, and to
+#    accumulate mergeable histograms of the results.
+#
+#  Each chunk is a dictionary of collections, and each
+#  collection is a dictionary of flat arrays (one entry
+#  per object) along with the no. of objects in each
+#  event ("counts").
+# =============================================================================
+
+import awkward as ak
+import numpy as np
+import uproot
+
+# default no. of events to read per chunk
+ChunkDefault = 10000
+
+# name of the podio event tree
+TreeDefault = "events"
+
+# members needed from each collection
+MomentumMembers = ["momentum.x", "momentum.y", "momentum.z"]
+CollectionMembers = {
+    "MCParticles"                         : ["PDG", "generatorStatus"] + MomentumMembers,
+    "TaggerTrackerReconstructedParticles" : MomentumMembers,
+    "BackwardsBeamlineHits"               : MomentumMembers,
+    "TaggerTrackerM1LocalTracks"          : MomentumMembers,
+    "TaggerTrackerM2LocalTracks"          : MomentumMembers
+}
+
+def GetNEvents(ifile, tree = TreeDefault):
+    """GetNEvents
+
+    Returns the no. of events (frames)
+    in a podio file.
+
+    Args:
+      ifile: input file name
+      tree:  name of event tree
+    Returns:
+      no. of events in file
+    """
+    with uproot.open(ifile) as file:
+        return file[tree].num_entries
+
+def ReadChunk(tree, collections, start, stop):
+    """ReadChunk
+
+    Reads the members of the specified collections
+    for a range of events into flat arrays. Floating
+    point members are promoted to double precision.
+
+    Args:
+      tree:        event tree to read from
+      collections: list of collections to read
+      start:       first event to read
+      stop:        event to stop reading at (exclusive)
+    Returns:
+      dictionary of collections and their flat arrays
+    """
+    chunk = dict()
+    for collection in collections:
+        data = dict()
+        for member in CollectionMembers[collection]:
+
+            # read jagged member and flatten it
+            branch = tree[collection + "." + member].array(
+                library = "ak",
+                entry_start = start,
+                entry_stop = stop
+            )
+            flat = ak.to_numpy(ak.flatten(branch, axis = None))
+            if np.issubdtype(flat.dtype, np.floating):
+                flat = flat.astype(np.float64)
+
+            # all members of a collection share the
+            # same no. of objects per event
+            if "counts" not in data:
+                data["counts"] = ak.to_numpy(ak.num(branch, axis = 1)).astype(np.int64)
+            data[member] = flat
+        chunk[collection] = data
+    return chunk
+
+def IterateChunks(ifiles, collections, chunk = ChunkDefault, tree = TreeDefault):
+    """IterateChunks
+
+    Generator which reads the specified collections from
+    one or more podio files in lockstep, in chunks of a
+    fixed no. of events. Only one chunk is held in memory
+    at a time.
+
+    Args:
+      ifiles:      dictionary of labels (e.g. "sim", "rec") and input files
+      collections: dictionary of labels and collections to read from each file
+      chunk:       no. of events to read per chunk
+      tree:        name of event tree
+    Yields:
+      dictionary of labels and the chunk read from each file
+    """
+
+    # open all inputs and make sure they line up
+    files  = {label : uproot.open(ifile) for label, ifile in ifiles.items()}
+    trees  = {label : file[tree] for label, file in files.items()}
+    counts = {label : tree.num_entries for label, tree in trees.items()}
+    if len(set(counts.values())) > 1:
+        summary = ", ".join(f"{label} ({count})" for label, count in counts.items())
+        raise RuntimeError(f"The no. of frames isn't the same across inputs: {summary}!")
+
+    # now read each chunk of events
+    try:
+        nevents = next(iter(counts.values()), 0)
+        for start in range(0, nevents, chunk):
+            stop = min(start + chunk, nevents)
+            yield {
+                label : ReadChunk(trees[label], collections[label], start, stop)
+                for label in trees
+            }
+    finally:
+        for file in files.values():
+            file.close()
+
+def CountEvents(chunk):
+    """CountEvents
+
+    Returns the no. of events in a chunk
+    read by IterateChunks.
+
+    Args:
+      chunk: chunk of events from the event engine
+    Returns:
+      no. of events in chunk
+    """
+    for collections in chunk.values():
+        for collection in collections.values():
+            return len(collection["counts"])
+    return 0
+
+def GetOffsets(counts):
+    """GetOffsets
+
+    Returns the flat index of the first
+    object in each event.
+
+    Args:
+      counts: no. of objects in each event
+    Returns:
+      array of offsets
+    """
+    offsets = np.zeros(len(counts), dtype = np.int64)
+    np.cumsum(counts[:-1], out = offsets[1:])
+    return offsets
+
+def GetMagnitude(collection):
+    """GetMagnitude
+
+    Computes momentum magnitude for every
+    object in a collection.
+
+    Args:
+      collection: flat arrays of a collection
+    Returns:
+      array of momentum magnitudes
+    """
+    px = collection["momentum.x"]
+    py = collection["momentum.y"]
+    pz = collection["momentum.z"]
+    return np.sqrt(px**2 + py**2 + pz**2)
+
+def GetUnitVectors(collection):
+    """GetUnitVectors
+
+    Computes momentum unit vector for every
+    object in a collection.
+
+    Args:
+      collection: flat arrays of a collection
+    Returns:
+      (n, 3) array of unit vectors
+    """
+    mag = GetMagnitude(collection)
+    vec = np.column_stack(
+        [collection[member] for member in MomentumMembers]
+    )
+    return vec / mag[:, np.newaxis]
+
+def FindFirst(mask, counts):
+    """FindFirst
+
+    Finds the flat index of the first object
+    in each event satisfying a selection.
+
+    Args:
+      mask:   boolean selection of objects
+      counts: no. of objects in each event
+    Returns:
+      array of flat indices, -1 if no object in the
+      event was selected
+    """
+    events = np.repeat(np.arange(len(counts)), counts)
+    first  = np.full(len(counts), -1, dtype = np.int64)
+    chosen = np.flatnonzero(mask)
+    unique, where = np.unique(events[chosen], return_index = True)
+    first[unique] = chosen[where]
+    return first
+
+def Dot(a, b):
+    """Dot
+
+    Row-wise dot product of two
+    (n, 3) arrays.
+
+    Args:
+      a: first array of vectors
+      b: second array of vectors
+    Returns:
+      array of dot products
+    """
+    return a[:, 0] * b[:, 0] + a[:, 1] * b[:, 1] + a[:, 2] * b[:, 2]
+
+class Histogram:
+    """Histogram
+
+    A class to accumulate a 1D histogram with fixed-width
+    bins as NumPy arrays. It follows ROOT's conventions
+    (under- and overflow bins, statistics from in-range
+    entries only) so that partial histograms filled on
+    different shards can be merged, saved, and turned
+    into the same TH1D as filling it directly would.
+    """
+
+    def __init__(self, nbins, lo, hi):
+        """constructor accepting arguments
+
+        Args:
+          nbins: no. of bins
+          lo:    lower edge of histogram
+          hi:    upper edge of histogram
+        """
+        self.nbins   = nbins
+        self.lo      = lo
+        self.hi      = hi
+        self.counts  = np.zeros(nbins + 2)
+        self.sumw2   = np.zeros(nbins + 2)
+        self.stats   = np.zeros(4)
+        self.entries = 0.0
+
+    def Fill(self, values):
+        """Fill
+
+        Fills histogram with an array of
+        values, each with unit weight.
+
+        Args:
+          values: array of values to fill
+        """
+        if len(values) == 0:
+            return
+
+        # find bin of each value, sending values
+        # below (above) range to under (over)flow
+        bins    = np.full(len(values), self.nbins + 1, dtype = np.int64)
+        under   = values < self.lo
+        inRange = ~under & (values < self.hi)
+        width   = self.hi - self.lo
+        bins[under]   = 0
+        bins[inRange] = 1 + (self.nbins * (values[inRange] - self.lo) / width).astype(np.int64)
+
+        # accumulate bin contents, and sum, sum² and
+        # count of in-range values
+        filled = np.bincount(bins, minlength = self.nbins + 2)
+        inside = values[inRange]
+        self.counts  += filled
+        self.sumw2   += filled
+        self.stats   += [len(inside), len(inside), np.sum(inside), np.sum(inside**2)]
+        self.entries += len(values)
+
+    def GetPartial(self):
+        """GetPartial
+
+        Returns the state of the histogram as
+        a dictionary of arrays.
+
+        Returns:
+          dictionary of arrays
+        """
+        return {
+            "binning" : np.array([self.nbins, self.lo, self.hi]),
+            "counts"  : self.counts,
+            "sumw2"   : self.sumw2,
+            "stats"   : self.stats,
+            "entries" : np.array([self.entries])
+        }
+
+    def AddPartial(self, partial):
+        """AddPartial
+
+        Merges the state of another histogram
+        with the same binning into this one.
+
+        Args:
+          partial: dictionary of arrays from GetPartial
+        """
+        binning = np.array([self.nbins, self.lo, self.hi])
+        if not np.array_equal(partial["binning"], binning):
+            raise ValueError(f"Can't merge histograms with binning {partial['binning']} and {binning}!")
+        self.counts  += partial["counts"]
+        self.sumw2   += partial["sumw2"]
+        self.stats   += partial["stats"]
+        self.entries += partial["entries"][0]
+
+    def MakeROOT(self, name, title):
+        """MakeROOT
+
+        Creates a ROOT histogram with the
+        contents and statistics accumulated
+        so far.
+
+        Args:
+          name:  name of ROOT histogram
+          title: title of ROOT histogram
+        Returns:
+          ROOT histogram
+        """
+        import ROOT
+
+        # create histogram and set bins
+        hist = ROOT.TH1D(name, title, self.nbins, self.lo, self.hi)
+        hist.SetDirectory(0)
+        hist.Sumw2()
+        for ibin in range(self.nbins + 2):
+            hist.SetBinContent(ibin, self.counts[ibin])
+            hist.SetBinError(ibin, np.sqrt(self.sumw2[ibin]))
+
+        # statistics have to be set after the bins
+        hist.PutStats(np.array(self.stats, dtype = np.float64))
+        hist.SetEntries(self.entries)
+        return hist
+
+# end =========================================================================
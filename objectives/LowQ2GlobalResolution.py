@@ -8,7 +8,7 @@
 #    particles reconstructed by the Low-Q2 tagger(s).
 #
 #  Usage if executed directly:
-#    ./LowQ2RecoResolution.py -i <input file> -o <output file>
+#    ./LowQ2GlobalResolution.py -i <input file> -o <output file> [-c <chunk size>]
 # =============================================================================
 
 import argparse as ap
@@ -16,15 +16,166 @@ import numpy as np
 import ROOT
 import sys
 
-from podio.reading import get_reader
+try:
+    from objectives import LowQ2EventEngine as lqe
+except ImportError:
+    import LowQ2EventEngine as lqe
 
 # default arguments
 IFileDefault = "../backward.e10ele.edm4eic.root"
 OFileDefault = "test_global_reso.root"
+ChunkDefault = lqe.ChunkDefault
+
+# collections needed from each input
+Collections = {
+    "rec" : ["MCParticles", "TaggerTrackerReconstructedParticles"]
+}
+
+def CalculateResiduals(chunk):
+    """CalculateResiduals
+
+    Calculates the relative difference between the
+    momenta of every reconstructed tagger particle
+    and the scattered electron in a chunk of events.
+    Events without a scattered electron are skipped.
+
+    Args:
+      chunk: chunk of events from the event engine
+    Returns:
+      array of momentum residuals
+    """
+
+    # grab relevant collections
+    mcpars  = chunk["rec"]["MCParticles"]
+    recpars = chunk["rec"]["TaggerTrackerReconstructedParticles"]
+
+    # find scattered e- in MCParticles
+    isElec   = mcpars["PDG"] == 11
+    isFinal  = mcpars["generatorStatus"] == 1
+    electron = lqe.FindFirst(isElec & isFinal, mcpars["counts"])
+    hasElec  = electron >= 0
+
+    # calculate momentum of scattered electron in
+    # each event, and broadcast to reco particles
+    pele = np.ones(len(electron))
+    pele[hasElec] = lqe.GetMagnitude(mcpars)[electron[hasElec]]
+    pele = np.repeat(pele, recpars["counts"])
+    keep = np.repeat(hasElec, recpars["counts"])
+
+    # and now compute resolution
+    ptag = lqe.GetMagnitude(recpars)
+    pres = (ptag[keep] - pele[keep]) / pele[keep]
+    return pres
+
+class GlobalResolution:
+    """GlobalResolution
+
+    A class to accumulate momentum residuals of
+    particles reconstructed by the Low-Q2 tagger(s)
+    one chunk of events at a time, and to extract
+    the resolution once all chunks are processed.
+    """
+
+    def __init__(self):
+        """default constructor
+
+        Sets up the residual histogram and
+        the collections to read.
+        """
+        self.collections = Collections
+
+        # create histogram from extracting resolution
+        self.hres = lqe.Histogram(50, -2., 3.)
+
+    def Process(self, chunk):
+        """Process
+
+        Fills residuals from a chunk of events.
+
+        Args:
+          chunk: chunk of events from the event engine
+        """
+        self.hres.Fill(CalculateResiduals(chunk))
+
+    def GetPartial(self):
+        """GetPartial
+
+        Returns the residuals accumulated so
+        far, to be merged with other shards.
+
+        Returns:
+          dictionary of arrays
+        """
+        return self.hres.GetPartial()
+
+    def AddPartial(self, partial):
+        """AddPartial
+
+        Merges residuals accumulated on
+        another shard.
+
+        Args:
+          partial: dictionary of arrays from GetPartial
+        """
+        self.hres.AddPartial(partial)
+
+    def Finish(self, ofile = None):
+        """Finish
+
+        Extracts the resolution, and saves the
+        histogram, fit and text output if an
+        output file is provided.
+
+        Args:
+          ofile: output file name (None to only extract the resolution)
+        Returns:
+          dictionary of calculated resolution ("value"), its
+          error ("error"), and the mean and its error ("mean",
+          "mean_error")
+        """
+
+        # fit spectrum with a gaussian to extract peak 
+        hres = self.hres.MakeROOT("hMomRes", ";(p_{rec} - p_{sim}^{e}) / p_{sim}^{e}")
+        fres = ROOT.TF1("fMomRes", "gaus(0)", -0.5, 0.5)
+        fres.SetParameter(0, hres.Integral())
+        fres.SetParameter(1, hres.GetMean())
+        fres.SetParameter(2, hres.GetRMS())
+        hres.Fit(fres, "r")
+
+        # save objects
+        if ofile is not None:
+            with ROOT.TFile(ofile, "recreate") as out:
+                out.WriteObject(hres, "hMomRes")
+                out.WriteObject(fres, "fMomRes")
+                out.Close()
+
+        # grab objective and other info
+        reso = fres.GetParameter(2)
+        eres = fres.GetParError(2)
+        mean = fres.GetParameter(1)
+        emea = fres.GetParError(1)
+
+        # write them out to a text file for extraction later
+        if ofile is not None:
+            otext = ofile.replace(".root", ".txt")
+            with open(otext, 'w') as out:
+                out.write(f"{reso}\n")
+                out.write(f"{eres}\n")
+                out.write(f"{mean}\n")
+                out.write(f"{emea}")
+
+        # and return calculated resolution and other info
+        return {
+            "value"      : float(reso),
+            "error"      : float(eres),
+            "mean"       : float(mean),
+            "mean_error" : float(emea)
+        }
 
 def CalculateMomReso(
     ifile = IFileDefault, 
-    ofile = OFileDefault
+    ofile = OFileDefault,
+    chunk = ChunkDefault
 ):
     """CalculateMomReso
 
@@ -34,83 +185,14 @@ def CalculateMomReso(
     Args:
       ifile: input file name
       ofile: output file name
+      chunk: no. of events to process at a time
     Returns:
       calculated resolution
     """
-
-    # set up histograms, etc. -------------------------------------------------
-
-    # create histogram from extracting resolution
-    hres = ROOT.TH1D("hMomRes", ";(p_{rec} - p_{sim}^{e}) / p_{sim}^{e}", 50, -2., 3.)
-    hres.Sumw2()
-
-    # event loop --------------------------------------------------------------
-
-    # loop through all events
-    reader = get_reader(ifile)
-    for iframe, frame in enumerate(reader.get("events")):
-
-        # grab relevant collections
-        mcpars  = frame.get("MCParticles")
-        recpars = frame.get("TaggerTrackerReconstructedParticles")
-
-        # find scattered e- in MCParticles
-        electron = None
-        for par in mcpars:
-            isElec  = par.getPDG() == 11
-            isFinal = par.getGeneratorStatus() == 1
-            if isElec and isFinal:
-                electron = par
-                break
-
-        # calculate momentum of scattered electron
-        pele2 = electron.getMomentum().x**2 + electron.getMomentum().y**2 + electron.getMomentum().z**2
-        pele  = np.sqrt(pele2)
-
-        # now compare against reconstructed particles
-        for par in recpars:
-
-            # calculate momentum of reconstructed particle
-            ptag2 = par.getMomentum().x**2 + par.getMomentum().y**2 + par.getMomentum().z**2
-            ptag  = np.sqrt(ptag2)
-
-            # and now compute resolution
-            pres = (ptag - pele) / pele
-            hres.Fill(pres)
-
-    # resolution calculation --------------------------------------------------
-
-    # fit spectrum with a gaussian to extract peak 
-    fres = ROOT.TF1("fMomRes", "gaus(0)", -0.5, 0.5)
-    fres.SetParameter(0, hres.Integral())
-    fres.SetParameter(1, hres.GetMean())
-    fres.SetParameter(2, hres.GetRMS())
-    hres.Fit(fres, "r")
-
-    # wrap up script ----------------------------------------------------------
-
-    # save objects
-    with ROOT.TFile(ofile, "recreate") as out:
-        out.WriteObject(hres, "hMomRes")
-        out.WriteObject(fres, "fMomRes")
-        out.Close()
-
-    # grab objective and other info
-    reso = fres.GetParameter(2)
-    eres = fres.GetParError(2)
-    mean = fres.GetParameter(1)
-    emea = fres.GetParError(1)
-
-    # write them out to a text file for extraction later
-    otext = ofile.replace(".root", ".txt")
-    with open(otext, 'w') as out:
-        out.write(f"{reso}\n")
-        out.write(f"{eres}\n")
-        out.write(f"{mean}\n")
-        out.write(f"{emea}")
-
-    # and return calculated resolution
-    return fres.GetParameter(2)
+    analysis = GlobalResolution()
+    for data in lqe.IterateChunks({"rec" : ifile}, analysis.collections, chunk):
+        analysis.Process(data)
+    return analysis.Finish(ofile)["value"]
 
 # main ========================================================================
 
@@ -136,11 +218,20 @@ if __name__ == "__main__":
         default = OFileDefault,
         type = str
     )
+    parser.add_argument(
+        "-c",
+        "--chunk",
+        help = "No. of events to process at a time",
+        nargs = '?',
+        const = ChunkDefault,
+        default = ChunkDefault,
+        type = int
+    )
 
     # grab arguments
     args = parser.parse_args()
 
     # run analysis
-    CalculateMomReso(args.input, args.output)
+    CalculateMomReso(args.input, args.output, args.chunk)
 
 # end =========================================================================
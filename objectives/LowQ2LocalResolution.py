@@ -8,10 +8,12 @@
 #    specified tagger
 #
 #  Usage if executed directly:
-#    ./LowQ2RecoResolution.py \
-#        -i <input file> \
+#    ./LowQ2LocalResolution.py \
+#        -s <sim file> \
+#        -r <reco file> \
 #        -o <output file> \
-#        -t <tagger>
+#        -t <tagger> \
+#        [-c <chunk size>]
 # =============================================================================
 
 import argparse as ap
@@ -19,19 +21,201 @@ import numpy as np
 import ROOT
 import sys
 
-from podio.reading import get_reader
+try:
+    from objectives import LowQ2EventEngine as lqe
+except ImportError:
+    import LowQ2EventEngine as lqe
 
 # default arguments
-ISimDefault = "../backward.e10ele.edm4hep.root"
-IRecDefault = "../backward.e10ele.edm4eic.root"
-OutDefault  = "test_local_reso.root"
-TagDefault  = 1
+ISimDefault  = "../backward.e10ele.edm4hep.root"
+IRecDefault  = "../backward.e10ele.edm4eic.root"
+OutDefault   = "test_local_reso.root"
+TagDefault   = 1
+ChunkDefault = lqe.ChunkDefault
+
+# local track collection for each tagger
+TrackCollections = {
+    1 : "TaggerTrackerM1LocalTracks",
+    2 : "TaggerTrackerM2LocalTracks"
+}
+
+def GetCollections(tag):
+    """GetCollections
+
+    Returns the collections needed from each
+    input for a specified tagger.
+
+    Args:
+      tag: tagger to use
+    Returns:
+      dictionary of inputs and collections to read
+    """
+    if tag not in TrackCollections:
+        raise ValueError("Unkown tagger specified!")
+    return {
+        "sim" : ["BackwardsBeamlineHits"],
+        "rec" : [TrackCollections[tag]]
+    }
+
+def CalculateResiduals(chunk, tag):
+    """CalculateResiduals
+
+    Calculates 1 - the dot product of the unit vectors
+    of every tagger track and the e- leaving the beamline
+    magnets in a chunk of events. Events without exactly
+    5 beamline hits are skipped.
+
+    Args:
+      chunk: chunk of events from the event engine
+      tag:   tagger to use
+    Returns:
+      array of residuals
+    """
+
+    # grab relevant collections
+    maghits = chunk["sim"]["BackwardsBeamlineHits"]
+    tagtrks = chunk["rec"][TrackCollections[tag]]
+
+    # select e- leaving beamline magnets (the 5th
+    # hit) in events with exactly 5 hits
+    hasMag = maghits["counts"] == 5
+    emag   = lqe.GetOffsets(maghits["counts"])[hasMag] + 4
+
+    # compute unit vector for beamline momentum, and
+    # broadcast to tagger tracks
+    umag = np.ones((len(hasMag), 3))
+    umag[hasMag] = lqe.GetUnitVectors(maghits)[emag]
+    umag = np.repeat(umag, tagtrks["counts"], axis = 0)
+    keep = np.repeat(hasMag, tagtrks["counts"])
+
+    # compute resolution as 1 - dot product of unit vectors
+    utag = lqe.GetUnitVectors(tagtrks)
+    pres = 1.0 - lqe.Dot(umag[keep], utag[keep])
+    return pres
+
+class LocalResolution:
+    """LocalResolution
+
+    A class to accumulate residuals between the
+    local tracks of a specified tagger and the e-
+    leaving the beamline magnets one chunk of
+    events at a time, and to extract the
+    resolution once all chunks are processed.
+    """
+
+    def __init__(self, tag = TagDefault):
+        """constructor accepting arguments
+
+        Args:
+          tag: tagger to use
+        """
+        self.tag         = tag
+        self.collections = GetCollections(tag)
+
+        # create histogram from extracting resolution
+        self.hres = lqe.Histogram(100, 0, 1e-6)
+
+    def Process(self, chunk):
+        """Process
+
+        Fills residuals from a chunk of events.
+
+        Args:
+          chunk: chunk of events from the event engine
+        """
+        self.hres.Fill(CalculateResiduals(chunk, self.tag))
+
+    def GetPartial(self):
+        """GetPartial
+
+        Returns the residuals accumulated so
+        far, to be merged with other shards.
+
+        Returns:
+          dictionary of arrays
+        """
+        return self.hres.GetPartial()
+
+    def AddPartial(self, partial):
+        """AddPartial
+
+        Merges residuals accumulated on
+        another shard.
+
+        Args:
+          partial: dictionary of arrays from GetPartial
+        """
+        self.hres.AddPartial(partial)
+
+    def Finish(self, ofile = None):
+        """Finish
+
+        Extracts the resolution, and saves the
+        histogram, fit and text output if an
+        output file is provided.
+
+        Args:
+          ofile: output file name (None to only extract the resolution)
+        Returns:
+          dictionary of calculated resolution ("value"), its
+          error ("error"), and the mean and its error ("mean",
+          "mean_error")
+        """
+
+        # set axis title accordingly 
+        axis = ";(p_{tag" + f"{self.tag}" + "} - p^{e}_{mag}) / p^{e}_{mag}"
+
+        # fit spectrum with a gaussian to extract peak 
+        hres = self.hres.MakeROOT("hMomRes", axis)
+        fres = ROOT.TF1("fMomRes", "gaus(0)", 0, 1e-6)
+        fres.SetParameter(0, hres.Integral())
+        fres.SetParameter(1, hres.GetMean())
+        fres.SetParameter(2, hres.GetRMS())
+        hres.Fit(fres, "r")
+
+        # save objects
+        if ofile is not None:
+            with ROOT.TFile(ofile, "recreate") as out:
+                out.WriteObject(hres, "hMomRes")
+                out.WriteObject(fres, "fMomRes")
+                out.Close()
+
+        # grab objective and other info
+        #   - FIXME the local track momenta is *very* different from
+        #     the electron momentum, so just use abs value of mean
+        #     and RMS of %-diff for now
+        #reso = fres.GetParameter(2)
+        #eres = fres.GetParError(2)
+        #mean = fres.GetParameter(1)
+        #emea = fres.GetParError(1)
+        reso = hres.GetRMS()
+        eres = hres.GetRMSError()
+        mean = np.abs(hres.GetMean())
+        emea = np.abs(hres.GetMeanError())
+
+        # write them out to a text file for extraction later
+        if ofile is not None:
+            otext = ofile.replace(".root", ".txt")
+            with open(otext, 'w') as out:
+                out.write(f"{reso}\n")
+                out.write(f"{eres}\n")
+                out.write(f"{mean}\n")
+                out.write(f"{emea}")
+
+        # and return calculated resolution and other info
+        return {
+            "value"      : float(reso),
+            "error"      : float(eres),
+            "mean"       : float(mean),
+            "mean_error" : float(emea)
+        }
 
 def CalculateMomReso(
     sfile = ISimDefault,
     rfile = IRecDefault,
     ofile = OutDefault,
-    tag = TagDefault
+    tag = TagDefault,
+    chunk = ChunkDefault
 ):
     """CalculateMomReso
 
@@ -43,115 +227,15 @@ def CalculateMomReso(
       rfile: input rec file name
       ofile: output file name
       tag:   tagger to use
+      chunk: no. of events to process at a time
     Returns:
       calculated resolution
     """
-
-    # set up histograms, etc. -------------------------------------------------
-
-    # set axis title accordingly 
-    axis = ";(p_{tag" + f"{tag}" + "} - p^{e}_{mag}) / p^{e}_{mag}"
-
-    # create histogram from extracting resolution
-    hres = ROOT.TH1D("hMomRes", axis, 100, 0, 1e-6)
-    hres.Sumw2()
-
-    # event loop --------------------------------------------------------------
-
-    # open inputs with podio readers
-    sreader  = get_reader(sfile)
-    rreader  = get_reader(rfile)
-    nsframes = len(sreader.get("events"))
-    nrframes = len(rreader.get("events"))
-    if nsframes != nrframes:
-        raise RuntimeError(f"The no. of sim frames ({nsframes}) isn't the same as the no. of reco frames ({nrframes})!")
-        return
-
-    # iterate through frames
-    sframes = sreader.get("events")
-    rframes = rreader.get("events")
-    for iframe in range(nsframes):
-
-        # grab sim and reco frames
-        sframe = sframes[iframe]
-        rframe = rframes[iframe]
-
-        # grab relevant collections
-        maghits = sframe.get("BackwardsBeamlineHits")
-        tagtrks = None
-        match tag:
-            case 1:
-                tagtrks = rframe.get("TaggerTrackerM1LocalTracks")
-            case 2:
-                tagtrks = rframe.get("TaggerTrackerM2LocalTracks")
-            case _:
-                raise ValueError("Unkown tagger specified!")
-
-        # calculate momentum of e- leaving beamline magnets
-        if len(maghits) != 5:
-            continue
-        emag  = maghits[4]
-        pmag2 = emag.getMomentum().x**2 + emag.getMomentum().y**2 + emag.getMomentum().z**2
-        pmag  = np.sqrt(pmag2)
-        
-        # compute unit vector for beamline momentum
-        umag = np.array([emag.getMomentum().x, emag.getMomentum().y, emag.getMomentum().z]) / pmag
-
-        # now compare against tagger hits
-        for trk in tagtrks:
-
-            # calculate momentum of tagger track
-            ptag2 = trk.getMomentum().x**2 + trk.getMomentum().y**2 + trk.getMomentum().z**2
-            ptag  = np.sqrt(ptag2)
-            
-            # compute unit vector for tagger momentum
-            utag = np.array([trk.getMomentum().x, trk.getMomentum().y, trk.getMomentum().z]) / ptag
-
-            # compute resolution as 1 - dot product of unit vectors
-            dot_product = np.dot(umag, utag)
-            pres = 1.0 - dot_product
-            hres.Fill(pres)
-
-    # resolution calculation --------------------------------------------------
-
-    # fit spectrum with a gaussian to extract peak 
-    fres = ROOT.TF1("fMomRes", "gaus(0)", 0, 1e-6)
-    fres.SetParameter(0, hres.Integral())
-    fres.SetParameter(1, hres.GetMean())
-    fres.SetParameter(2, hres.GetRMS())
-    hres.Fit(fres, "r")
-
-    # wrap up script ----------------------------------------------------------
-
-    # save objects
-    with ROOT.TFile(ofile, "recreate") as out:
-        out.WriteObject(hres, "hMomRes")
-        out.WriteObject(fres, "fMomRes")
-        out.Close()
-
-    # grab objective and other info
-    #   - FIXME the local track momenta is *very* different from
-    #     the electron momentum, so just use abs value of mean
-    #     and RMS of %-diff for now
-    #reso = fres.GetParameter(2)
-    #eres = fres.GetParError(2)
-    #mean = fres.GetParameter(1)
-    #emea = fres.GetParError(1)
-    reso = hres.GetRMS()
-    eres = hres.GetRMSError()
-    mean = np.abs(hres.GetMean())
-    emea = np.abs(hres.GetMeanError())
-
-    # write them out to a text file for extraction later
-    otext = ofile.replace(".root", ".txt")
-    with open(otext, 'w') as out:
-        out.write(f"{reso}\n")
-        out.write(f"{eres}\n")
-        out.write(f"{mean}\n")
-        out.write(f"{emea}")
-
-    # and return calculated resolution
-    return reso
+    analysis = LocalResolution(tag)
+    inputs   = {"sim" : sfile, "rec" : rfile}
+    for data in lqe.IterateChunks(inputs, analysis.collections, chunk):
+        analysis.Process(data)
+    return analysis.Finish(ofile)["value"]
 
 # main ========================================================================
 
@@ -195,11 +279,20 @@ if __name__ == "__main__":
         default = TagDefault,
         type = int
     )
+    parser.add_argument(
+        "-c",
+        "--chunk",
+        help = "No. of events to process at a time",
+        nargs = '?',
+        const = ChunkDefault,
+        default = ChunkDefault,
+        type = int
+    )
 
     # grab arguments
     args = parser.parse_args()
 
     # run analysis
-    CalculateMomReso(args.sim, args.reco, args.output, args.tagger)
+    CalculateMomReso(args.sim, args.reco, args.output, args.tagger, args.chunk)
 
 # end =========================================================================
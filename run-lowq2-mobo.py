@@ -10,18 +10,292 @@
 import argparse
 import os
 import pickle
+import threading
 
 from ax.generation_strategy.generation_node import GenerationStep
 from ax.generation_strategy.generation_strategy import GenerationStrategy
 from ax.modelbridge.registry import Generators
 from ax.service.ax_client import AxClient
 from ax.service.utils.report_utils import exp_to_df
+from ax.storage.botorch_modular_registry import register_acquisition_function
+from botorch.acquisition.multi_objective.hypervolume_knowledge_gradient import (
+    qMultiFidelityHypervolumeKnowledgeGradient
+)
 from scheduler import AxScheduler, JobLibRunner, SlurmRunner
 
 import AID2ETestTools as att
 import EICMOBOTestTools as emt
 import interfaces as itf
 
+def SeedExperiment(ax_client, trials, fidelity = None):
+    """SeedExperiment
+
+    Attaches previously evaluated trials
+    to an experiment, along with their
+    objectives. If running multi-fidelity,
+    trials run without a fidelity are
+    attached at full fidelity. Attached
+    trials are marked as seeded in their
+    run metadata, so they don't count
+    towards the trials to run.
+
+    Args:
+      ax_client: the ax client running the experiment
+      trials:    list of tuples of parameters and objectives
+      fidelity:  optional ax-compliant fidelity parameter
+    Returns:
+      no. of trials attached
+    """
+    nSeeded = 0
+    for params, objectives in trials:
+        if fidelity is not None:
+            params = {fidelity["name"] : fidelity["target_value"], **params}
+        try:
+            params, index = ax_client.attach_trial(
+                parameters   = params,
+                run_metadata = {"seeded" : True}
+            )
+        except Exception as error:
+            print(f"WARNING: couldn't attach earlier trial {params} ({error})")
+            continue
+        ax_client.complete_trial(trial_index = index, raw_data = objectives)
+        nSeeded += 1
+    return nSeeded
+
+def MakeGenerationStrategy(cfg_exp, fidelity = None, n_seeded = 0):
+    """MakeGenerationStrategy
+
+    Defines the generation strategy to use:
+    Sobol trials, followed by BO. Earlier
+    trials which were attached replace Sobol
+    trials. If running multi-fidelity, BO uses
+    a cost-aware multi-fidelity acquisition
+    function, where the cost of a trial is
+    linear in its no. of events (so by default
+    the intercept is the cost of the lowest
+    fidelity relative to the range).
+
+    Args:
+      cfg_exp:  dictionary of problem options
+      fidelity: optional ax-compliant fidelity parameter
+      n_seeded: no. of earlier trials attached
+    Returns:
+      generation strategy
+    """
+    n_sobol = max(cfg_exp["n_sobol"] - n_seeded, 0)
+    steps   = list()
+    if n_sobol > 0:
+        steps.append(
+            GenerationStep(
+                model = Generators.SOBOL,
+                num_trials = n_sobol,
+                min_trials_observed = min(cfg_exp["min_sobol"], n_sobol),
+                max_parallelism = n_sobol
+            )
+        )
+
+    bo_kwargs = dict()
+    if fidelity is not None:
+        lower, upper = fidelity["bounds"]
+        bo_kwargs = {
+            "botorch_acqf_class"  : qMultiFidelityHypervolumeKnowledgeGradient,
+            "acquisition_options" : {
+                "cost_intercept" : cfg_exp["fidelity"].get("cost_intercept", lower / (upper - lower))
+            }
+        }
+    steps.append(
+        GenerationStep(
+            model = Generators.BOTORCH_MODULAR,
+            num_trials = -1,
+            max_parallelism = cfg_exp["max_parallel_gen"],
+            model_kwargs = bo_kwargs
+        )
+    )
+    return GenerationStrategy(steps = steps)
+
+def SaveExperiment(ax_client, path_base):
+    """SaveExperiment
+
+    Saves the experiment (as CSV and JSON) and the
+    model of the generation strategy (as a pickle).
+    Each file is written under a temporary name and
+    then moved into place, so a crash mid-write never
+    leaves a corrupted file behind.
+
+    Args:
+      ax_client: the ax client running the experiment
+      path_base: path and prefix of the output files
+    """
+
+    # grab experiment and generation strategy
+    # for output
+    exp   = ax_client._experiment
+    gen   = ax_client._generation_strategy
+    dfExp = exp_to_df(exp)
+
+    # save outcomes and experiment
+    # for downstream analysis
+    dfExp.to_csv(path_base + "_exp_out.csv.tmp")
+    ax_client.save_to_json_file(path_base + "_exp_out.json.tmp")
+    with open(path_base + "_gen_out.pkl.tmp", 'wb') as file:
+        pickle.dump(gen.model, file)
+    for suffix in ["_exp_out.csv", "_exp_out.json", "_gen_out.pkl"]:
+        os.replace(path_base + suffix + ".tmp", path_base + suffix)
+
+class SavingAxClient(AxClient):
+    """SavingAxClient
+
+    An ax client which saves the experiment (see
+    SaveExperiment) each time a trial finishes,
+    from the same call the scheduler uses to finish
+    it. Calls which change the experiment hold one
+    lock, so it's never saved half-updated.
+
+    Trials queued with Redeploy are handed out to the
+    scheduler before any new ones are generated, so
+    that they're run through the configured runner.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """constructor accepting arguments
+
+        Args:
+          args:   any arguments of AxClient
+          kwargs: any keyword arguments of AxClient
+        """
+        super().__init__(*args, **kwargs)
+        self.lock     = threading.RLock()
+        self.pathBase = None
+        self.queued   = list()
+
+    def SaveTo(self, path_base):
+        """SaveTo
+
+        Saves the experiment, and saves it again
+        each time a trial finishes from then on.
+
+        Args:
+          path_base: path and prefix of the output files
+        """
+        with self.lock:
+            self.pathBase = path_base
+            SaveExperiment(self, path_base)
+
+    def Redeploy(self, trial_index):
+        """Redeploy
+
+        Queues a running trial to be handed out
+        to the scheduler (again).
+
+        Args:
+          trial_index: index of the trial
+        """
+        with self.lock:
+            self.queued.append(trial_index)
+
+    def __Save(self):
+        """Save
+
+        Saves the experiment, if a path was set
+        (see SaveTo).
+        """
+        if self.pathBase is None:
+            return
+        try:
+            SaveExperiment(self, self.pathBase)
+        except Exception as error:
+            print(f"WARNING: couldn't save experiment, will try again when the next trial finishes ({error})")
+
+    def get_next_trial(self, *args, **kwargs):
+        with self.lock:
+            if self.queued:
+                index = self.queued.pop(0)
+                return self.get_trial_parameters(index), index
+            return super().get_next_trial(*args, **kwargs)
+
+    def get_next_trials(self, max_trials, *args, **kwargs):
+        with self.lock:
+            trials = dict()
+            while self.queued and len(trials) < max_trials:
+                index = self.queued.pop(0)
+                trials[index] = self.get_trial_parameters(index)
+            if len(trials) == max_trials:
+                return trials, False
+            more, complete = super().get_next_trials(max_trials - len(trials), *args, **kwargs)
+            return {**trials, **more}, complete
+
+    def attach_trial(self, *args, **kwargs):
+        with self.lock:
+            return super().attach_trial(*args, **kwargs)
+
+    def complete_trial(self, *args, **kwargs):
+        with self.lock:
+            super().complete_trial(*args, **kwargs)
+            self.__Save()
+
+    def log_trial_failure(self, *args, **kwargs):
+        with self.lock:
+            super().log_trial_failure(*args, **kwargs)
+            self.__Save()
+
+    def abandon_trial(self, *args, **kwargs):
+        with self.lock:
+            super().abandon_trial(*args, **kwargs)
+            self.__Save()
+
+def ResumeTrials(ax_client, memo):
+    """ResumeTrials
+
+    Finishes the trials of a reloaded experiment which
+    were left unfinished. Deployed trials whose result
+    has since been stored (trials are memoized) are
+    completed with it. The rest are attached again with
+    the same parameters and queued to be deployed through
+    the configured runner before any new trials, so a
+    trial which is still running (e.g. as a Slurm job)
+    is waited for through the memo, and one which died
+    picks up the stages it completed. Trials which can't
+    be attached again, and trials which were never
+    deployed, are abandoned.
+
+    Args:
+      ax_client: the ax client running the experiment (see SavingAxClient)
+      memo:      memo of completed trials (see TrialMemo)
+    Returns:
+      tuple of the no. of trials completed from the memo
+      and the no. of trials queued to be deployed again
+    """
+    nDone   = 0
+    nQueued = 0
+    for trial in list(ax_client._experiment.trials.values()):
+        if trial.status.is_candidate:
+            ax_client.abandon_trial(trial_index = trial.index, reason = "not deployed before resuming")
+        if not trial.status.is_deployed:
+            continue
+
+        # complete trials which have finished
+        params     = trial.arm.parameters
+        objectives = memo.Lookup(memo.MakeKey(memo.Quantize(params)))
+        if objectives is not None:
+            ax_client.complete_trial(trial_index = trial.index, raw_data = objectives)
+            nDone += 1
+            continue
+
+        # and attach the rest again to be deployed
+        ax_client.abandon_trial(trial_index = trial.index, reason = "unfinished when resuming")
+        try:
+            params, index = ax_client.attach_trial(
+                parameters   = params,
+                run_metadata = {"resumed" : trial.index}
+            )
+        except Exception as error:
+            print(f"WARNING: couldn't attach unfinished trial {trial.index} again ({error})")
+            continue
+        ax_client.Redeploy(index)
+        nQueued += 1
+    print(f"Completed {nDone} unfinished trials from earlier results, queued {nQueued} to be deployed again")
+    return nDone, nQueued
+
 def main(*args, **kwargs):
     """main
 
@@ -38,13 +312,37 @@ def main(*args, **kwargs):
       slurm  -- use slurm runner
       panda  -- use panda runner (TODO)
 
+    Unless the -f option is given, the
+    experiment is warm started with any
+    earlier trials with compatible
+    parameters and objectives, replacing
+    as many Sobol trials.
+
+    The experiment is saved every time a
+    trial finishes (see SavingAxClient). If
+    the -c option is given, a saved
+    experiment is reloaded and continued
+    instead of starting a new one.
+
+    If running nested (the "nested" options
+    of the problem config), the experiment
+    only optimizes the "sim" parameters, and
+    each trial tunes its own "rec" parameters
+    on its cached simulation output (see
+    interfaces.RunNestedObjectives). Nested
+    experiments aren't warm started.
+
     Args:
       -r: specify runner (optional)
+      -f: start fresh, without earlier trials (optional)
+      -c: resume saved experiment (optional)
     """
 
     # set up arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("-r", "--runner", help = "Runner type", nargs = '?', const = 1, type = str, default = "joblib")
+    parser.add_argument("-f", "--fresh", help = "Don't warm start from earlier trials", action = "store_true")
+    parser.add_argument("-c", "--resume", help = "Resume saved experiment", action = "store_true")
 
     # grab arguments
     args = parser.parse_args()    
@@ -65,39 +363,68 @@ def main(*args, **kwargs):
     cfg_par = emt.ReadJsonFile(par_path)
     cfg_obj = emt.ReadJsonFile(obj_path)
 
+    # if running nested, reconstruction parameters
+    # are tuned within each trial
+    nested    = cfg_exp.get("nested", dict()).get("enabled", False)
+    objective = itf.RunNestedObjectives if nested else itf.RunObjectives
+
     # translate parameter, objective options
     # into ax-compliant ones
-    ax_pars, ax_par_cons = att.ConvertParamConfig(cfg_par)
+    ax_pars, ax_par_cons = att.ConvertParamConfig(cfg_par, ["sim"] if nested else None)
     ax_objs, ax_obj_cons = att.ConvertObjectConfig(cfg_obj)
 
-    # define generation strategy to use
-    gstrat = GenerationStrategy(
-        steps = [
-            GenerationStep(
-                model = Generators.SOBOL,
-                num_trials = cfg_exp["n_sobol"],
-                min_trials_observed = cfg_exp["min_sobol"],
-                max_parallelism = cfg_exp["n_sobol"]
-            ),
-            GenerationStep(
-                model = Generators.BOTORCH_MODULAR,
-                num_trials = -1,
-                max_parallelism = cfg_exp["max_parallel_gen"]
-            )
-        ]
-    )
+    # if running multi-fidelity, the no. of events
+    # to simulate is added as a fidelity parameter
+    ax_fid = att.ConvertFidelityConfig(cfg_exp)
+    if ax_fid is not None:
+        ax_pars.append(ax_fid)
+        register_acquisition_function(qMultiFidelityHypervolumeKnowledgeGradient)
 
-    # create ax client
-    ax_client = AxClient(
-        generation_strategy = gstrat,
-        enforce_sequential_optimization = False
-    )
-    ax_client.create_experiment(
-        name = cfg_exp["problem_name"],
-        parameters = ax_pars,
-        objectives = ax_objs,
-        parameter_constraints = ax_par_cons
-    )
+    # create paths to output files
+    oPathBase = cfg_exp["OUTPUT_DIR"] + "/" + cfg_exp["problem_name"]
+    oPathJson = oPathBase + "_exp_out.json"
+
+    # if resuming, reload saved experiment (and its
+    # generation strategy) and finish any trials
+    # left unfinished
+    if args.resume and not os.path.isfile(oPathJson):
+        print(f"WARNING: no saved experiment found at {oPathJson}, starting a new one")
+    if args.resume and os.path.isfile(oPathJson):
+        print(f"Resuming experiment saved in {oPathJson}")
+        ax_client = SavingAxClient.load_from_json_file(oPathJson)
+        ResumeTrials(ax_client, emt.TrialMemo(run_path, par_path, obj_path))
+    else:
+        # look up earlier trials to warm start with
+        seeds = list()
+        if not args.fresh and not nested:
+            store = emt.TrialStore(run_path, par_path, obj_path)
+            seeds = store.GetCompatible()
+            print(f"Found {len(seeds)} earlier trials to warm start with")
+
+        # create ax client
+        ax_client = SavingAxClient(
+            generation_strategy = MakeGenerationStrategy(cfg_exp, ax_fid),
+            enforce_sequential_optimization = False
+        )
+        ax_client.create_experiment(
+            name = cfg_exp["problem_name"],
+            parameters = ax_pars,
+            objectives = ax_objs,
+            parameter_constraints = ax_par_cons
+        )
+
+        # attach earlier trials before any trial is
+        # generated, and only let the ones which were
+        # attached replace Sobol trials
+        n_seeded = SeedExperiment(ax_client, seeds, ax_fid)
+        if n_seeded > 0:
+            print(f"Attached {n_seeded} of {len(seeds)} earlier trials")
+            ax_client._generation_strategy = MakeGenerationStrategy(cfg_exp, ax_fid, n_seeded)
+
+    # save starting point of experiment, and
+    # save it again as trials finish
+    emt.MakeDir(cfg_exp["OUTPUT_DIR"])
+    ax_client.SaveTo(oPathBase)
 
     # extract scheduler-specific options
     cfg_sched = cfg_run["scheduler_opts"]
@@ -113,11 +440,14 @@ def main(*args, **kwargs):
                 }
             )
         case "slurm":
+            # request what a trial's stages need
+            # when packed onto its cores
+            cores, memory = emt.ResourceModel(run_path).GetTrialRequest()
             runner = SlurmRunner(
                 partition     = cfg_sched["partition"],
                 time_limit    = cfg_sched["time_limit"],
-                memory        = cfg_sched["memory"],
-                cpus_per_task = cfg_sched["cpus_per_task"],
+                memory        = memory,
+                cpus_per_task = cores,
                 config        = {
                     'sbatch_options' : {
                         'account'   : cfg_sched["account"],
@@ -139,30 +469,26 @@ def main(*args, **kwargs):
             'job_output_dir' : cfg_exp["OUTPUT_DIR"],
         }
     )
-    scheduler.set_objective_function(itf.RunObjectives)
-
-    # run and report best parameters
-    best = scheduler.run_optimization(max_trials = cfg_exp["n_max_trials"])
-    print("Optimization complete! Best parameters:\n", best)
+    scheduler.set_objective_function(objective)
 
-    # create paths to output files
-    oPathBase = cfg_exp["OUTPUT_DIR"] + "/" + cfg_exp["problem_name"]
-    oPathCSV  = oPathBase + "_exp_out.csv"
-    oPathJson = oPathBase + "_exp_out.json"
-    oPathPikl = oPathBase + "_gen_out.pkl"
-
-    # grab experiment and generation strategy
-    # for output
-    exp   = ax_client._experiment
-    gen   = ax_client._generation_strategy
-    dfExp = exp_to_df(exp)
+    # run only as many trials as are left (not
+    # counting trials seeded from earlier ones)
+    n_done = sum(
+        trial.status.is_terminal
+        and not trial.status.is_abandoned
+        and not trial.run_metadata.get("seeded", False)
+        for trial in ax_client._experiment.trials.values()
+    )
 
-    # save outcomes and experiment
-    # for downstream analysis
-    dfExp.to_csv(oPathCSV)
-    ax_client.save_to_json_file(oPathJson)
-    with open(oPathPikl, 'wb') as file:
-        pickle.dump(gen.model, file)
+    # run and report best parameters
+    try:
+        best = scheduler.run_optimization(max_trials = max(cfg_exp["n_max_trials"] - n_done, 0))
+        print("Optimization complete! Best parameters:\n", best)
+    finally:
+        # save outcomes and experiment
+        # for downstream analysis
+        with ax_client.lock:
+            SaveExperiment(ax_client, oPathBase)
 
 if __name__ == "__main__":
    main()
@@ -0,0 +1,92 @@
+# =============================================================================
+## @file   summarize-stages.py
+#  @author Derek Anderson
+#  @date   10.17.2026
+# -----------------------------------------------------------------------------
+## @brief Summarize the time and resources used by
+#    each kind of stage across the trials of a
+#    campaign.
+# =============================================================================
+
+import argparse
+import glob
+import json
+import sys
+
+import EICMOBOTestTools as emt
+
+def FormatBytes(nBytes):
+    """FormatBytes
+
+    Formats a no. of bytes in
+    human-readable units.
+
+    Args:
+      nBytes: no. of bytes
+    Returns:
+      formatted string
+    """
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(nBytes) < 1024:
+            return f"{nBytes:.1f} {unit}"
+        nBytes /= 1024
+    return f"{nBytes:.1f} TB"
+
+# main ========================================================================
+
+if __name__ == "__main__":
+
+    # set up arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-r",
+        "--run",
+        help = "Runtime configuration file",
+        nargs = "?",
+        const = "configuration/run.config",
+        default = "configuration/run.config",
+        type = str
+    )
+    parser.add_argument(
+        "-p",
+        "--pattern",
+        help = "Glob pattern of trial records (default: all trials under the output path)",
+        type = str
+    )
+    parser.add_argument(
+        "-j",
+        "--json",
+        help = "Write summary as JSON to this file",
+        type = str
+    )
+
+    # find records of every trial
+    args    = parser.parse_args()
+    pattern = args.pattern
+    if pattern is None:
+        cfgRun  = emt.ReadJsonFile(args.run)
+        pattern = cfgRun["out_path"] + "/*/*" + emt.GetSuffix("time")
+    files = sorted(glob.glob(pattern))
+    if not files:
+        print(f"WARNING: no trial records match {pattern}")
+        sys.exit(1)
+
+    # aggregate and report
+    summary = emt.AggregateRecords(files)
+    print(f"INFO: summarized {len(files)} trials")
+    print(f"  {'stage':<8} {'runs':>6} {'failed':>6} {'wall [s]':>10} {'mean wall':>10} {'cpu [s]':>10} {'mean cpu':>10} {'max rss':>10} {'read':>10} {'written':>10}")
+    for kind, agg in sorted(summary.items(), key = lambda item : item[1]["wall"], reverse = True):
+        print(
+            f"  {kind:<8} {agg['runs']:>6} {agg['failed']:>6}"
+            f" {agg['wall']:>10.1f} {agg['mean_wall']:>10.1f}"
+            f" {agg['cpu']:>10.1f} {agg['mean_cpu']:>10.1f}"
+            f" {FormatBytes(agg['max_rss']):>10}"
+            f" {FormatBytes(agg['read_bytes']):>10}"
+            f" {FormatBytes(agg['write_bytes']):>10}"
+        )
+
+    if args.json is not None:
+        with open(args.json, 'w') as out:
+            json.dump({"trials" : len(files), "stages" : summary}, out, indent = 4)
+
+# end =========================================================================
@@ -9,8 +9,12 @@
 #  TODO convert to use pytest
 # =============================================================================
 
+import concurrent.futures as cf
+import os
 import pprint
+import subprocess
 import sys
+import tempfile
 sys.path.append('../')
 
 import EICMOBOTestTools as emt
@@ -67,7 +71,7 @@ print(f"[1][test A] set values of tagger 1 layer 1 z, tagger 1 height, tagger 2
 # config file unmodified
 configA = geditor.EditConfig(tag1H, "test1A")
 configA = geditor.EditConfig(tag2W, "test1A")
-print(f"[1][Test A] config file {configA} created")
+print(f"[1][Test A] config file {configA} created in overlay")
 
 # grab/make additional parameters for
 # next test
@@ -110,6 +114,36 @@ geditor.EditRelatedFiles(tag2Z, "test1B")
 geditor.EditRelatedFiles(bicLG, "test1B")
 print(f"[1][test B] recursively edited all files associated with tagger 2 height and BIC light guide")
 
+# check the index used to find related files
+index1 = geditor.GetIncludeIndex()
+print(f"[1][Test B] indexed includes of {len(index1)} files, far backward definitions included by:")
+pprint.pprint([file for file, entry in index1.items() if any(target == tag2H["compact"] for ref, target in entry["includes"])])
+
+# apply several edits at once, with one
+# write per compact file
+geditor.EditCompacts([(tag1H, 148.5), (tag2W, 155.3), (tag2Z, 110.1), (bicLG, 6.0)], "test1C")
+print(f"[1][Test C] set tagger 1 height, tagger 2 width, tagger 2 layer 2 z, and BIC light guide length in one batch")
+
+# in a small tree where a.xml includes the edited
+# b.xml by relative path and c.xml includes a.xml by
+# absolute path, c.xml should be pointed to the
+# overlay's a.xml
+tree1D = tempfile.mkdtemp()
+with open(tree1D + "/b.xml", 'w') as xml:
+    xml.write("<lccdd><define><constant name='B_Z' value='1.0*mm'/></define></lccdd>\n")
+with open(tree1D + "/a.xml", 'w') as xml:
+    xml.write('<lccdd><include ref="b.xml"/></lccdd>\n')
+with open(tree1D + "/c.xml", 'w') as xml:
+    xml.write(f'<lccdd><include ref="{tree1D}/a.xml"/></lccdd>\n')
+with open(tree1D + "/run.config", 'w') as cfg:
+    cfg.write(f'{{"run_path" : "{tempfile.mkdtemp()}", "det_path" : "{tree1D}", "det_config" : "c"}}')
+param1D = {"element" : "value", "path" : ".//constant[@name='B_Z']", "units" : "mm", "compact" : "b.xml"}
+geditor1D = emt.GeometryEditor(tree1D + "/run.config")
+geditor1D.EditCompacts([(param1D, 2.0)], "test1D")
+geditor1D.EditRelatedFiles(param1D, "test1D")
+with open(geditor1D.GetOverlayPath("test1D") + "/c.xml", 'r') as xml:
+    print(f"[1][Test D] edited file included through a relative include, c.xml in overlay is now:\n  {xml.read().strip()}")
+
 # (2) Test generators  --------------------------------------------------------
 
 # create a sim generator and parse enviroment
@@ -138,20 +172,54 @@ print(f"[2][Test B] created driver scripts for simulation:")
 print(f"  {runsimA}")
 print(f"  {runsimB}")
 
+# split the steering file into shards, and create
+# a command to simulate one of them
+nevtC  = simgen.GetNEvents(inputs["location"], "backward.e18ele.py", inputs["type"])
+shards = simgen.MakeShards(nevtC, 4)
+dosimC = simgen.MakeCommand("test2C", intest, inputs["location"], "backward.e18ele.py", inputs["type"], shards[1])
+print(f"[2][Test C] Split {nevtC} events into shards {shards}, and created command to simulate shard 1:")
+print(f"  {dosimC}")
+
+# the same simulation in two trials should have the
+# same key in the simulation cache
+simcac = emt.SimCache("../configuration/run.config")
+simkyA = simcac.MakeKey("test2A", "geo", {}, dosimA, inputs["location"], "backward.e10ele.py")
+simkyB = simcac.MakeKey("test2B", "geo", {}, dosimB, inputs["location"], "backward.e10ele.py")
+print(f"[2][Test C] Keys of the same simulation in two trials match: {simkyA == simkyB}")
+
+# stage a local stand-in for a remote input file: the
+# second time, the cached copy should be reused
+stager = emt.InputStager("../configuration/run.config")
+standI = tempfile.NamedTemporaryFile(suffix = ".hepmc3.tree.root", delete = False).name
+with open(standI, 'w') as standin:
+    standin.write("stand-in for remote input\n")
+stagdA = stager.Stage(standI)
+stagdB = stager.Stage(standI)
+dosimI = simgen.MakeCommand("test2I", "pythia6", enviro["sim_input"]["pythia6"]["location"], "pythia6.nc18x275q0to1.py", "hepmc", shards[1], None, [stagdA])
+print(f"[2][Test C] Staged {standI} into {stagdA} (reused = {stagdA == stagdB}), and created command to simulate shard 1 of it:")
+print(f"  {dosimI}")
+
+# making the command to stage a steering file's remote
+# input shouldn't fetch anything
+stagpI = enviro["sim_input"]["pythia6"]["location"]
+stagcI, stagfI = stager.MakeStageCommand(stagpI, "pythia6.nc18x275q0to1.py")
+print(f"[2][Test C] Created command to stage remote input (fetched = {any(os.path.exists(stagf) for stagf in stagfI)}):")
+print(f"  {stagcI}")
+
 # create a rec generator
 recgen = emt.RecGenerator("../configuration/run.config")
 
 # try to create a reco command
 dorecA = recgen.MakeCommand("test2A", intest, "backward.e10ele.py")
 dorecB = recgen.MakeCommand("test2B", intest, "backward.e10ele.py")
-print(f"[2][Test C] Created commands to do reconstruction:")
+print(f"[2][Test D] Created commands to do reconstruction:")
 print(f"  {dorecA}")
 print(f"  {dorecB}")
 
 # and now try to create a reconstruction driver script
 runrecA = recgen.MakeScript("test2A", intest, "backward.e10ele.py", conFileA, dorecA)
 runrecB = recgen.MakeScript("test2B", intest, "backward.e10ele.py", conFileA, dorecB)
-print(f"[2][Test D] Created driver scripts for reconstruction:")
+print(f"[2][Test E] Created driver scripts for reconstruction:")
 print(f"  {runrecA}")
 print(f"  {runrecB}")
 
@@ -173,7 +241,7 @@ recDirB = enviro["out_path"] + "/test2B/" + recOutB
 # try to create an analysis command
 doanaA, ofileA = anagen.MakeCommand("test2A", intest, "TaggerOneResolution", simDirA, recDirA)
 doanaB, ofileB = anagen.MakeCommand("test2B", intest, "TaggerOneResolution", simDirB, recDirB)
-print(f"[2][Test E] Created commands to do analysis")
+print(f"[2][Test F] Created commands to do analysis")
 print(f"  (A) command = {doanaA}")
 print(f"      output  = {ofileA}")
 print(f"  (B) command = {doanaB}")
@@ -182,7 +250,7 @@ print(f"      output  = {ofileB}")
 # and finally try to create an analysis script
 runanaA = anagen.MakeScript("test2A", intest, "TaggerOneResolution", doanaA)
 runanaB = anagen.MakeScript("test2B", intest, "TaggerOneResolution", doanaB)
-print(f"[2][Test F] Created driver scripts for analysis")
+print(f"[2][Test G] Created driver scripts for analysis")
 print(f"  {runanaA}")
 print(f"  {runanaB}")
 
@@ -209,4 +277,123 @@ print(f"  script  = {dorun3}")
 print(f"  outputs =")
 pprint.pprint(ofiles3)
 
+# and the plan of the trial it runs
+plan3 = triman.MakeTrialPlan(nupar3)
+print(f"[3] Created plan of entire trial, whose stages will run in order:")
+pprint.pprint(plan3["graph"].GetLevels())
+print(f"  skipped inputs = {plan3['skipped']}")
+
+# plan several trials at once from the same
+# manager, which shouldn't share any state
+with cf.ThreadPoolExecutor(max_workers = 3) as pool:
+    plans3 = list(pool.map(
+        lambda i : triman.MakeTrialPlan(
+            {**nupar3, "tagger1_width" : 150.0 + i},
+            tag = f"test3_{i}"
+        ),
+        range(3)
+    ))
+print(f"[3] Planned trials concurrently:")
+for plan in plans3:
+    print(f"  {plan['tag']}: tagger1_width = {plan['params']['tagger1_width']}, {len(plan['graph'].nodes)} stages")
+
+# plan a trial reusing the geometry and simulation
+# of the first one, which should only reconstruct
+# and analyze
+plan3B = triman.MakeTrialPlan(nupar3, tag = "test3B", base = plan3["tag"])
+print(f"[3] Planned trial on top of {plan3['tag']}, checking overlaps = {'geo' in plan3B['graph'].nodes}, stages =")
+pprint.pprint(plan3B["graph"].GetLevels())
+
+# write parameters after the lines of an analysis
+# twice (as when retrying a trial): all 4 lines of
+# the analysis should be kept, followed by the
+# parameters once
+text3 = tempfile.NamedTemporaryFile(suffix = ".txt", delete = False).name
+with open(text3, 'w') as txt:
+    txt.write("0.5\n0.01\n0.2\n0.003")
+triman.WriteParamText(text3, nupar3)
+triman.WriteParamText(text3, nupar3)
+with open(text3, 'r') as txt:
+    lines3 = txt.read().split("\n")
+print(f"[3] Wrote parameters after analysis output twice, analysis lines kept = {lines3[:4] == ['0.5', '0.01', '0.2', '0.003']}, lines =")
+pprint.pprint(lines3)
+
+# look up the resources of each kind of stage,
+# and what a whole trial should request
+resmod = emt.ResourceModel("../configuration/run.config")
+print(f"[3] Looked up resources of stages:")
+for stage in ["sim", "rec", "merge"]:
+    print(f"  {stage}: cores = {resmod.GetCores(stage)}, memory = {resmod.GetMemory(stage)} MB")
+print(f"  flagged command = {resmod.AddFlags('eicrecon input.edm4hep.root', 'rec')}")
+print(f"  trial request   = {resmod.GetTrialRequest()}")
+
+# (4) Test trial graph --------------------------------------------------------
+
+# create a small graph where one branch fails
+graph4 = emt.TrialGraph()
+graph4.AddNode("a", "true")
+graph4.AddNode("b", "false", ["a"])
+graph4.AddNode("c", "true", ["b"])
+graph4.AddNode("d", "true", ["a"])
+
+# run it locally with 2 cores: "c" should be
+# skipped, but "d" should still run
+codes4 = graph4.Run(
+    lambda name, node : subprocess.run(node["command"], shell = True).returncode,
+    2
+)
+print(f"[4] Ran graph of stages, exit codes (None if skipped) =")
+pprint.pprint(codes4)
+
+# now stop a graph of shards early, once
+# two shards are done: shards which haven't
+# started should be left out, but "merge"
+# should still run
+graph4B = emt.TrialGraph()
+for shard in range(4):
+    graph4B.AddNode(f"shard{shard}", "true", stoppable = True)
+graph4B.AddNode("merge", "true", [f"shard{shard}" for shard in range(4)])
+codes4B = graph4B.Run(
+    lambda name, node : subprocess.run(node["command"], shell = True).returncode,
+    1,
+    lambda name, codes : sum(code == 0 for code in codes.values()) >= 2
+)
+print(f"[4] Ran graph of shards with early stopping, exit codes =")
+pprint.pprint(codes4B)
+
+# running a graph without any cores should
+# be refused rather than wait forever
+try:
+    graph4.Run(lambda name, node : 0, 0)
+    print(f"[4] Ran graph with no cores")
+except ValueError as error:
+    print(f"[4] Refused to run graph with no cores: {error}")
+
+# mark a stage as complete: it should be found
+# as long as its output is intact, and not once
+# its output changes
+checkpt4 = emt.StageCheckpoint("../configuration/run.config")
+output4  = tempfile.NamedTemporaryFile(suffix = ".edm4hep.root", delete = False).name
+graph4C  = emt.TrialGraph()
+graph4C.AddNode("sim", "true", outputs = [output4])
+digest4  = checkpt4.Store("test4", "sim", graph4C.nodes["sim"], list(), dict())
+found4A  = checkpt4.Lookup("test4", "sim", graph4C.nodes["sim"], list(), dict())
+with open(output4, 'a') as out:
+    out.write("changed")
+found4B  = checkpt4.Lookup("test4", "sim", graph4C.nodes["sim"], list(), dict())
+print(f"[4] Marked stage complete in {checkpt4.GetMarkerPath('test4', 'sim')}:")
+print(f"  found with intact output = {found4A == digest4}, found with changed output = {found4B is not None}")
+
+# measure a couple of stages and collect
+# them into the record of a trial
+stats4 = tempfile.mkdtemp()
+code4A = emt.MeasureCommand("sleep 1", "sim_test4", stats4 + "/sim_test4.json")
+code4B = emt.MeasureCommand("exit 3", "rec_test4", stats4 + "/rec_test4.json")
+code4C = emt.MeasureCommand("false\ntrue", "geo_test4", stats4 + "/geo_test4.json")
+trial4 = emt.CollectRecords(stats4, stats4 + "/aid2e_test4_time.timing.json", "test4")
+print(f"[4] Measured stages with exit codes {code4A}, {code4B}, {code4C} (multi-line command failing on its 1st line), trial record =")
+pprint.pprint(trial4)
+print(f"[4] Aggregated by kind of stage =")
+pprint.pprint(emt.AggregateRecords([stats4 + "/aid2e_test4_time.timing.json"]))
+
 # end =========================================================================
@@ -9,10 +9,12 @@
 #  TODO convert to use pytest
 # =============================================================================
 
+import os
 import subprocess
 import sys
 sys.path.append('../')
 
+import objectives.LowQ2AnalysisDriver as lqd
 import objectives.LowQ2GlobalResolution as lqg
 import objectives.LowQ2LocalResolution as lql
 
@@ -24,7 +26,7 @@ ifRec = "backward.e10ele.edm4eic.root"
 
 subprocess.run(["../scripts/generate-input.sh", ifSim, ifRec])
 
-# test 0: run objectives ------------------------------------------------------
+# test 1: run objectives ------------------------------------------------------
 
 # output file names for convenience
 ofGloRes  = "test_globa_reso.root"
@@ -43,7 +45,7 @@ print(f"  -- global p resolution   = {glo_reso}")
 print(f"  -- m1 local p resolution = {lo1_reso}")
 print(f"  -- m2 local p resolution = {lo2_reso}")
 
-# test 1: extract objectives --------------------------------------------------
+# test 2: extract objectives --------------------------------------------------
 
 # extract global resolution
 glo_reso_txt = None
@@ -64,4 +66,60 @@ print(f"  -- global p resolution   = {glo_reso_txt}, type = {type(glo_reso_txt)}
 print(f"  -- m1 local p resolution = {lo1_reso_txt}, type = {type(lo1_reso_txt)}")
 print(f"  -- m2 local p resolution = {lo2_reso_txt}, type = {type(lo2_reso_txt)}")
 
+# test 3: run objectives in a single pass ------------------------------------
+
+# output file names for convenience
+ofDrvGlo  = "test_driver_globa_reso.root"
+ofDrvLoc1 = "test_driver_local1_reso.root"
+ofDrvLoc2 = "test_driver_local2_reso.root"
+
+# run all objectives over the same inputs at once
+drv_reso = lqd.RunAnalyses(
+    ifSim,
+    ifRec,
+    {
+        "global" : (lqg.GlobalResolution(), ofDrvGlo),
+        "local1" : (lql.LocalResolution(1), ofDrvLoc1),
+        "local2" : (lql.LocalResolution(2), ofDrvLoc2)
+    }
+)
+
+print(f"[3] Ran objectives in a single pass:")
+print(f"  -- global p resolution   = {drv_reso['global']['value']}, same as [1] = {drv_reso['global']['value'] == glo_reso}")
+print(f"  -- m1 local p resolution = {drv_reso['local1']['value']}, same as [1] = {drv_reso['local1']['value'] == lo1_reso}")
+print(f"  -- m2 local p resolution = {drv_reso['local2']['value']}, same as [1] = {drv_reso['local2']['value'] == lo2_reso}")
+
+# test 4: run objectives map-reduce style -------------------------------------
+
+# output file names for convenience
+ofRedGlo  = "test_reduce_globa_reso.root"
+pfMapGlo  = "test_map{}_globa_reso.npz"
+
+# map the same input twice, and then reduce
+# the partial results
+for imap in range(2):
+    glo_map = lqg.GlobalResolution()
+    nevt    = lqd.ProcessInputs(ifSim, ifRec, [glo_map])
+    lqd.SavePartial(glo_map, pfMapGlo.format(imap), nevt)
+
+red_reso = lqd.ReduceObjectives(
+    {"global" : ofRedGlo},
+    {"global" : pfMapGlo.format("*")},
+    {"global" : {"analysis" : "LowQ2GlobalResolution"}}
+)
+
+print(f"[4] Ran objectives map-reduce style:")
+print(f"  -- global p resolution   = {red_reso['global']['value']}, compare to [1] = {glo_reso}")
+
+# evaluating the same partial results in memory
+# (as when checking a trial between shards)
+# shouldn't write any output
+os.remove(ofRedGlo)
+mid_reso = lqd.EvaluatePartials(
+    {"global" : pfMapGlo.format("*")},
+    {"global" : {"analysis" : "LowQ2GlobalResolution"}}
+)
+print(f"[4] Evaluated partial results in memory:")
+print(f"  -- global p resolution   = {mid_reso['global']['value']}, output written = {os.path.exists(ofRedGlo)}")
+
 # end =========================================================================